@@ -1,13 +1,142 @@
+import time
+STARTED = time.perf_counter()  # Inicio del proceso, antes de importar lo demás, para medir el arranque
 import tkinter as tk
 from tkinter import messagebox, filedialog, ttk
-from PIL import Image, ImageTk
 import os
+import sys
 import sqlite3
 import datetime
-import csv
+import math
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import store_db
+import image_cache
+import sql_trace
+import screen_trace
+
+class DBWorker:
+    # Ejecuta consultas fuera del hilo de Tk con las conexiones de lectura del pool y entrega
+    # los resultados en el hilo de Tk (revisando la cola con root.after). Cada petición lleva
+    # una clave: una petición nueva con la misma clave (otra búsqueda, otro filtro) interrumpe
+    # la anterior y su resultado se descarta.
+    POLL_MS = 30
+    
+    def __init__(self, root, pool, max_workers=3):
+        self.root = root
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mrstore-db")
+        self.results = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.latest = {}  # clave -> número de la petición vigente
+        self.running = {}  # clave -> (número, conexión) de la consulta en curso
+        self.busy = {}  # ventana -> peticiones pendientes
+        self.pending = 0
+    
+    def submit(self, key, query, on_done, on_error=None, busy=None):
+        # query(conexión) corre en otro hilo dentro de una instantánea de lectura;
+        # on_done(resultado) u on_error(excepción) corren después en el hilo de Tk.
+        # busy es la ventana que muestra el cursor de espera mientras tanto.
+        with self.lock:
+            number = self.latest.get(key, 0) + 1
+            self.latest[key] = number
+            self.interrupt(key)
+        
+        self.set_busy(busy, 1)
+        self.pending += 1
+        if self.pending == 1:
+            self.root.after(self.POLL_MS, self.poll)
+        
+        if self.pool.in_memory:
+            # La base en memoria solo puede usarse desde este hilo
+            self.run(key, number, query, on_done, on_error, busy)
+        else:
+            self.executor.submit(self.run, key, number, query, on_done, on_error, busy)
+    
+    def cancel(self, key):
+        with self.lock:
+            self.latest[key] = self.latest.get(key, 0) + 1
+            self.interrupt(key)
+    
+    def interrupt(self, key):
+        # Llamar con self.lock tomado; la conexión sigue registrada solo mientras corre la consulta
+        running = self.running.get(key)
+        if running:
+            running[1].interrupt()
+    
+    def is_current(self, key, number):
+        with self.lock:
+            return self.latest.get(key) == number
+    
+    def run(self, key, number, query, on_done, on_error, busy):
+        result = error = None
+        if self.is_current(key, number):  # No empezar peticiones que ya se reemplazaron
+            try:
+                with self.pool.reader() as connection:
+                    with self.lock:
+                        self.running[key] = (number, connection)
+                    try:
+                        result = query(connection)
+                    finally:
+                        with self.lock:
+                            if self.running.get(key, (None,))[0] == number:
+                                del self.running[key]
+            except Exception as e:
+                error = e
+        self.results.put((key, number, result, error, on_done, on_error, busy))
+    
+    def poll(self):
+        try:
+            while True:
+                try:
+                    key, number, result, error, on_done, on_error, busy = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                
+                self.pending -= 1
+                self.set_busy(busy, -1)
+                if not self.is_current(key, number):
+                    continue  # Petición obsoleta
+                if busy is not None and not busy.winfo_exists():
+                    continue  # La ventana se cerró mientras tanto
+                
+                if error is None:
+                    on_done(result)
+                elif on_error:
+                    on_error(error)
+                else:
+                    messagebox.showerror("Error", f"No se pudo consultar la base de datos: {str(error)}",
+                                         parent=busy)
+        finally:
+            if self.pending:
+                self.root.after(self.POLL_MS, self.poll)
+    
+    def set_busy(self, widget, delta):
+        # Cursor de espera en la ventana mientras tenga peticiones pendientes
+        if widget is None:
+            return
+        name = str(widget)
+        count = self.busy.get(name, 0) + delta
+        if count > 0:
+            self.busy[name] = count
+        else:
+            self.busy.pop(name, None)
+        if widget.winfo_exists():
+            widget.config(cursor="watch" if count > 0 else "")
+    
+    def shutdown(self):
+        with self.lock:
+            for key in list(self.running):
+                self.interrupt(key)
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 class StoreApp:
-    def __init__(self, root):
+    def __init__(self, root, db_path=None):
+        # Arranque hasta que se pinta el inicio de sesión; el tiempo de importación queda
+        # en el tramo "importacion"
+        self.startup = screen_trace.recorder.start("arranque", started=STARTED)
+        self.startup.mark("importacion")
+        
         self.root = root
         self.root.title("Mr Store - Administrador")
         self.root.geometry("1000x700")
@@ -44,6 +173,9 @@ class StoreApp:
                             fieldbackground="#FFFFFF",
                             font=("Arial", 10))
         self.style.map("Treeview", background=[("selected", self.primary_color)])
+        
+        # Listas de productos con miniatura en la primera columna
+        self.style.configure("Thumbs.Treeview", rowheight=40)
 
         self.style.configure("Treeview.Heading", 
                            font=("Arial", 10, "bold"),
@@ -57,62 +189,191 @@ class StoreApp:
         self.style.map("Accent.TButton", 
                      background=[("active", "#E65100")])
         
-        # Configuración de archivos
+        # Configuración de archivos; el fondo se carga después de pintar el inicio de sesión
         self.config_file = "config.txt"
+        self.bg_label = None
+        self.bg_size = None
+        self.bg_resize_job = None
         self.background_path = self.load_background_path()
-        self.set_background(self.background_path)
+        self.startup.mark("ventana")
 
-        # Conexión a la base de datos
-        self.db_connection = sqlite3.connect("mr_store.db")
-        self.db_cursor = self.db_connection.cursor()
-        self.create_tables()
+        # Modo terminal: con MRSTORE_SERVER las ventas, el stock y los cortes pasan por el servidor
+        # de la tienda. store_server (http.client, http.server) solo se importa en ese modo.
+        server_url = os.environ.get("MRSTORE_SERVER")
+        self.store_client = None
+        self.client_errors = (OSError,)
+        if server_url:
+            import store_server
+            self.store_client = store_server.StoreClient(server_url)
+            self.client_errors = (OSError, store_server.StoreServerError)
+
+        # Conexiones a la base de datos: una de escritura y lectores para reportes. Una terminal
+        # solo lee la base: el servidor es el único que escribe en ella y la migra.
+        with self.startup.span("consulta"):
+            self.db_path = db_path or store_db.DB_PATH
+            self.db = store_db.ConnectionPool(self.db_path, readonly=bool(self.store_client))
+            self.db_connection = self.db.writer
+            
+            # Consultas largas en segundo plano para no congelar la interfaz
+            self.db_tasks = DBWorker(self.root, self.db)
+            self.create_tables()
+        
+        # Catálogo de productos y proveedores en memoria
+        self.catalog = store_db.ProductCatalog(self.db_connection)
+        
+        # Miniaturas de productos: PhotoImages recientes en memoria, archivos en image_cache
+        self.thumbnails = image_cache.ThumbnailCache()
 
         # Variables para selección
         self.selected_record = None
         self.selected_table = None
-        self.sale_items = []
+        self.sale_items = store_db.SaleCart()
 
         # Diccionario para rastrear ventanas abiertas
         self.open_windows = {}
+        
+        # Estado de la carga por páginas de cada Treeview de ventas
+        self.lazy_loaders = {}
+        
+        # Panel Agotándose del dashboard; se vuelve a llenar al terminar de recalcular la demanda
+        self.low_tree = None
 
-        # Mostrar la ventana de inicio de sesión
+        # Mostrar la ventana de inicio de sesión; lo demás espera a que se pinte
         self.show_login_window()
+        self.startup.mark("ventana")
+        self.startup.shown(self.open_windows["login"], then=self.finish_startup)
+
+    def finish_startup(self):
+        # Inicialización que no hace falta para el inicio de sesión (la ventana principal está
+        # oculta mientras tanto)
+        print(f"Arranque: {self.startup.total * 1000:.0f} ms hasta el inicio de sesión "
+              f"(importación {self.startup.spans['importacion'] * 1000:.0f} ms, "
+              f"base de datos {self.startup.spans['consulta'] * 1000:.0f} ms)", file=sys.stderr)
+        
+        self.set_background(self.background_path)
+        self.root.bind("<Configure>", self.on_root_resize)
+        self.generate_missing_thumbnails()
+        self.refresh_demand()
 
     def create_tables(self):
-        # Crear las tablas si no existen
-        self.db_cursor.execute("""CREATE TABLE IF NOT EXISTS productos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT,
-            marca TEXT,
-            precio REAL,
-            unidad TEXT,
-            stock INTEGER,
-            imagen TEXT,
-            proveedor_id INTEGER,
-            FOREIGN KEY (proveedor_id) REFERENCES proveedores (id))""")
-        self.db_cursor.execute("""CREATE TABLE IF NOT EXISTS proveedores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT,
-            contacto TEXT)""")
-        self.db_cursor.execute("""CREATE TABLE IF NOT EXISTS ventas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            producto TEXT,
-            cantidad REAL,
-            total REAL,
-            fecha TEXT)""")
-        self.db_cursor.execute("""CREATE TABLE IF NOT EXISTS cortes_de_caja (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fecha TEXT,
-            num_ventas INTEGER,
-            total_ingresos REAL)""")
-        
-        # Agregar la columna proveedor_id si no existe
-        try:
-            self.db_cursor.execute("ALTER TABLE productos ADD COLUMN proveedor_id INTEGER")
-        except sqlite3.OperationalError:
-            pass
+        # Aplicar las migraciones pendientes del esquema (PRAGMA user_version); en modo terminal
+        # ya las aplicó el servidor al arrancar
+        if self.store_client:
+            self.fts_enabled = store_db.table_exists(self.db_connection, "productos_fts")
+        else:
+            self.fts_enabled = store_db.create_tables(self.db_connection)
+
+    def generate_missing_thumbnails(self):
+        # Generar en segundo plano las miniaturas que falten (productos anteriores o imágenes
+        # editadas). Las terminales no escriben en la base: las genera la aplicación del servidor.
+        if self.store_client:
+            return
+        
+        def save(thumbnails):
+            if thumbnails:
+                store_db.set_thumbnails(self.db_connection, thumbnails)
+                self.catalog.invalidate()
+        
+        self.db_tasks.submit(
+            "thumbnails",
+            lambda connection: image_cache.make_thumbnails(store_db.pending_thumbnails(connection)),
+            save, lambda e: None)
+
+    def refresh_demand(self):
+        # Recalcular en segundo plano la venta diaria y el punto de reorden de cada producto
+        # con las ventas recientes (panel Agotándose e inventario). En modo terminal la base es
+        # del servidor: la recalcula store_cli demanda, sin competir con sus escrituras.
+        if self.store_client:
+            return
+        
+        def update(connection):
+            # Se calcula sobre la instantánea de lectura y se guarda desde este mismo hilo con una
+            # conexión de escritura propia (la del programa solo se usa en el hilo de Tk)
+            demand = store_db.compute_demand(connection)
+            if self.db.in_memory:
+                store_db.set_demand(connection, demand)  # DBWorker corre en el hilo de Tk
+                return store_db.low_stock(connection)
+            writer = store_db.connect(self.db_path)
+            try:
+                store_db.set_demand(writer, demand)
+                return store_db.low_stock(writer)  # La instantánea de lectura aún no ve la demanda nueva
+            finally:
+                writer.close()
+        
+        def show(low_products):
+            if self.low_tree is not None and self.low_tree.winfo_exists():
+                self.fill_low_stock(self.low_tree, self.low_stock_groups(low_products))
+        
+        self.db_tasks.submit("demand", update, show, lambda e: None)
 
-        self.db_connection.commit()
+    def low_stock_groups(self, low_products):
+        # (proveedor_id, proveedor) -> filas del panel Agotándose; dos proveedores pueden llamarse igual
+        groups = {}
+        for proveedor_id, proveedor, product_id, nombre, stock, punto, dias, pedido in low_products:
+            groups.setdefault((proveedor_id, proveedor), []).append(
+                (nombre, (stock, f"{punto:.1f}", f"{dias:.1f}", math.ceil(pedido)), "red" if stock <= 0 else ""))
+        return groups
+
+    def fill_low_stock(self, low_tree, groups):
+        low_tree.delete(*low_tree.get_children())
+        for (proveedor_id, proveedor), products in groups.items():
+            parent = low_tree.insert("", "end", text=f"{proveedor or 'Sin proveedor'} ({len(products)})",
+                                     open=True, tags=("provider",))
+            for nombre, values, stock_color in products:
+                low_tree.insert(parent, "end", text=nombre, values=values, tags=(stock_color,))
+        if not groups:
+            low_tree.insert("", "end", text="Ningún producto en su punto de reorden")
+
+    def show_thumbnails_lazily(self, tree, scrollbar):
+        # Poner la miniatura solo a las filas visibles del Treeview (la columna 0 es el ID del
+        # producto) y quitarla de las que dejan de verse, para no decodificar toda la lista
+        shown = {}
+        state = {"job": None}
+        
+        def refresh():
+            state["job"] = None
+            if not tree.winfo_exists():
+                return
+            
+            visible = {}
+            y = 1
+            while y < tree.winfo_height():
+                item = tree.identify_row(y)
+                if not item:
+                    break
+                product = self.catalog.get_product(tree.item(item)["values"][0])
+                if product and product[7]:
+                    visible[item] = product[7]
+                y += 40
+            
+            for item in set(shown) - set(visible):
+                if tree.exists(item):
+                    tree.item(item, image="")
+                del shown[item]
+            for item, digest in visible.items():
+                image = self.thumbnails.get(digest)
+                if image is not None and shown.get(item) != digest:
+                    tree.item(item, image=image)
+                    shown[item] = digest
+        
+        def schedule(*args):
+            if not state["job"]:
+                state["job"] = tree.after_idle(refresh)
+        
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            schedule()
+        
+        tree.configure(yscrollcommand=on_scroll)
+        tree.bind("<Configure>", schedule, add="+")
+
+    def rebuild_rollups_command(self):
+        try:
+            store_db.rebuild_rollups(self.db_connection)
+            messagebox.showinfo("Éxito", "Resúmenes de ventas reconstruidos correctamente.")
+            self.show_dashboard()
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudieron reconstruir los resúmenes: {str(e)}")
 
     def load_background_path(self):
         if os.path.exists(self.config_file):
@@ -124,24 +385,42 @@ class StoreApp:
         with open(self.config_file, "w") as file:
             file.write(image_path)
 
-    def set_background(self, image_path):
+    def set_background(self, image_path, size=(1000, 700)):
+        self.bg_resize_job = None
         if not image_path:
             return
             
         try:
-            image = Image.open(image_path)
-            image = image.resize((1000, 700), Image.LANCZOS)
-            self.bg_image = ImageTk.PhotoImage(image)
-            self.bg_label = tk.Label(self.root, image=self.bg_image)
-            self.bg_label.place(relwidth=1, relheight=1)
+            # Versión redimensionada guardada en disco; solo se genera si no existe
+            rendition = image_cache.background_rendition(image_path, size)
+            self.bg_image = tk.PhotoImage(file=rendition)
+            self.bg_size = size
+            if self.bg_label is None:
+                self.bg_label = tk.Label(self.root, image=self.bg_image)
+                self.bg_label.place(relwidth=1, relheight=1)
+                self.bg_label.lower()
+            else:
+                self.bg_label.config(image=self.bg_image)
         except Exception as e:
             messagebox.showwarning("Error", f"No se pudo cargar la imagen de fondo: {e}")
 
+    def on_root_resize(self, event):
+        # Ajustar el fondo al tamaño de la ventana cuando el usuario deja de redimensionarla.
+        # El tamaño se redondea a múltiplos de 50 px para reutilizar las versiones en caché.
+        if event.widget is not self.root or not self.background_path:
+            return
+        size = (-(-event.width // 50) * 50, -(-event.height // 50) * 50)
+        if size == self.bg_size:
+            return
+        if self.bg_resize_job:
+            self.root.after_cancel(self.bg_resize_job)
+        self.bg_resize_job = self.root.after(300, lambda: self.set_background(self.background_path, size))
+
     def change_background(self):
         file_path = filedialog.askopenfilename(filetypes=[("Imágenes", "*.jpg;*.png;*.jpeg")])
         if file_path:
             self.background_path = file_path
-            self.set_background(self.background_path)
+            self.set_background(self.background_path, self.bg_size or (1000, 700))
             self.save_background_path(self.background_path)
 
     def change_theme(self):
@@ -186,6 +465,7 @@ class StoreApp:
                             activeforeground="white")
         sales_menu.add_command(label="Registrar venta", command=self.register_sale)
         sales_menu.add_command(label="Historial de ventas", command=self.view_sales_history)
+        sales_menu.add_command(label="Análisis de ventas", command=self.view_analysis)
         menu_bar.add_cascade(label="Ventas", menu=sales_menu)
         
         # Menú Configuración
@@ -197,6 +477,8 @@ class StoreApp:
         config_menu.add_separator()
         config_menu.add_command(label="Cambiar tema", command=self.change_theme)
         config_menu.add_command(label="Exportar datos", command=self.export_data)
+        config_menu.add_command(label="Reconstruir resúmenes de ventas", command=self.rebuild_rollups_command)
+        config_menu.add_command(label="Rendimiento", command=self.view_performance)
         menu_bar.add_cascade(label="Configuración", menu=config_menu)
         
         # Menú Corte de Caja
@@ -223,6 +505,8 @@ class StoreApp:
         self.show_dashboard()
 
     def show_dashboard(self):
+        trace = screen_trace.recorder.start("show_dashboard")
+        
         # Limpiar frame principal
         for widget in self.main_frame.winfo_children():
             widget.destroy()
@@ -238,17 +522,13 @@ class StoreApp:
         stats_frame.pack(fill="x", pady=10)
         
         # Obtener datos
-        self.db_cursor.execute("SELECT COUNT(*) FROM productos")
-        total_products = self.db_cursor.fetchone()[0]
-        
-        self.db_cursor.execute("SELECT COUNT(*) FROM proveedores")
-        total_providers = self.db_cursor.fetchone()[0]
-        
-        today = datetime.date.today().strftime("%Y-%m-%d")
-        self.db_cursor.execute("SELECT COUNT(*), SUM(total) FROM ventas WHERE fecha LIKE ?", (today + "%",))
-        sales_today = self.db_cursor.fetchone()
-        total_sales = sales_today[0] if sales_today[0] else 0
-        total_amount = sales_today[1] if sales_today[1] else 0.0
+        trace.mark("ventana")
+        with trace.span("consulta"):
+            total_products = store_db.count_products(self.db_connection)
+            total_providers = store_db.count_providers(self.db_connection)
+            
+            today = datetime.date.today().strftime("%Y-%m-%d")
+            total_sales, total_amount = store_db.get_day_totals(self.db_connection, today)
         
         # Crear tarjetas de estadísticas
         cards_frame = ttk.Frame(stats_frame)
@@ -285,6 +565,38 @@ class StoreApp:
         ttk.Button(btn_frame, text="Nuevo Corte", command=self.nuevo_corte,
                   style="Accent.TButton").grid(row=0, column=3, padx=5, pady=5)
         
+        # Productos en su punto de reorden, agrupados por proveedor para pedir de una vez
+        low_frame = ttk.LabelFrame(self.main_frame, text="Agotándose")
+        low_frame.pack(fill="both", expand=True, pady=10)
+        
+        columns = ("Stock", "Punto de reorden", "Días de cobertura", "Pedir")
+        low_tree = ttk.Treeview(low_frame, columns=columns, show="tree headings", height=6)
+        self.low_tree = low_tree
+        low_tree.heading("#0", text="Proveedor / Producto")
+        low_tree.column("#0", width=250)
+        
+        for col in columns:
+            low_tree.heading(col, text=col)
+            low_tree.column(col, width=100, anchor="center")
+        
+        low_tree.tag_configure("provider", font=("Arial", 10, "bold"))
+        low_tree.tag_configure("red", foreground="red")
+        
+        low_scrollbar = ttk.Scrollbar(low_frame, orient="vertical", command=low_tree.yview)
+        low_tree.configure(yscrollcommand=low_scrollbar.set)
+        low_tree.pack(side="left", fill="both", expand=True, padx=5, pady=5)
+        low_scrollbar.pack(side="right", fill="y")
+        
+        trace.mark("ventana")
+        with trace.span("consulta"):
+            low_products = store_db.low_stock(self.db_connection)
+        
+        with trace.span("conversion"):
+            groups = self.low_stock_groups(low_products)
+        
+        with trace.span("insercion"):
+            self.fill_low_stock(low_tree, groups)
+        
         # Últimas ventas
         sales_frame = ttk.LabelFrame(self.main_frame, text="Últimas Ventas")
         sales_frame.pack(fill="both", expand=True, pady=10)
@@ -303,18 +615,27 @@ class StoreApp:
         self.sales_tree.pack(fill="both", expand=True, padx=5, pady=5)
         
         # Obtener últimas ventas
-        self.db_cursor.execute("SELECT producto, cantidad, total, SUBSTR(fecha,12,8) as hora FROM ventas ORDER BY fecha DESC LIMIT 10")
-        sales = self.db_cursor.fetchall()
+        trace.mark("ventana")
+        with trace.span("consulta"):
+            sales = store_db.latest_sales(self.db_connection, 10)
+        
+        with trace.span("conversion"):
+            rows = [(i, sale[0], sale[1], f"${sale[2]:.2f}", sale[3]) for i, sale in enumerate(sales, start=1)]
         
-        for i, sale in enumerate(sales, start=1):
-            self.sales_tree.insert("", "end", values=(i, sale[0], sale[1], f"${sale[2]:.2f}", sale[3]))
+        with trace.span("insercion"):
+            for values in rows:
+                self.sales_tree.insert("", "end", values=values)
         
         # Configurar scrollbar
         scrollbar = ttk.Scrollbar(sales_frame, orient="vertical", command=self.sales_tree.yview)
         self.sales_tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side="right", fill="y")
+        
+        trace.mark("ventana")
+        trace.shown(self.main_frame)
 
     def show_login_window(self):
+        trace = screen_trace.recorder.start("show_login_window")
         self.close_window("login")
         login_window = tk.Toplevel(self.root)
         login_window.title("Iniciar Sesión - Mr Store")
@@ -355,6 +676,9 @@ class StoreApp:
         password_entry.bind("<Return>", lambda e: self.login(username_entry, password_entry, login_window))
         
         self.root.withdraw()
+        
+        trace.mark("ventana")
+        trace.shown(login_window)
 
     def login(self, username_entry, password_entry, login_window):
         username = username_entry.get()
@@ -399,13 +723,11 @@ class StoreApp:
             {"label": "Precio:", "type": "entry"},
             {"label": "Unidad:", "type": "combobox", "options": ["Piezas", "Kilos"]},
             {"label": "Stock:", "type": "entry"},
-            {"label": "Proveedor:", "type": "combobox", "options": []}
+            {"label": "Proveedor:", "type": "combobox", "options": []},
+            {"label": "Código:", "type": "entry"}
         ]
         
-        self.db_cursor.execute("SELECT id, nombre FROM proveedores")
-        proveedores = self.db_cursor.fetchall()
-        proveedor_options = [f"{row[1]} (ID: {row[0]})" for row in proveedores]
-        fields[5]["options"] = proveedor_options
+        fields[5]["options"] = self.catalog.provider_options()
         
         entries = {}
         for i, field in enumerate(fields):
@@ -436,6 +758,8 @@ class StoreApp:
             if path:
                 self.img_path.set(path)
                 try:
+                    from PIL import Image, ImageTk  # PIL se carga solo al elegir una imagen
+                    
                     img = Image.open(path)
                     img.thumbnail((150, 150))
                     self.img_preview = ImageTk.PhotoImage(img)
@@ -463,16 +787,20 @@ class StoreApp:
                 proveedor_id = int(selected_proveedor.split(" (ID: ")[1][:-1])
                 
                 imagen = self.img_path.get()
+                codigo = entries["código"].get()
                 
-                self.db_cursor.execute(
-                    "INSERT INTO productos (nombre, marca, precio, unidad, stock, imagen, proveedor_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (nombre, marca, precio, unidad, stock, imagen, proveedor_id)
-                )
-                self.db_connection.commit()
+                product_id = store_db.insert_product(self.db_connection, nombre, marca, precio, unidad,
+                                                     stock, imagen, proveedor_id, codigo)
+                if imagen:
+                    # La miniatura se genera una sola vez al dar de alta el producto
+                    store_db.set_thumbnails(self.db_connection, image_cache.make_thumbnails([(product_id, imagen)]))
+                self.catalog.refresh_product(product_id)
                 messagebox.showinfo("Éxito", "Producto guardado correctamente.", parent=win)
                 win.destroy()
             except ValueError as e:
                 messagebox.showerror("Error", f"Datos inválidos: {str(e)}", parent=win)
+            except sqlite3.IntegrityError:
+                messagebox.showerror("Error", "El código ya está asignado a otro producto.", parent=win)
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo guardar el producto: {str(e)}", parent=win)
         
@@ -520,11 +848,8 @@ class StoreApp:
                 return
             
             try:
-                self.db_cursor.execute(
-                    "INSERT INTO proveedores (nombre, contacto) VALUES (?, ?)", 
-                    (nombre, contacto)
-                )
-                self.db_connection.commit()
+                provider_id = store_db.insert_provider(self.db_connection, nombre, contacto)
+                self.catalog.refresh_provider(provider_id)
                 messagebox.showinfo("Éxito", "Proveedor guardado correctamente.", parent=win)
                 win.destroy()
             except Exception as e:
@@ -550,13 +875,25 @@ class StoreApp:
                  font=("Arial", 14, "bold"),
                  foreground=self.primary_color).pack(pady=(0, 10))
         
+        # Campo de escaneo: el lector de códigos escribe el código y envía Enter
+        scan_frame = ttk.Frame(main_frame)
+        scan_frame.pack(fill="x", pady=5)
+        
+        ttk.Label(scan_frame, text="Código:").pack(side="left", padx=5)
+        scan_entry = ttk.Entry(scan_frame, width=25)
+        scan_entry.pack(side="left", padx=5)
+        scan_status = tk.StringVar()
+        ttk.Label(scan_frame, textvariable=scan_status).pack(side="left", padx=10)
+        
         # Frame de productos disponibles
         available_frame = ttk.LabelFrame(main_frame, text="Productos Disponibles")
         available_frame.pack(fill="x", pady=5)
         
         # Treeview para productos
         columns = ("ID", "Nombre", "Marca", "Precio", "Stock", "Unidad")
-        self.products_tree = ttk.Treeview(available_frame, columns=columns, show="headings", height=5)
+        self.products_tree = ttk.Treeview(available_frame, columns=columns, show="tree headings", height=5,
+                                          style="Thumbs.Treeview")
+        self.products_tree.column("#0", width=50, stretch=False)
         
         for col in columns:
             self.products_tree.heading(col, text=col)
@@ -567,20 +904,20 @@ class StoreApp:
         
         # Scrollbar
         scrollbar = ttk.Scrollbar(available_frame, orient="vertical", command=self.products_tree.yview)
-        self.products_tree.configure(yscrollcommand=scrollbar.set)
+        self.show_thumbnails_lazily(self.products_tree, scrollbar)
         self.products_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        # Cargar productos
-        self.db_cursor.execute("SELECT id, nombre, marca, precio, stock, unidad FROM productos ORDER BY nombre")
-        products = self.db_cursor.fetchall()
+        # Traer las ventas de las otras cajas antes de mostrar el stock
+        if self.store_client:
+            try:
+                self.store_client.sync_catalog(self.catalog)
+            except self.client_errors as e:
+                messagebox.showwarning("Advertencia", 
+                                       f"No se pudo sincronizar con el servidor de la tienda: {str(e)}", parent=win)
         
-        # Convertir precios a float
-        converted_products = []
-        for product in products:
-            product = list(product)
-            product[3] = float(product[3])  # Convertir precio a float
-            converted_products.append(product)
+        # Cargar productos desde el catálogo en memoria
+        for product in self.catalog.product_rows():
             self.products_tree.insert("", "end", values=product)
         
         # Frame para agregar producto a la venta
@@ -603,25 +940,45 @@ class StoreApp:
                 messagebox.showerror("Error", "Cantidad inválida.", parent=win)
                 return
             
-            product = self.products_tree.item(selected)["values"]
-            product_id = product[0]
-            
-            # Convertir precio a float
-            precio = float(product[3])
-            
-            existing_qty = sum(item["cantidad"] for item in self.sale_items if item["id"] == product_id)
-            if (existing_qty + qty) > product[4]:
-                messagebox.showerror("Error", "Stock insuficiente considerando cantidades ya agregadas.", parent=win)
+            product_id = self.products_tree.item(selected)["values"][0]
+            error = add_item(product_id, qty)
+            if error:
+                messagebox.showerror("Error", error, parent=win)
+        
+        def add_item(product_id, qty):
+            # Agregar qty del producto a la venta (sumando a su línea si ya está).
+            # Devuelve un mensaje de error o None.
+            product = self.catalog.get_product(product_id)
+            if not product:
+                return "El producto ya no existe."
+            
+            if not math.isfinite(qty) or qty <= 0:
+                return "La cantidad debe ser mayor que cero."
+            
+            if (self.sale_items.quantity(product_id) + qty) > product[4]:
+                return "Stock insuficiente considerando cantidades ya agregadas."
+            
+            self.sale_items.add(product_id, product[1], product[3], product[5], qty)
+            self.update_sale_row(product_id)
+            return None
+        
+        def scan_code(event=None):
+            # Cada lectura agrega una unidad; el mismo código otra vez incrementa la cantidad
+            codigo = scan_entry.get().strip()
+            scan_entry.delete(0, "end")
+            if not codigo:
                 return
             
-            self.sale_items.append({
-                "id": product_id,
-                "nombre": product[1],
-                "precio": precio,
-                "cantidad": qty,
-                "unidad": product[5]
-            })
-            self.update_sale_list()
+            product_id = store_db.find_product_by_code(self.db_connection, codigo)
+            error = add_item(product_id, 1) if product_id is not None else f"Código no encontrado: {codigo}"
+            if error:
+                win.bell()
+                scan_status.set(error)
+            else:
+                scan_status.set(f"Agregado: {self.catalog.get_product(product_id)[1]}")
+        
+        scan_entry.bind("<Return>", scan_code)
+        scan_entry.focus_set()
         
         ttk.Button(add_frame, text="Agregar a Venta", command=add_to_sale,
                   style="Accent.TButton").pack(side="left", padx=10)
@@ -664,9 +1021,9 @@ class StoreApp:
             if not selected:
                 return
             
-            index = int(self.sale_tree.item(selected)["tags"][0])
-            del self.sale_items[index]
-            self.update_sale_list()
+            product_id = int(selected)  # Cada fila usa el id del producto como iid
+            self.sale_items.remove(product_id)
+            self.update_sale_row(product_id)
         
         ttk.Button(btn_frame, text="Eliminar Seleccionado", command=remove_item).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Finalizar Venta", command=self.finalize_sale,
@@ -674,64 +1031,52 @@ class StoreApp:
         ttk.Button(btn_frame, text="Cancelar", command=win.destroy).pack(side="left", padx=5)
         
         # Inicializar lista de productos en la venta
-        self.sale_items = []
-        self.update_sale_list()
+        self.sale_items = store_db.SaleCart()
+        self.total_var.set("Total: $0.00")
 
-    def update_sale_list(self):
-        # Actualizar la lista de productos en la venta
-        self.sale_tree.delete(*self.sale_tree.get_children())
-        total = 0.0
-        
-        for i, item in enumerate(self.sale_items):
-            # CORRECCIÓN APLICADA: Conversión explícita a float
-            precio = float(item["precio"])
-            cantidad = float(item["cantidad"])
-            
-            subtotal = precio * cantidad
-            total += subtotal
-            
-            self.sale_tree.insert("", "end", 
-                                values=(item["nombre"], 
-                                      f"${precio:.2f}", 
-                                      f"{cantidad} {item['unidad']}", 
-                                      f"${subtotal:.2f}"),
-                                tags=(i,))
-        
-        self.total_var.set(f"Total: ${total:.2f}")
+    def update_sale_row(self, product_id):
+        # Actualizar solo la fila del producto que cambió y el total acumulado del carrito
+        iid = str(product_id)
+        item = self.sale_items.get(product_id)
+        
+        if item is None:
+            if self.sale_tree.exists(iid):
+                self.sale_tree.delete(iid)
+        else:
+            precio = item["precio"]
+            cantidad = item["cantidad"]
+            values = (item["nombre"], 
+                      f"${precio:.2f}", 
+                      f"{cantidad} {item['unidad']}", 
+                      f"${precio * cantidad:.2f}")
+            if self.sale_tree.exists(iid):
+                self.sale_tree.item(iid, values=values)
+            else:
+                self.sale_tree.insert("", "end", iid=iid, values=values)
+            self.sale_tree.see(iid)
+        
+        self.total_var.set(f"Total: ${self.sale_items.total:.2f}")
 
     def finalize_sale(self):
         if not self.sale_items:
             messagebox.showwarning("Advertencia", "No hay productos en la venta.")
             return
         
-        # Crear detalle de la venta
-        detalle = []
-        total_cantidad = 0
-        total_venta = 0.0
-        
-        for item in self.sale_items:
-            # CORRECCIÓN APLICADA: Conversión explícita a float
-            precio = float(item["precio"])
-            cantidad = float(item["cantidad"])
-            
-            subtotal = precio * cantidad
-            detalle.append(f"{item['nombre']}: {cantidad} {item['unidad']} - ${subtotal:.2f}")
-            total_cantidad += cantidad
-            total_venta += subtotal
-            
-            # Actualizar stock
-            self.db_cursor.execute("UPDATE productos SET stock = stock - ? WHERE id = ?", 
-                                  (cantidad, item["id"]))
-        
-        detalle_str = "; ".join(detalle)
-        fecha = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Guardar en la base de datos
-        self.db_cursor.execute(
-            "INSERT INTO ventas (producto, cantidad, total, fecha) VALUES (?, ?, ?, ?)",
-            (detalle_str, total_cantidad, total_venta, fecha)
-        )
-        self.db_connection.commit()
+        parent = self.open_windows.get("register_sale")
+        try:
+            if self.store_client:
+                # El servidor registra la venta y devuelve los cambios de stock de todas las cajas
+                total_venta, vendidos = self.store_client.save_sale(self.sale_items, self.catalog)
+            else:
+                total_venta, vendidos = store_db.save_sale(self.db_connection, self.sale_items)
+                self.catalog.adjust_stock(vendidos)
+        except store_db.StockInsuficienteError as e:
+            messagebox.showerror("Stock insuficiente", 
+                                 f"No se registró la venta:\n{str(e)}", parent=parent)
+            return
+        except (sqlite3.Error, *self.client_errors) as e:
+            messagebox.showerror("Error", f"No se pudo registrar la venta: {str(e)}", parent=parent)
+            return
         
         messagebox.showinfo("Éxito", f"Venta registrada por ${total_venta:.2f}")
         self.show_dashboard()  # Actualizar dashboard
@@ -742,6 +1087,7 @@ class StoreApp:
             del self.open_windows["register_sale"]
 
     def view_database(self):
+        trace = screen_trace.recorder.start("view_database", loads=3)
         self.close_window("db_view")
         win = tk.Toplevel(self.root)
         win.title("Base de Datos - Mr Store")
@@ -774,12 +1120,14 @@ class StoreApp:
         self.prod_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        # Cargar productos
-        self.db_cursor.execute("SELECT id, nombre, marca, precio, unidad, stock, proveedor_id FROM productos")
-        products = self.db_cursor.fetchall()
+        # Cargar productos en segundo plano
+        def show_products(products):
+            with trace.span("insercion"):
+                for product in products:
+                    self.prod_tree.insert("", "end", values=product)
+            trace.shown(win)
         
-        for product in products:
-            self.prod_tree.insert("", "end", values=product)
+        self.db_tasks.submit("db_view_products", trace.query(store_db.list_products), show_products, busy=win)
         
         # Pestaña de Proveedores
         prov_frame = ttk.Frame(notebook)
@@ -802,12 +1150,14 @@ class StoreApp:
         self.prov_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        # Cargar proveedores
-        self.db_cursor.execute("SELECT id, nombre, contacto FROM proveedores")
-        providers = self.db_cursor.fetchall()
+        # Cargar proveedores en segundo plano
+        def show_providers(providers):
+            with trace.span("insercion"):
+                for provider in providers:
+                    self.prov_tree.insert("", "end", values=provider)
+            trace.shown(win)
         
-        for provider in providers:
-            self.prov_tree.insert("", "end", values=provider)
+        self.db_tasks.submit("db_view_providers", trace.query(store_db.list_providers), show_providers, busy=win)
         
         # Pestaña de Ventas
         sales_frame = ttk.Frame(notebook)
@@ -830,12 +1180,9 @@ class StoreApp:
         self.sales_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        # Cargar ventas
-        self.db_cursor.execute("SELECT id, producto, cantidad, total, fecha FROM ventas ORDER BY fecha DESC")
-        sales = self.db_cursor.fetchall()
-        
-        for sale in sales:
-            self.sales_tree.insert("", "end", values=sale)
+        # Cargar ventas por páginas
+        self.load_sales_lazily(self.sales_tree, scrollbar, "", "",
+                               lambda sale: (sale[0], sale[3], sale[4], sale[5], sale[6]), trace)
         
         # Botones de acción
         btn_frame = ttk.Frame(win)
@@ -887,40 +1234,48 @@ class StoreApp:
         ttk.Button(btn_frame, text="Editar", command=edit_selected).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Eliminar", command=delete_selected).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Cerrar", command=win.destroy).pack(side="left", padx=5)
+        
+        trace.mark("ventana")
 
     def edit_record(self, table, record, parent_win):
         win = tk.Toplevel(parent_win)
         win.title(f"Editar Registro - {table.capitalize()}")
         win.geometry("400x500")
         
-        self.db_cursor.execute(f"PRAGMA table_info({table})")
-        cols = [col[1] for col in self.db_cursor.fetchall()]
+        cols = store_db.table_columns(self.db_connection, table)
         campos = cols[1:]  # Excluir el ID
         
+        # Leer el registro completo: la lista no muestra todas las columnas (imagen, código)
+        actual = store_db.get_record(self.db_connection, table, record[0]) or {}
+        
         entries = {}
         for i, campo in enumerate(campos):
             ttk.Label(win, text=campo.capitalize() + ":").grid(row=i, column=0, padx=5, pady=5, sticky="e")
             ent = ttk.Entry(win)
             ent.grid(row=i, column=1, padx=5, pady=5, sticky="ew")
-            ent.insert(0, record[i+1])  # +1 para saltar el ID
+            valor = actual.get(campo)
+            ent.insert(0, "" if valor is None else valor)
             entries[campo] = ent
         
         def guardar_cambios():
-            nuevos_valores = [ent.get() for ent in entries.values()]
-            set_clause = ", ".join([f"{campo} = ?" for campo in entries.keys()])
+            nuevos_valores = {campo: ent.get() for campo, ent in entries.items()}
             
             try:
-                self.db_cursor.execute(
-                    f"UPDATE {table} SET {set_clause} WHERE id = ?",
-                    (*nuevos_valores, record[0])
-                )
-                self.db_connection.commit()
+                store_db.update_record(self.db_connection, table, record[0], nuevos_valores)
+                
+                if table == "productos":
+                    self.catalog.refresh_product(record[0])
+                elif table == "proveedores":
+                    self.catalog.refresh_provider(record[0])
+                
                 messagebox.showinfo("Éxito", "Registro actualizado correctamente.", parent=win)
                 win.destroy()
                 
                 if "db_view" in self.open_windows and self.open_windows["db_view"].winfo_exists():
                     self.open_windows["db_view"].destroy()
                     self.view_database()
+            except sqlite3.IntegrityError:
+                messagebox.showerror("Error", "El código ya está asignado a otro producto.", parent=win)
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo actualizar el registro: {str(e)}", parent=win)
         
@@ -932,8 +1287,12 @@ class StoreApp:
             return
         
         try:
-            self.db_cursor.execute(f"DELETE FROM {table} WHERE id = ?", (reg_id,))
-            self.db_connection.commit()
+            store_db.delete_record(self.db_connection, table, reg_id)
+            
+            if table == "productos":
+                self.catalog.remove_product(reg_id)
+            elif table == "proveedores":
+                self.catalog.remove_provider(reg_id)
             messagebox.showinfo("Éxito", "Registro eliminado correctamente.", parent=parent_win)
             
             if "db_view" in self.open_windows and self.open_windows["db_view"].winfo_exists():
@@ -942,35 +1301,238 @@ class StoreApp:
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo eliminar el registro: {str(e)}", parent=parent_win)
 
+    def view_performance(self):
+        trace = screen_trace.recorder.start("view_performance")
+        self.close_window("performance")
+        win = tk.Toplevel(self.root)
+        win.title("Rendimiento - Mr Store")
+        win.geometry("1000x650")
+        self.open_windows["performance"] = win
+        
+        # Frame principal
+        main_frame = ttk.Frame(win)
+        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        ttk.Label(main_frame, text="Sentencias SQL por tiempo total", 
+                 font=("Arial", 14, "bold"),
+                 foreground=self.primary_color).pack(anchor="w")
+        ttk.Label(main_frame,
+                 text=f"Consultas lentas: más de {sql_trace.SLOW_MS:.0f} ms, registradas en {sql_trace.tracer.slow_log or '(registro desactivado)'}").pack(anchor="w", pady=(0, 10))
+        
+        # Notebook (pestañas)
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill="both", expand=True)
+        
+        # Pestaña de sentencias
+        top_frame = ttk.Frame(notebook)
+        notebook.add(top_frame, text="Sentencias")
+        
+        columns = ("Total (ms)", "Llamadas", "Promedio (ms)", "Máximo (ms)", "Filas", "Recorrido completo", "Sentencia")
+        top_tree = ttk.Treeview(top_frame, columns=columns, show="headings")
+        
+        for col in columns:
+            top_tree.heading(col, text=col)
+            top_tree.column(col, width=90, anchor="center")
+        
+        top_tree.column("Recorrido completo", width=130)
+        top_tree.column("Sentencia", width=380, anchor="w")
+        top_tree.tag_configure("scan", foreground="red")
+        
+        scrollbar = ttk.Scrollbar(top_frame, orient="vertical", command=top_tree.yview)
+        top_tree.configure(yscrollcommand=scrollbar.set)
+        top_tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        # Pestaña de consultas lentas
+        slow_frame = ttk.Frame(notebook)
+        notebook.add(slow_frame, text="Consultas lentas")
+        
+        columns = ("Hora", "Duración (ms)", "Filas", "Origen", "Sentencia")
+        slow_tree = ttk.Treeview(slow_frame, columns=columns, show="headings")
+        
+        for col in columns:
+            slow_tree.heading(col, text=col)
+            slow_tree.column(col, width=100, anchor="center")
+        
+        slow_tree.column("Origen", width=250, anchor="w")
+        slow_tree.column("Sentencia", width=380, anchor="w")
+        slow_tree.tag_configure("scan", foreground="red")
+        
+        scrollbar = ttk.Scrollbar(slow_frame, orient="vertical", command=slow_tree.yview)
+        slow_tree.configure(yscrollcommand=scrollbar.set)
+        slow_tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        # Pestaña de pantallas: tiempo de apertura dividido en tramos (promedios en ms)
+        screens_frame = ttk.Frame(notebook)
+        notebook.add(screens_frame, text="Pantallas")
+        
+        columns = ("Pantalla", "Aperturas", "p50 (ms)", "p95 (ms)", "Ventana", "Consulta", "Conversión",
+                   "Inserción", "Pintado", "Otros")
+        screens_tree = ttk.Treeview(screens_frame, columns=columns, show="headings")
+        
+        for col in columns:
+            screens_tree.heading(col, text=col)
+            screens_tree.column(col, width=80, anchor="center")
+        
+        screens_tree.column("Pantalla", width=180, anchor="w")
+        
+        scrollbar = ttk.Scrollbar(screens_frame, orient="vertical", command=screens_tree.yview)
+        screens_tree.configure(yscrollcommand=scrollbar.set)
+        screens_tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        # Texto completo, origen y plan de la fila seleccionada
+        detail_text = tk.Text(main_frame, wrap="word", height=9)
+        detail_text.pack(fill="x", pady=(10, 0))
+        details = {}
+        
+        def show_detail(event):
+            selected = event.widget.focus()
+            if selected not in details:
+                return
+            sql, site, plan = details[selected]
+            detail_text.config(state="normal")
+            detail_text.delete("1.0", "end")
+            detail_text.insert("end", f"{sql}\n\nOrigen: {site}\n\nPlan:\n")
+            for detail in plan or ["(no disponible)"]:
+                detail_text.insert("end", f"  {detail}\n")
+            detail_text.config(state="disabled")
+        
+        top_tree.bind("<<TreeviewSelect>>", show_detail)
+        slow_tree.bind("<<TreeviewSelect>>", show_detail)
+        
+        def refresh():
+            top_tree.delete(*top_tree.get_children())
+            slow_tree.delete(*slow_tree.get_children())
+            screens_tree.delete(*screens_tree.get_children())
+            details.clear()
+            
+            for stats in sql_trace.tracer.top(100):
+                iid = top_tree.insert("", "end", tags=("scan",) if stats.scans else (), values=(
+                    f"{stats.seconds * 1000:.1f}", stats.calls, f"{stats.average_seconds * 1000:.2f}",
+                    f"{stats.max_seconds * 1000:.1f}", stats.rows, ", ".join(stats.scans), stats.sql))
+                details[iid] = (stats.sql, stats.site, stats.plan)
+            
+            for execution, plan in sql_trace.tracer.slow_executions():
+                sql = sql_trace.normalize(execution.sql)
+                iid = slow_tree.insert("", "end", tags=("scan",) if sql_trace.full_scans(plan) else (), values=(
+                    execution.started.strftime("%H:%M:%S"), f"{execution.seconds * 1000:.1f}",
+                    execution.rows, execution.site, sql))
+                details[iid] = (sql, execution.site, plan)
+            
+            for row in screen_trace.recorder.summary():
+                screens_tree.insert("", "end", values=(row[0], row[1], *(f"{value:.1f}" for value in row[2:])))
+        
+        def reset():
+            sql_trace.tracer.reset()
+            screen_trace.recorder.reset()
+            refresh()
+        
+        def export_screens():
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=".csv",
+                filetypes=[("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*")],
+                title="Guardar resumen de pantallas como",
+                parent=win
+            )
+            
+            if not file_path:
+                return
+            
+            try:
+                with open(file_path, "w", newline="", encoding="utf-8") as f:
+                    screen_trace.recorder.write_summary(f)
+                messagebox.showinfo("Éxito", "Resumen de pantallas exportado correctamente.", parent=win)
+            except Exception as e:
+                messagebox.showerror("Error", f"No se pudo exportar el resumen: {str(e)}", parent=win)
+        
+        # Botones
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(fill="x", pady=10)
+        
+        ttk.Button(btn_frame, text="Actualizar", command=refresh).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Reiniciar mediciones", command=reset).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Exportar pantallas", command=export_screens).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=win.destroy).pack(side="right", padx=5)
+        
+        trace.mark("ventana")
+        with trace.span("insercion"):
+            refresh()
+        trace.shown(win)
+
     def nuevo_corte(self):
         today = datetime.date.today().strftime("%Y-%m-%d")
-        self.db_cursor.execute("SELECT * FROM ventas WHERE fecha LIKE ?", (today + "%",))
-        ventas = self.db_cursor.fetchall()
-        total_ingresos = sum(v[3] for v in ventas)
-        num_ventas = len(ventas)
         
-        self.db_cursor.execute("SELECT * FROM cortes_de_caja WHERE fecha = ?", (today,))
-        corte_existente = self.db_cursor.fetchone()
+        corte_existente = store_db.get_corte(self.db_connection, today)
+        if corte_existente and not messagebox.askyesno("Actualizar", "Ya existe un corte de caja para hoy. ¿Desea actualizarlo?"):
+            return
         
-        if corte_existente:
-            if messagebox.askyesno("Actualizar", "Ya existe un corte de caja para hoy. ¿Desea actualizarlo?"):
-                self.db_cursor.execute(
-                    "UPDATE cortes_de_caja SET num_ventas = ?, total_ingresos = ? WHERE fecha = ?",
-                    (num_ventas, total_ingresos, today)
-                )
-                self.db_connection.commit()
-                messagebox.showinfo("Éxito", f"Corte de caja actualizado para {today}.")
+        try:
+            if self.store_client:
+                self.store_client.save_corte(today)
             else:
-                return
+                store_db.save_corte(self.db_connection, today)
+        except (sqlite3.Error, *self.client_errors) as e:
+            messagebox.showerror("Error", f"No se pudo registrar el corte de caja: {str(e)}")
+            return
+        
+        if corte_existente:
+            messagebox.showinfo("Éxito", f"Corte de caja actualizado para {today}.")
         else:
-            self.db_cursor.execute(
-                "INSERT INTO cortes_de_caja (fecha, num_ventas, total_ingresos) VALUES (?, ?, ?)",
-                (today, num_ventas, total_ingresos)
-            )
-            self.db_connection.commit()
             messagebox.showinfo("Éxito", f"Corte de caja registrado para {today}.")
 
+    def load_sales_lazily(self, tree, scrollbar, start_date, end_date, make_values, trace, page_size=200):
+        # Llenar el Treeview de ventas por páginas conforme el usuario se desplaza hacia abajo;
+        # trace mide la primera página como parte de la apertura de la pantalla
+        previous = self.lazy_loaders.get(str(tree))
+        if previous:
+            previous["done"] = True  # Descartar páginas pendientes del filtro anterior
+        state = {"after": None, "done": False, "loading": False}
+        self.lazy_loaders[str(tree)] = state
+        
+        def load_page():
+            if state["done"] or not tree.winfo_exists():
+                state["loading"] = False
+                return
+            
+            state["loading"] = True
+            after = state["after"]
+            self.db_tasks.submit(
+                str(tree),
+                trace.query(lambda connection: store_db.fetch_sales_page(connection, start_date, end_date,
+                                                                         after, page_size)),
+                show_page, busy=tree.winfo_toplevel())
+        
+        def show_page(rows):
+            state["loading"] = False
+            if state["done"]:
+                return
+            
+            with trace.span("conversion"):
+                values = [make_values(row) for row in rows]
+            with trace.span("insercion"):
+                for row_values in values:
+                    tree.insert("", "end", values=row_values)
+            trace.shown(tree)
+            
+            if len(rows) < page_size:
+                state["done"] = True
+            else:
+                state["after"] = (rows[-1][6], rows[-1][0])
+        
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            if float(last) > 0.9 and not state["done"] and not state["loading"]:
+                state["loading"] = True
+                tree.after_idle(load_page)
+        
+        tree.delete(*tree.get_children())
+        tree.configure(yscrollcommand=on_scroll)
+        load_page()
+
     def view_cortes(self):
+        trace = screen_trace.recorder.start("view_cortes")
         self.close_window("view_cortes")
         win = tk.Toplevel(self.root)
         win.title("Historial de Cortes de Caja")
@@ -1006,66 +1568,33 @@ class StoreApp:
             start_date = self.start_date_var.get()
             end_date = self.end_date_var.get()
             
-            query = "SELECT DISTINCT SUBSTR(fecha,1,10) as dia FROM ventas"
-            params = []
-            
-            if start_date or end_date:
-                query += " WHERE"
-                conditions = []
-                
-                if start_date:
-                    conditions.append(" fecha >= ?")
-                    params.append(start_date + " 00:00:00")
-                
-                if end_date:
-                    conditions.append(" fecha <= ?")
-                    params.append(end_date + " 23:59:59")
-                
-                query += " AND".join(conditions)
-            
-            query += " ORDER BY dia DESC"
-            
-            self.db_cursor.execute(query, tuple(params))
-            dias = self.db_cursor.fetchall()
-            
-            # Limpiar frame de resultados
-            for widget in results_frame.winfo_children():
-                widget.destroy()
-            
-            # Mostrar resultados filtrados
-            if not dias:
-                ttk.Label(results_frame, text="No se encontraron resultados").pack(pady=10)
+            try:
+                store_db.date_range_filter(start_date, end_date)
+            except ValueError:
+                messagebox.showerror("Error", "Fecha inválida. Use el formato AAAA-MM-DD.", parent=win)
                 return
             
-            # Encabezados
-            header_frame = ttk.Frame(results_frame)
-            header_frame.pack(fill="x", pady=5)
+            self.db_tasks.submit(
+                "cortes_filter",
+                trace.query(lambda connection: store_db.get_daily_totals(connection, start_date, end_date).fetchall()),
+                show_days, busy=win)
+        
+        def show_days(dias):
+            # Limpiar resultados
+            cortes_tree.delete(*cortes_tree.get_children())
             
-            headers = ["Fecha", "Ventas", "Total Ventas", "Acciones"]
-            for i, header in enumerate(headers):
-                ttk.Label(header_frame, text=header, font=("Arial", 10, "bold"), 
-                         width=20 if i < 3 else 15).pack(side="left", padx=2)
+            with trace.span("conversion"):
+                rows = [(dia, num_ventas, f"${total_ventas or 0.0:.2f}") for dia, num_ventas, total_ventas in dias]
+            with trace.span("insercion"):
+                for values in rows:
+                    cortes_tree.insert("", "end", iid=values[0], values=values)
             
-            # Resultados
-            for d in dias:
-                dia = d[0]
-                row_frame = ttk.Frame(results_frame, relief="solid", borderwidth=1)
-                row_frame.pack(fill="x", pady=2)
-                
-                self.db_cursor.execute(
-                    "SELECT COUNT(*), SUM(total) FROM ventas WHERE fecha LIKE ?", 
-                    (dia + "%",)
-                )
-                result = self.db_cursor.fetchone()
-                num_ventas = result[0] if result[0] else 0
-                total_ventas = result[1] if result[1] else 0.0
-                
-                ttk.Label(row_frame, text=dia, width=20).pack(side="left", padx=2)
-                ttk.Label(row_frame, text=str(num_ventas), width=20).pack(side="left", padx=2)
-                ttk.Label(row_frame, text=f"${total_ventas:.2f}", width=20).pack(side="left", padx=2)
-                
-                ttk.Button(row_frame, text="Detalle", width=10,
-                          command=lambda f=dia: self.ver_detalle_corte(f)).pack(side="left", padx=2)
+            # Mostrar resultados filtrados
+            if cortes_tree.get_children():
+                empty_label.pack_forget()
+            else:
+                empty_label.pack(before=cortes_tree, pady=10)
+            trace.shown(win)
         
         ttk.Button(filter_frame, text="Filtrar", command=apply_filters,
                   style="Accent.TButton").pack(side="left", padx=10)
@@ -1085,67 +1614,21 @@ class StoreApp:
                 return
             
             try:
+                store_db.date_range_filter(start_date, end_date)
+            except ValueError:
+                messagebox.showerror("Error", "Fecha inválida. Use el formato AAAA-MM-DD.", parent=win)
+                return
+            
+            def write_report(connection):
+                # El reporte se escribe en segundo plano conforme se leen los días, en una misma instantánea
                 with open(filename, "w") as f:
-                    f.write("Reporte de Cortes de Caja - Mr Store\n")
-                    f.write("="*50 + "\n\n")
-                    
-                    if start_date or end_date:
-                        f.write(f"Periodo: {start_date if start_date else 'Inicio'} - {end_date if end_date else 'Hoy'}\n\n")
-                    
-                    query = "SELECT DISTINCT SUBSTR(fecha,1,10) as dia FROM ventas"
-                    params = []
-                    
-                    if start_date or end_date:
-                        query += " WHERE"
-                        conditions = []
-                        
-                        if start_date:
-                            conditions.append(" fecha >= ?")
-                            params.append(start_date + " 00:00:00")
-                        
-                        if end_date:
-                            conditions.append(" fecha <= ?")
-                            params.append(end_date + " 23:59:59")
-                        
-                        query += " AND".join(conditions)
-                    
-                    query += " ORDER BY dia DESC"
-                    
-                    self.db_cursor.execute(query, tuple(params))
-                    dias = self.db_cursor.fetchall()
-                    
-                    if not dias:
-                        f.write("No se encontraron resultados para el periodo seleccionado.\n")
-                    else:
-                        total_general = 0
-                        ventas_general = 0
-                        
-                        for d in dias:
-                            dia = d[0]
-                            self.db_cursor.execute(
-                                "SELECT COUNT(*), SUM(total) FROM ventas WHERE fecha LIKE ?", 
-                                (dia + "%",)
-                            )
-                            result = self.db_cursor.fetchone()
-                            num_ventas = result[0] if result[0] else 0
-                            total_ventas = result[1] if result[1] else 0.0
-                            
-                            f.write(f"Fecha: {dia}\n")
-                            f.write(f"Ventas: {num_ventas}\n")
-                            f.write(f"Total: ${total_ventas:.2f}\n")
-                            f.write("-"*50 + "\n")
-                            
-                            total_general += total_ventas
-                            ventas_general += num_ventas
-                        
-                        f.write("\nRESUMEN GENERAL\n")
-                        f.write("-"*50 + "\n")
-                        f.write(f"Total de ventas: {ventas_general}\n")
-                        f.write(f"Ingresos totales: ${total_general:.2f}\n")
-                
-                messagebox.showinfo("Éxito", "Reporte generado correctamente.", parent=win)
-            except Exception as e:
-                messagebox.showerror("Error", f"No se pudo generar el reporte: {str(e)}", parent=win)
+                    store_db.write_cortes_report(connection, f, start_date, end_date)
+            
+            self.db_tasks.submit(
+                "cortes_report", write_report,
+                lambda result: messagebox.showinfo("Éxito", "Reporte generado correctamente.", parent=win),
+                lambda e: messagebox.showerror("Error", f"No se pudo generar el reporte: {str(e)}", parent=win),
+                busy=win)
         
         ttk.Button(filter_frame, text="Generar Reporte", command=generate_report).pack(side="left", padx=5)
         
@@ -1153,17 +1636,49 @@ class StoreApp:
         results_frame = ttk.Frame(main_frame)
         results_frame.pack(fill="both", expand=True, pady=10)
         
+        empty_label = ttk.Label(results_frame, text="No se encontraron resultados")
+        
+        # Treeview para los días (una fila por día en lugar de un Frame con widgets)
+        columns = ("Fecha", "Ventas", "Total Ventas")
+        cortes_tree = ttk.Treeview(results_frame, columns=columns, show="headings")
+        
+        for col in columns:
+            cortes_tree.heading(col, text=col)
+            cortes_tree.column(col, width=150, anchor="center")
+        
+        # Scrollbar
+        scrollbar = ttk.Scrollbar(results_frame, orient="vertical", command=cortes_tree.yview)
+        cortes_tree.configure(yscrollcommand=scrollbar.set)
+        cortes_tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        def show_detail():
+            selected = cortes_tree.focus()
+            if not selected:
+                messagebox.showwarning("Advertencia", "Seleccione un día primero.", parent=win)
+                return
+            self.ver_detalle_corte(selected)
+        
+        cortes_tree.bind("<Double-1>", lambda e: show_detail())
+        
         # Aplicar filtros iniciales (mostrar todo)
         apply_filters()
         
-        # Botón para cerrar
-        ttk.Button(main_frame, text="Cerrar", command=win.destroy).pack(pady=10)
+        # Botones
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(pady=10)
+        
+        ttk.Button(btn_frame, text="Ver Detalle", command=show_detail).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=win.destroy).pack(side="left", padx=5)
         
         # Configurar evento de búsqueda al presionar Enter
         start_entry.bind("<Return>", lambda e: apply_filters())
         end_entry.bind("<Return>", lambda e: apply_filters())
+        
+        trace.mark("ventana")
 
     def ver_detalle_corte(self, fecha):
+        trace = screen_trace.recorder.start("ver_detalle_corte")
         self.close_window(f"detalle_{fecha}")
         win = tk.Toplevel(self.root)
         win.title(f"Detalle de Ventas - {fecha}")
@@ -1197,17 +1712,18 @@ class StoreApp:
         scrollbar.pack(side="right", fill="y")
         
         # Cargar ventas
-        self.db_cursor.execute(
-            "SELECT producto, cantidad, total, SUBSTR(fecha,12,8) as hora " 
-            "FROM ventas WHERE fecha LIKE ? ORDER BY fecha",
-            (fecha + "%",)
-        )
-        ventas = self.db_cursor.fetchall()
+        trace.mark("ventana")
+        with trace.span("consulta"):
+            store_db.refresh_archives(self.db_connection, self.db.readonly)  # El día puede estar en un año recién archivado
+            ventas = store_db.sales_of_day(self.db_connection, fecha)
+        
+        with trace.span("conversion"):
+            rows = [(venta[1], venta[2], venta[3], f"${venta[4]:.2f}") for venta in ventas]
+            total_dia = sum(venta[4] for venta in ventas)
         
-        total_dia = 0.0
-        for venta in ventas:
-            sales_tree.insert("", "end", values=(venta[3], venta[0], venta[1], f"${venta[2]:.2f}"))
-            total_dia += venta[2]
+        with trace.span("insercion"):
+            for values in rows:
+                sales_tree.insert("", "end", values=values)
         
         # Total del día
         total_frame = ttk.Frame(main_frame)
@@ -1218,11 +1734,15 @@ class StoreApp:
         
         # Botón para cerrar
         ttk.Button(main_frame, text="Cerrar", command=win.destroy).pack(pady=10)
+        
+        trace.mark("ventana")
+        trace.shown(win)
 
     def ver_ventas_de_hoy(self):
+        trace = screen_trace.recorder.start("ver_ventas_de_hoy")
         today = datetime.date.today().strftime("%Y-%m-%d")
-        self.db_cursor.execute("SELECT id, producto, total, SUBSTR(fecha,12,8) as hora FROM ventas WHERE fecha LIKE ?", (today + "%",))
-        ventas = self.db_cursor.fetchall()
+        with trace.span("consulta"):
+            ventas = store_db.sales_of_day(self.db_connection, today)
         
         self.close_window("today_sales")
         win = tk.Toplevel(self.root)
@@ -1257,10 +1777,14 @@ class StoreApp:
         scrollbar.pack(side="right", fill="y")
         
         # Cargar ventas
-        total_dia = 0.0
-        for venta in ventas:
-            sales_tree.insert("", "end", values=(venta[0], venta[1], f"${venta[2]:.2f}", venta[3]))
-            total_dia += venta[2]
+        trace.mark("ventana")
+        with trace.span("conversion"):
+            rows = [(venta[0], venta[2], f"${venta[4]:.2f}", venta[1]) for venta in ventas]
+            total_dia = sum(venta[4] for venta in ventas)
+        
+        with trace.span("insercion"):
+            for values in rows:
+                sales_tree.insert("", "end", values=values)
         
         # Total del día
         total_frame = ttk.Frame(main_frame)
@@ -1285,8 +1809,7 @@ class StoreApp:
                 return
             
             try:
-                self.db_cursor.execute("DELETE FROM ventas WHERE id = ?", (sale_id,))
-                self.db_connection.commit()
+                store_db.delete_record(self.db_connection, "ventas", sale_id)
                 
                 messagebox.showinfo("Éxito", "Venta eliminada correctamente.", parent=win)
                 
@@ -1298,8 +1821,12 @@ class StoreApp:
         
         ttk.Button(btn_frame, text="Eliminar Venta", command=delete_sale).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Cerrar", command=win.destroy).pack(side="right", padx=5)
+        
+        trace.mark("ventana")
+        trace.shown(win)
 
     def view_inventory(self):
+        trace = screen_trace.recorder.start("view_inventory")
         self.close_window("inventory")
         win = tk.Toplevel(self.root)
         win.title("Inventario - Mr Store")
@@ -1326,49 +1853,47 @@ class StoreApp:
         search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=30)
         search_entry.pack(side="left", padx=5)
         
+        search_job = {"id": None}
+        
+        reorder_points = {}  # producto_id -> punto de reorden (0 si no se ha vendido)
+        
+        def stock_tag(stock, reorder_point):
+            if stock <= 0:  # Stock agotado
+                return "red"
+            elif stock <= reorder_point:  # Stock en su punto de reorden
+                return "orange"
+            return ""
+        
         def apply_search():
+            # Una búsqueda nueva reemplaza a la que siga en curso
+            search_job["id"] = None
             search_term = self.search_var.get()
-            self.inventory_tree.delete(*self.inventory_tree.get_children())
-            
-            if search_term:
-                query = """
-                    SELECT p.id, p.nombre, p.marca, p.precio, p.unidad, p.stock, pr.nombre 
-                    FROM productos p 
-                    LEFT JOIN proveedores pr ON p.proveedor_id = pr.id 
-                    WHERE p.nombre LIKE ? OR p.marca LIKE ? OR pr.nombre LIKE ?
-                    ORDER BY p.nombre
-                """
-                params = (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%")
-            else:
-                query = """
-                    SELECT p.id, p.nombre, p.marca, p.precio, p.unidad, p.stock, pr.nombre 
-                    FROM productos p 
-                    LEFT JOIN proveedores pr ON p.proveedor_id = pr.id 
-                    ORDER BY p.nombre
-                """
-                params = ()
-            
-            self.db_cursor.execute(query, params)
-            productos = self.db_cursor.fetchall()
-            
-            for prod in productos:
-                stock_color = ""
-                if prod[5] <= 0:  # Stock agotado
-                    stock_color = "red"
-                elif prod[5] < 10:  # Stock bajo
-                    stock_color = "orange"
-                
-                values = (prod[0], prod[1], prod[2], f"${prod[3]:.2f}", 
-                          prod[4], prod[5], prod[6] if prod[6] else "N/A")
-                
-                self.inventory_tree.insert("", "end", values=values, tags=(stock_color,))
+            self.db_tasks.submit(
+                "inventory_search",
+                trace.query(lambda connection: store_db.search_products(connection, search_term, self.fts_enabled)),
+                show_results, busy=win)
+        
+        def show_results(productos):
+            with trace.span("conversion"):
+                rows = [((prod[0], prod[1], prod[2], f"${prod[3]:.2f}", 
+                          prod[4], prod[5], prod[6] if prod[6] else "N/A"), stock_tag(prod[5], prod[7]))
+                        for prod in productos]
+                reorder_points.update((prod[0], prod[7]) for prod in productos)
+            
+            with trace.span("insercion"):
+                self.inventory_tree.delete(*self.inventory_tree.get_children())
+                for values, stock_color in rows:
+                    self.inventory_tree.insert("", "end", values=values, tags=(stock_color,))
+            trace.shown(win)
         
         ttk.Button(search_frame, text="Buscar", command=apply_search,
                   style="Accent.TButton").pack(side="left", padx=5)
         
         # Treeview para inventario
         columns = ("ID", "Nombre", "Marca", "Precio", "Unidad", "Stock", "Proveedor")
-        self.inventory_tree = ttk.Treeview(main_frame, columns=columns, show="headings")
+        self.inventory_tree = ttk.Treeview(main_frame, columns=columns, show="tree headings",
+                                           style="Thumbs.Treeview")
+        self.inventory_tree.column("#0", width=50, stretch=False)
         
         for col in columns:
             self.inventory_tree.heading(col, text=col)
@@ -1384,7 +1909,7 @@ class StoreApp:
         
         # Scrollbar
         scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.inventory_tree.yview)
-        self.inventory_tree.configure(yscrollcommand=scrollbar.set)
+        self.show_thumbnails_lazily(self.inventory_tree, scrollbar)
         self.inventory_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
@@ -1416,28 +1941,77 @@ class StoreApp:
             def save_stock():
                 try:
                     new_stock = int(stock_entry.get())
-                    self.db_cursor.execute(
-                        "UPDATE productos SET stock = ? WHERE id = ?",
-                        (new_stock, product_id)
-                    )
-                    self.db_connection.commit()
+                    if self.store_client:
+                        self.store_client.update_stock(product_id, new_stock, self.catalog)
+                    else:
+                        store_db.update_stock(self.db_connection, product_id, new_stock)
+                        self.catalog.set_stock(product_id, new_stock)
                     messagebox.showinfo("Éxito", "Stock actualizado correctamente.", parent=update_win)
                     update_win.destroy()
-                    apply_search()  # Refrescar la vista
+                    
+                    # Actualizar solo la fila editada
+                    if self.inventory_tree.exists(selected):
+                        values = list(self.inventory_tree.item(selected)["values"])
+                        values[5] = new_stock
+                        self.inventory_tree.item(selected, values=values, tags=(stock_tag(new_stock, reorder_points.get(product_id, 0)),))
                 except ValueError:
                     messagebox.showerror("Error", "Ingrese un valor numérico válido.", parent=update_win)
+                except self.client_errors as e:
+                    messagebox.showerror("Error", f"No se pudo actualizar el stock: {str(e)}", parent=update_win)
             
             ttk.Button(update_win, text="Guardar", command=save_stock,
                       style="Accent.TButton").pack(pady=10)
         
+        def show_product_sales():
+            selected = self.inventory_tree.focus()
+            if not selected:
+                messagebox.showwarning("Advertencia", "Seleccione un producto primero.", parent=win)
+                return
+            
+            product_id, nombre = self.inventory_tree.item(selected)["values"][:2]
+            month_start = datetime.date.today().replace(day=1).strftime("%Y-%m-%d")
+            
+            def show_totals(totals):
+                cantidad, ingresos = totals
+                messagebox.showinfo("Ventas del Mes", 
+                                    f"{nombre}\nCantidad vendida: {cantidad:g}\nIngresos: ${ingresos:.2f}",
+                                    parent=win)
+            
+            self.db_tasks.submit(
+                "product_sales",
+                lambda connection: store_db.get_product_sales(connection, product_id, month_start),
+                show_totals, busy=win)
+        
         ttk.Button(btn_frame, text="Actualizar Stock", command=update_stock).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Ventas del Mes", command=show_product_sales).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Exportar", command=self.export_data).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Cerrar", command=win.destroy).pack(side="right", padx=5)
         
+        # Buscar mientras se escribe, esperando una pausa para no consultar en cada tecla
+        def schedule_search(*args):
+            if search_job["id"]:
+                win.after_cancel(search_job["id"])
+            search_job["id"] = win.after(250, apply_search)
+        
+        def stop_search(event):
+            if event.widget is not win:
+                return
+            if search_job["id"]:
+                win.after_cancel(search_job["id"])
+            self.db_tasks.cancel("inventory_search")
+            search_var.trace_remove("write", trace_id)
+        
+        search_var = self.search_var
+        trace_id = search_var.trace_add("write", schedule_search)
+        win.bind("<Destroy>", stop_search)
+        
         # Configurar evento de búsqueda al presionar Enter
         search_entry.bind("<Return>", lambda e: apply_search())
+        
+        trace.mark("ventana")
 
     def view_providers(self):
+        trace = screen_trace.recorder.start("view_providers")
         self.close_window("providers")
         win = tk.Toplevel(self.root)
         win.title("Lista de Proveedores - Mr Store")
@@ -1478,20 +2052,14 @@ class StoreApp:
         self.providers_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        # Cargar proveedores
-        self.db_cursor.execute("SELECT id, nombre, contacto FROM proveedores ORDER BY nombre")
-        providers = self.db_cursor.fetchall()
+        # Cargar proveedores con su número de productos en segundo plano
+        def show_providers(providers):
+            with trace.span("insercion"):
+                for prov in providers:
+                    self.providers_tree.insert("", "end", values=prov)
+            trace.shown(win)
         
-        for prov in providers:
-            # Contar productos por proveedor
-            self.db_cursor.execute(
-                "SELECT COUNT(*) FROM productos WHERE proveedor_id = ?",
-                (prov[0],)
-            )
-            product_count = self.db_cursor.fetchone()[0]
-            
-            self.providers_tree.insert("", "end", 
-                                     values=(prov[0], prov[1], prov[2], product_count))
+        self.db_tasks.submit("providers", trace.query(store_db.list_providers_with_counts), show_providers, busy=win)
         
         # Botones de acción
         btn_frame = ttk.Frame(main_frame)
@@ -1505,6 +2073,7 @@ class StoreApp:
             
             provider_id = self.providers_tree.item(selected)["values"][0]
             provider_name = self.providers_tree.item(selected)["values"][1]
+            products_trace = screen_trace.recorder.start("view_provider_products")
             
             self.close_window(f"provider_products_{provider_id}")
             products_win = tk.Toplevel(win)
@@ -1538,24 +2107,31 @@ class StoreApp:
             products_tree.pack(side="left", fill="both", expand=True)
             scrollbar.pack(side="right", fill="y")
             
-            # Cargar productos del proveedor
-            self.db_cursor.execute(
-                "SELECT id, nombre, marca, precio, stock FROM productos WHERE proveedor_id = ? ORDER BY nombre",
-                (provider_id,)
-            )
-            products = self.db_cursor.fetchall()
+            # Cargar productos del proveedor en segundo plano
+            def show_products(products):
+                with products_trace.span("insercion"):
+                    for prod in products:
+                        products_tree.insert("", "end", values=prod)
+                products_trace.shown(products_win)
             
-            for prod in products:
-                products_tree.insert("", "end", values=prod)
+            self.db_tasks.submit(
+                f"provider_products_{provider_id}",
+                products_trace.query(lambda connection: store_db.provider_products(connection, provider_id)),
+                show_products, busy=products_win)
             
             # Botón para cerrar
             ttk.Button(main_frame, text="Cerrar", command=products_win.destroy).pack(pady=10)
+            
+            products_trace.mark("ventana")
         
         ttk.Button(btn_frame, text="Ver Productos", command=view_provider_products).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Exportar", command=self.export_data).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Cerrar", command=win.destroy).pack(side="right", padx=5)
+        
+        trace.mark("ventana")
 
     def view_sales_history(self):
+        trace = screen_trace.recorder.start("view_sales_history", loads=2)
         self.close_window("sales_history")
         win = tk.Toplevel(self.root)
         win.title("Historial de Ventas - Mr Store")
@@ -1593,42 +2169,27 @@ class StoreApp:
             start_date = self.sales_start_date.get()
             end_date = self.sales_end_date.get()
             
-            query = "SELECT id, producto, cantidad, total, fecha FROM ventas"
-            params = []
-            
-            if start_date or end_date:
-                query += " WHERE"
-                conditions = []
-                
-                if start_date:
-                    conditions.append(" fecha >= ?")
-                    params.append(start_date + " 00:00:00")
-                
-                if end_date:
-                    conditions.append(" fecha <= ?")
-                    params.append(end_date + " 23:59:59")
-                
-                query += " AND".join(conditions)
-            
-            query += " ORDER BY fecha DESC"
+            try:
+                store_db.date_range_filter(start_date, end_date)
+            except ValueError:
+                messagebox.showerror("Error", "Fecha inválida. Use el formato AAAA-MM-DD.", parent=win)
+                return
             
-            self.sales_history_tree.delete(*self.sales_history_tree.get_children())
-            self.db_cursor.execute(query, tuple(params))
-            sales = self.db_cursor.fetchall()
+            self.load_sales_lazily(self.sales_history_tree, scrollbar, start_date, end_date,
+                                   lambda sale: (sale[0], sale[1], sale[2], sale[3], sale[4], f"${sale[5]:.2f}"),
+                                   trace)
             
-            total_sales = 0.0
-            for sale in sales:
-                self.sales_history_tree.insert("", "end", values=(
-                    sale[0],
-                    sale[4].split()[0],  # Fecha
-                    sale[4].split()[1],  # Hora
-                    sale[1],  # Productos
-                    sale[2],  # Cantidad
-                    f"${sale[3]:.2f}"  # Total
-                ))
-                total_sales += sale[3]
+            def show_summary(summary):
+                num_sales, total_sales = summary
+                with trace.span("insercion"):
+                    self.sales_total_var.set(f"Total: ${total_sales:.2f} ({num_sales} ventas)")
+                trace.shown(win)
             
-            self.sales_total_var.set(f"Total: ${total_sales:.2f}")
+            self.sales_total_var.set("Cargando...")
+            self.db_tasks.submit(
+                "sales_summary",
+                trace.query(lambda connection: store_db.get_sales_summary(connection, start_date, end_date)),
+                show_summary, busy=win)
         
         ttk.Button(filter_frame, text="Filtrar", command=apply_filters,
                   style="Accent.TButton").pack(side="left", padx=5)
@@ -1670,14 +2231,17 @@ class StoreApp:
                 return
             
             sale_id = self.sales_history_tree.item(selected)["values"][0]
+            detail_trace = screen_trace.recorder.start("view_sale_details")
             
-            self.db_cursor.execute(
-                "SELECT producto, total, fecha FROM ventas WHERE id = ?",
-                (sale_id,)
-            )
-            sale = self.db_cursor.fetchone()
-            
-            if not sale:
+            # La venta y su detalle se leen en el hilo de DBWorker, de la misma instantánea
+            self.db_tasks.submit(
+                "sale_details",
+                detail_trace.query(lambda connection: (store_db.get_sale(connection, sale_id),
+                                                       store_db.get_sale_items(connection, sale_id))),
+                lambda result: show_sale_details(sale_id, detail_trace, *result), busy=win)
+        
+        def show_sale_details(sale_id, detail_trace, sale, items):
+            if not sale or not win.winfo_exists():
                 return
             
             detail_win = tk.Toplevel(win)
@@ -1704,13 +2268,24 @@ class StoreApp:
             text_area.pack(fill="both", expand=True)
             scrollbar.config(command=text_area.yview)
             
-            text_area.insert("end", sale[0])
+            detail_trace.mark("ventana")
+            with detail_trace.span("conversion"):
+                if items:
+                    text = "".join(f"{nombre}: {cantidad} {unidad} x ${precio:.2f} = ${subtotal:.2f}\n"
+                                   for nombre, cantidad, unidad, precio, subtotal in items)
+                else:
+                    text = sale[0]
+            with detail_trace.span("insercion"):
+                text_area.insert("end", text)
             text_area.config(state="disabled")
             
             ttk.Label(detail_win, text=f"Total: ${sale[1]:.2f}", 
                      font=("Arial", 12, "bold")).pack(pady=10)
             
             ttk.Button(detail_win, text="Cerrar", command=detail_win.destroy).pack(pady=5)
+            
+            detail_trace.mark("ventana")
+            detail_trace.shown(detail_win)
         
         ttk.Button(btn_frame, text="Ver Detalle", command=view_sale_details).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Exportar", command=self.export_data).pack(side="left", padx=5)
@@ -1722,11 +2297,215 @@ class StoreApp:
         # Configurar evento de búsqueda al presionar Enter
         start_entry.bind("<Return>", lambda e: apply_filters())
         end_entry.bind("<Return>", lambda e: apply_filters())
+        
+        trace.mark("ventana")
+
+    def view_analysis(self):
+        try:
+            import store_analytics  # NumPy se carga solo al abrir el análisis
+        except ImportError:
+            messagebox.showerror("Error", "El análisis de ventas necesita NumPy (pip install numpy).")
+            return
+        
+        trace = screen_trace.recorder.start("view_analysis")
+        self.close_window("analysis")
+        win = tk.Toplevel(self.root)
+        win.title("Análisis de Ventas - Mr Store")
+        win.geometry("1100x700")
+        self.open_windows["analysis"] = win
+        
+        # Frame principal
+        main_frame = ttk.Frame(win)
+        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        # Título y filtros
+        header_frame = ttk.Frame(main_frame)
+        header_frame.pack(fill="x", pady=(0, 10))
+        
+        ttk.Label(header_frame, text="Análisis de Ventas",
+                 font=("Arial", 14, "bold"),
+                 foreground=self.primary_color).pack(side="left")
+        
+        filter_frame = ttk.Frame(header_frame)
+        filter_frame.pack(side="right")
+        
+        # Por defecto el último año
+        today = datetime.date.today()
+        start_var = tk.StringVar(value=(today - datetime.timedelta(days=364)).strftime("%Y-%m-%d"))
+        end_var = tk.StringVar(value=today.strftime("%Y-%m-%d"))
+        ttk.Label(filter_frame, text="Desde:").pack(side="left", padx=5)
+        start_entry = ttk.Entry(filter_frame, textvariable=start_var, width=10)
+        start_entry.pack(side="left", padx=5)
+        ttk.Label(filter_frame, text="Hasta:").pack(side="left", padx=5)
+        end_entry = ttk.Entry(filter_frame, textvariable=end_var, width=10)
+        end_entry.pack(side="left", padx=5)
+        
+        summary_var = tk.StringVar(value="Cargando...")
+        ttk.Label(main_frame, textvariable=summary_var,
+                 font=("Arial", 12, "bold")).pack(anchor="w", pady=(0, 10))
+        
+        # Notebook (pestañas)
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill="both", expand=True)
+        
+        def ranking_tree(parent, title, first_column):
+            # Treeview (nombre, cantidad, ingresos, % de ingresos) con título y scrollbar
+            frame = ttk.Frame(parent)
+            ttk.Label(frame, text=title, font=("Arial", 11, "bold")).pack(anchor="w", pady=5)
+            columns = (first_column, "Cantidad", "Ingresos", "%")
+            tree = ttk.Treeview(frame, columns=columns, show="headings")
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=90, anchor="center")
+            tree.column(first_column, width=260, anchor="w")
+            tree.column("%", width=60)
+            scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side="left", fill="both", expand=True)
+            scrollbar.pack(side="right", fill="y")
+            return frame, tree
+        
+        # Pestaña de productos: más vendidos por ingresos y por cantidad
+        products_frame = ttk.Frame(notebook)
+        notebook.add(products_frame, text="Productos")
+        frame, revenue_tree = ranking_tree(products_frame, "Por ingresos", "Producto")
+        frame.pack(side="left", fill="both", expand=True, padx=(0, 5))
+        frame, quantity_tree = ranking_tree(products_frame, "Por cantidad", "Producto")
+        frame.pack(side="left", fill="both", expand=True, padx=(5, 0))
+        
+        # Pestaña de horario: mapa de calor por día de la semana y hora
+        heatmap_frame = ttk.Frame(notebook)
+        notebook.add(heatmap_frame, text="Día y hora")
+        metric_var = tk.StringVar(value="ventas")
+        metric_frame = ttk.Frame(heatmap_frame)
+        metric_frame.pack(anchor="w", pady=5)
+        ttk.Radiobutton(metric_frame, text="Número de ventas", variable=metric_var, value="ventas",
+                        command=lambda: draw_heatmap()).pack(side="left", padx=5)
+        ttk.Radiobutton(metric_frame, text="Ingresos", variable=metric_var, value="ingresos",
+                        command=lambda: draw_heatmap()).pack(side="left", padx=5)
+        heatmap = tk.Canvas(heatmap_frame, bg="white", highlightthickness=0)
+        heatmap.pack(fill="both", expand=True)
+        
+        # Pestañas de marcas y proveedores
+        frame, brand_tree = ranking_tree(notebook, "Ingresos por marca", "Marca")
+        notebook.add(frame, text="Marcas")
+        frame, provider_tree = ranking_tree(notebook, "Ingresos por proveedor", "Proveedor")
+        notebook.add(frame, text="Proveedores")
+        
+        result = {}  # Último análisis mostrado, para el mapa de calor y el reporte
+        
+        def draw_heatmap():
+            heatmap.delete("all")
+            analysis = result.get("analysis")
+            if analysis is None:
+                return
+            values = analysis.heatmap_sales if metric_var.get() == "ventas" else analysis.heatmap_revenue
+            peak = values.max() or 1
+            left, top, width, height = 90, 30, 38, 34
+            red, green, blue = (int(self.primary_color[i:i + 2], 16) for i in (1, 3, 5))
+            for hour in range(24):
+                heatmap.create_text(left + hour * width + width / 2, top - 12, text=str(hour))
+            for weekday, name in enumerate(store_analytics.WEEKDAYS):
+                y = top + weekday * height
+                heatmap.create_text(left - 10, y + height / 2, text=name, anchor="e")
+                for hour in range(24):
+                    value = values[weekday, hour]
+                    share = value / peak
+                    # De blanco (sin ventas) al color principal (la hora con más ventas)
+                    color = "#%02x%02x%02x" % tuple(round(255 - (255 - channel) * share)
+                                                    for channel in (red, green, blue))
+                    x = left + hour * width
+                    heatmap.create_rectangle(x, y, x + width, y + height, fill=color, outline="#e0e0e0")
+                    if value:
+                        label = f"{value:.0f}" if value < 1000 else f"{value / 1000:.0f}k"
+                        heatmap.create_text(x + width / 2, y + height / 2, text=label, font=("Arial", 8),
+                                            fill="white" if share > 0.6 else self.dark_color)
+        
+        def apply_filters():
+            start_date = start_var.get()
+            end_date = end_var.get()
+            
+            try:
+                store_db.date_range_filter(start_date, end_date)
+            except ValueError:
+                messagebox.showerror("Error", "Fecha inválida. Use el formato AAAA-MM-DD.", parent=win)
+                return
+            
+            summary_var.set("Cargando...")
+            self.db_tasks.submit(
+                "analysis",
+                trace.query(lambda connection: store_analytics.analyze(connection, start_date, end_date)),
+                show_analysis, busy=win)
+        
+        def show_analysis(analysis):
+            result["analysis"] = analysis
+            with trace.span("conversion"):
+                def rows(ranking):
+                    total = analysis.revenue or 1
+                    return [(nombre, f"{cantidad:.10g}", f"${ingresos:.2f}", f"{ingresos / total * 100:.1f}")
+                            for nombre, cantidad, ingresos in ranking]
+                tables = ((revenue_tree, rows(analysis.top_by_revenue)),
+                          (quantity_tree, rows(analysis.top_by_quantity)),
+                          (brand_tree, rows(analysis.by_brand)),
+                          (provider_tree, rows(analysis.by_provider)))
+                summary = (f"Ventas: {analysis.sales}    Ingresos: ${analysis.revenue:.2f}    "
+                           f"Ticket promedio: ${analysis.average_ticket:.2f}    "
+                           f"Unidades: {analysis.items:.10g}    ({analysis.seconds * 1000:.0f} ms)")
+            with trace.span("insercion"):
+                for tree, values in tables:
+                    tree.delete(*tree.get_children())
+                    for row in values:
+                        tree.insert("", "end", values=row)
+                summary_var.set(summary)
+                draw_heatmap()
+            trace.shown(win)
+        
+        def save_report():
+            analysis = result.get("analysis")
+            if analysis is None:
+                return
+            
+            filename = filedialog.asksaveasfilename(
+                defaultextension=".txt",
+                filetypes=[("Archivos de texto", "*.txt"), ("Todos los archivos", "*.*")],
+                title="Guardar reporte como",
+                parent=win
+            )
+            if not filename:
+                return
+            
+            try:
+                with open(filename, "w", encoding="utf-8") as f:
+                    store_analytics.write_report(analysis, f)
+                messagebox.showinfo("Éxito", "Reporte generado correctamente.", parent=win)
+            except OSError as e:
+                messagebox.showerror("Error", f"No se pudo generar el reporte: {str(e)}", parent=win)
+        
+        ttk.Button(filter_frame, text="Calcular", command=apply_filters,
+                  style="Accent.TButton").pack(side="left", padx=5)
+        
+        # Botones
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(pady=10)
+        
+        ttk.Button(btn_frame, text="Guardar reporte", command=save_report).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=win.destroy).pack(side="left", padx=5)
+        
+        # Configurar evento de búsqueda al presionar Enter
+        start_entry.bind("<Return>", lambda e: apply_filters())
+        end_entry.bind("<Return>", lambda e: apply_filters())
+        
+        apply_filters()
+        trace.mark("ventana")
 
     def export_data(self):
+        if "export" in self.open_windows and self.open_windows["export"].winfo_exists():
+            messagebox.showwarning("Advertencia", "Ya hay una exportación en curso.")
+            return
+        
         file_path = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*")],
+            filetypes=[("Archivos CSV", "*.csv"), ("CSV comprimido", "*.csv.gz"), ("Todos los archivos", "*.*")],
             title="Guardar datos como"
         )
         
@@ -1737,99 +2516,122 @@ class StoreApp:
             # Determinar qué datos exportar basado en la ventana actual
             if "inventory" in self.open_windows and self.open_windows["inventory"].winfo_exists():
                 # Exportar inventario
-                self.db_cursor.execute("""
-                    SELECT p.id, p.nombre, p.marca, p.precio, p.unidad, p.stock, pr.nombre as proveedor
-                    FROM productos p
-                    LEFT JOIN proveedores pr ON p.proveedor_id = pr.id
-                    ORDER BY p.nombre
-                """)
-                data = self.db_cursor.fetchall()
-                headers = ["ID", "Nombre", "Marca", "Precio", "Unidad", "Stock", "Proveedor"]
+                jobs = [(file_path, *store_db.inventory_export())]
+                size = lambda connection: store_db.export_size(connection, "productos")
                 
             elif "providers" in self.open_windows and self.open_windows["providers"].winfo_exists():
                 # Exportar proveedores
-                self.db_cursor.execute("""
-                    SELECT id, nombre, contacto, 
-                    (SELECT COUNT(*) FROM productos WHERE proveedor_id = proveedores.id) as num_productos
-                    FROM proveedores
-                    ORDER BY nombre
-                """)
-                data = self.db_cursor.fetchall()
-                headers = ["ID", "Nombre", "Contacto", "Núm. Productos"]
+                jobs = [(file_path, *store_db.providers_export())]
+                size = lambda connection: store_db.export_size(connection, "proveedores")
                 
             elif "sales_history" in self.open_windows and self.open_windows["sales_history"].winfo_exists():
                 # Exportar ventas
                 start_date = self.sales_start_date.get()
                 end_date = self.sales_end_date.get()
-                
-                query = """
-                    SELECT id, producto, cantidad, total, fecha
-                    FROM ventas
-                """
-                params = []
-                
-                if start_date or end_date:
-                    query += " WHERE"
-                    conditions = []
-                    
-                    if start_date:
-                        conditions.append(" fecha >= ?")
-                        params.append(start_date + " 00:00:00")
-                    
-                    if end_date:
-                        conditions.append(" fecha <= ?")
-                        params.append(end_date + " 23:59:59")
-                    
-                    query += " AND".join(conditions)
-                
-                query += " ORDER BY fecha DESC"
-                
-                self.db_cursor.execute(query, tuple(params))
-                data = self.db_cursor.fetchall()
-                headers = ["ID", "Productos", "Cantidad", "Total", "Fecha"]
+                jobs = [(file_path, *store_db.sales_export(start_date, end_date))]
+                size = lambda connection: store_db.export_size(connection, "ventas", start_date, end_date)
                 
             else:
-                # Exportar todo por defecto
-                self.db_cursor.execute("SELECT * FROM productos")
-                products = self.db_cursor.fetchall()
-                
-                self.db_cursor.execute("SELECT * FROM proveedores")
-                providers = self.db_cursor.fetchall()
-                
-                self.db_cursor.execute("SELECT * FROM ventas ORDER BY fecha DESC")
-                sales = self.db_cursor.fetchall()
+                # Exportar todo por defecto, un archivo CSV por tabla
+                base_path, suffix = store_db.full_export_base(file_path)
                 
-                data = {
-                    "productos": (["ID", "Nombre", "Marca", "Precio", "Unidad", "Stock", "Imagen", "Proveedor ID"], products),
-                    "proveedores": (["ID", "Nombre", "Contacto"], providers),
-                    "ventas": (["ID", "Producto", "Cantidad", "Total", "Fecha"], sales)
-                }
+                tables = store_db.full_export()
+                jobs = [(f"{base_path}_{table_name}{suffix}", *spec) for table_name, spec in tables.items()]
+                size = lambda connection: sum(store_db.export_size(connection, table) for table in tables)
                 
-                # Guardar en múltiples hojas si es Excel o en múltiples archivos CSV
-                if file_path.endswith(".csv"):
-                    base_path = file_path[:-4]  # Quitar .csv
-                    for table_name, (headers, table_data) in data.items():
-                        with open(f"{base_path}_{table_name}.csv", "w", newline="", encoding="utf-8") as f:
-                            writer = csv.writer(f)
-                            writer.writerow(headers)
-                            writer.writerows(table_data)
-                    
-                    messagebox.showinfo("Éxito", f"Datos exportados en múltiples archivos:\n{base_path}_*.csv")
-                    return
-            
-            # Guardar datos en un solo archivo CSV
-            with open(file_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(headers)
-                writer.writerows(data)
+                self.run_export(jobs, f"Datos exportados en múltiples archivos:\n{base_path}_*{suffix}", size)
+                return
             
-            messagebox.showinfo("Éxito", "Datos exportados correctamente.")
+            self.run_export(jobs, "Datos exportados correctamente.", size)
         
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar los datos: {str(e)}")
 
+    def run_export(self, jobs, success_message, size):
+        # Exportar en segundo plano con barra de progreso y cancelación. Los archivos se escriben
+        # uno tras otro desde la misma instantánea de lectura (DBWorker); size(conexión) da las
+        # filas esperadas para la barra sin recorrer las consultas.
+        win = tk.Toplevel(self.root)
+        win.title("Exportando datos")
+        win.geometry("400x150")
+        win.resizable(False, False)
+        self.open_windows["export"] = win
+        
+        main_frame = ttk.Frame(win)
+        main_frame.pack(fill="both", expand=True, padx=20, pady=20)
+        
+        status_var = tk.StringVar(value="Preparando exportación...")
+        ttk.Label(main_frame, textvariable=status_var).pack(fill="x", pady=(0, 10))
+        
+        progress_bar = ttk.Progressbar(main_frame, mode="determinate")
+        progress_bar.pack(fill="x", pady=5)
+        
+        progress = {"rows": 0, "total": 0}
+        progress_lock = threading.Lock()
+        cancel_event = threading.Event()
+        started = []
+        
+        def on_progress(rows):
+            with progress_lock:
+                progress["rows"] += rows
+        
+        def export(connection):
+            total = size(connection)
+            with progress_lock:
+                progress["total"] = total
+            for path, headers, query, params in jobs:
+                if cancel_event.is_set():
+                    break
+                started.append(path)
+                store_db.export_query(connection, path, headers, query, params,
+                                      on_progress, cancel_event.is_set)
+        
+        def finish(error=None):
+            if error is not None or cancel_event.is_set():
+                for path in started:
+                    if os.path.exists(path):
+                        os.remove(path)  # No dejar archivos incompletos
+            
+            win.destroy()
+            del self.open_windows["export"]
+            if error is not None:
+                messagebox.showerror("Error", f"No se pudo exportar los datos: {str(error)}")
+            elif cancel_event.is_set():
+                messagebox.showinfo("Cancelado", "La exportación fue cancelada.")
+            else:
+                messagebox.showinfo("Éxito", success_message)
+        
+        def cancel():
+            cancel_event.set()
+            status_var.set("Cancelando...")
+            cancel_btn.config(state="disabled")
+        
+        cancel_btn = ttk.Button(main_frame, text="Cancelar", command=cancel)
+        cancel_btn.pack(pady=10)
+        win.protocol("WM_DELETE_WINDOW", cancel)
+        
+        def poll():
+            if not win.winfo_exists():
+                return  # finish ya cerró la ventana
+            with progress_lock:
+                rows, total = progress["rows"], progress["total"]
+            progress_bar.config(maximum=max(total, rows, 1), value=rows)
+            if not cancel_event.is_set():
+                status_var.set(f"{rows:,} de {total:,} registros exportados")
+            win.after(100, poll)
+        
+        self.db_tasks.submit("export", export, lambda _: finish(), finish)
+        poll()
+
     def __del__(self):
-        self.db_connection.close()
+        self.db_tasks.shutdown()
+        
+        # Actualizar estadísticas de los índices antes de cerrar
+        try:
+            self.db_connection.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass
+        self.db.close()
 
 if __name__ == "__main__":
     root = tk.Tk()
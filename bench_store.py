@@ -0,0 +1,381 @@
+# Mediciones de rendimiento de Mr Store con datos sintéticos.
+# Genera una base de datos con semilla fija (productos, proveedores y ventas de varios años)
+# y mide las consultas de cada pantalla con store_db, sin interfaz gráfica.
+# Los resultados (p50/p95 en ms y pico de memoria) se guardan en un archivo JSON.
+#
+#   python bench_store.py --db /dev/shm/bench.db --output resultados.json
+#   python bench_store.py --db :memory: --ventas 100000 --runs 10
+import argparse
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import store_db
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import store_analytics
+except ImportError:  # Sin NumPy no se mide el análisis de ventas
+    store_analytics = None
+
+
+BASES = ["Leche", "Queso", "Yogur", "Pan", "Arroz", "Frijol", "Aceite", "Azúcar", "Café", "Refresco",
+         "Agua", "Jabón", "Detergente", "Galletas", "Cereal", "Atún", "Huevo", "Tortillas",
+         "Papel higiénico", "Sopa", "Chiles", "Mayonesa", "Salsa", "Harina", "Avena", "Jugo"]
+VARIANTES = ["Entera", "Light", "Integral", "Natural", "Familiar", "Clásico", "Premium", "Sin azúcar",
+             "Deslactosada", "Picante", "Original", "Económico"]
+TAMANOS = ["250 g", "500 g", "1 kg", "1 L", "2 L", "600 ml", "355 ml", "12 pzas", "900 g", "3 L"]
+MARCAS = ["Lala", "Bimbo", "Nestlé", "Coca-Cola", "Herdez", "La Costeña", "Sabritas", "Gamesa",
+          "Kellogg's", "Alpura", "Verde Valle", "Zote", "Ariel", "Del Valle", "Jumex", "Maseca",
+          "Nutrioli", "McCormick", "Knorr", "Great Value"]
+APELLIDOS = ["García", "Hernández", "López", "Martínez", "González", "Pérez", "Rodríguez", "Sánchez",
+             "Ramírez", "Torres", "Flores", "Rivera", "Gómez", "Díaz", "Cruz", "Morales"]
+
+
+# ----------------------------------------------------------------------------
+# Generación de datos
+# ----------------------------------------------------------------------------
+
+def generate(connection, rng, num_productos, num_proveedores, num_ventas, years, batch_size=10000):
+    # Llenar la base con datos sintéticos; las ventas quedan en orden cronológico, como en uso real
+    proveedores = [(f"Distribuidora {rng.choice(APELLIDOS)} {i}", f"55{rng.randrange(10**8):08d}")
+                   for i in range(1, num_proveedores + 1)]
+    connection.executemany("INSERT INTO proveedores (nombre, contacto) VALUES (?, ?)", proveedores)
+    proveedor_ids = [row[0] for row in connection.execute("SELECT id FROM proveedores")]
+
+    productos = []
+    for _ in range(num_productos):
+        unidad = "kg" if rng.random() < 0.15 else "pieza"
+        productos.append((
+            f"{rng.choice(BASES)} {rng.choice(VARIANTES)} {rng.choice(TAMANOS)}",
+            rng.choice(MARCAS),
+            round(rng.uniform(5, 350), 2),
+            unidad,
+            rng.randint(0, 500),
+            "",
+            rng.choice(proveedor_ids)
+        ))
+    connection.executemany(
+        "INSERT INTO productos (nombre, marca, precio, unidad, stock, imagen, proveedor_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        productos
+    )
+    catalogo = connection.execute("SELECT id, nombre, precio, unidad FROM productos").fetchall()
+
+    # Pocos productos concentran la mayoría de las ventas
+    pesos = list(_cumulative(1.0 / (rank + 1) ** 0.8 for rank in range(len(catalogo))))
+
+    next_id = (connection.execute("SELECT COALESCE(MAX(id), 0) FROM ventas").fetchone()[0]) + 1
+    end = datetime.date.today()
+    days = max(1, int(365 * years))
+    start = end - datetime.timedelta(days=days)
+
+    ventas = []
+    items = []
+    generated = 0
+    for day_index in range(days):
+        dia = start + datetime.timedelta(days=day_index)
+        count = num_ventas * (day_index + 1) // days - generated
+        generated += count
+        for segundos in sorted(rng.randint(8 * 3600, 21 * 3600) for _ in range(count)):
+            fecha = f"{dia.isoformat()} {segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}"
+            detalle = []
+            total_cantidad = 0.0
+            total_venta = 0.0
+            for producto_id, nombre, precio, unidad in rng.choices(catalogo, cum_weights=pesos,
+                                                                     k=rng.randint(1, 6)):
+                cantidad = round(rng.uniform(0.25, 3), 2) if unidad == "kg" else float(rng.randint(1, 4))
+                subtotal = precio * cantidad
+                detalle.append(f"{nombre}: {cantidad} {unidad} - ${subtotal:.2f}")
+                items.append((next_id, producto_id, nombre, unidad, cantidad, precio, subtotal))
+                total_cantidad += cantidad
+                total_venta += subtotal
+            ventas.append((next_id, "; ".join(detalle), total_cantidad, total_venta, fecha))
+            next_id += 1
+
+            if len(ventas) >= batch_size:
+                _insert_sales(connection, ventas, items)
+                ventas, items = [], []
+
+    _insert_sales(connection, ventas, items)
+    connection.commit()
+    store_db.rebuild_rollups(connection)
+    connection.execute("PRAGMA optimize")
+
+
+def _cumulative(values):
+    total = 0.0
+    for value in values:
+        total += value
+        yield total
+
+
+def _insert_sales(connection, ventas, items):
+    connection.executemany("INSERT INTO ventas (id, producto, cantidad, total, fecha) VALUES (?, ?, ?, ?, ?)", ventas)
+    connection.executemany(
+        "INSERT INTO venta_items (venta_id, producto_id, nombre, unidad, cantidad, precio_unitario, subtotal) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        items
+    )
+
+
+# ----------------------------------------------------------------------------
+# Cargas de trabajo (una por pantalla)
+# ----------------------------------------------------------------------------
+
+def build_workloads(connection, fts_enabled, rng, export_dir):
+    today = datetime.date.today()
+    primer_dia = connection.execute("SELECT MIN(dia) FROM ventas_diarias").fetchone()[0] or today.isoformat()
+    meses = [row[0] for row in connection.execute("SELECT mes FROM ventas_mensuales ORDER BY mes")] or [today.isoformat()[:7]]
+    proveedor_ids = [row[0] for row in connection.execute("SELECT id FROM proveedores")]
+    # Productos con existencia suficiente para que las ventas de prueba nunca fallen
+    productos = {row[0]: row for row in connection.execute(
+        "SELECT id, nombre, precio, unidad FROM productos WHERE stock >= 100 AND unidad = 'pieza' LIMIT 5000"
+    )}
+    vendibles = list(productos)
+    terminos = ["lec", "bimbo", "azúcar 1 kg", "deslact", "Distribuidora G", "café premium", "xyz"]
+
+    def month_range():
+        mes = rng.choice(meses)
+        inicio = f"{mes}-01"
+        fin = (datetime.date.fromisoformat(inicio) + datetime.timedelta(days=31)).replace(day=1)
+        return inicio, (fin - datetime.timedelta(days=1)).isoformat()
+
+    def dashboard():
+        store_db.count_products(connection)
+        store_db.count_providers(connection)
+        store_db.get_day_totals(connection, today.isoformat())
+        store_db.latest_sales(connection, 10)
+        store_db.low_stock(connection)
+
+    def catalog_load():
+        # Lo que carga register_sale al abrir: catálogo completo ordenado por nombre
+        store_db.ProductCatalog(connection).product_rows()
+
+    def inventory_open():
+        store_db.search_products(connection, "", fts_enabled)
+
+    def inventory_search():
+        store_db.search_products(connection, rng.choice(terminos), fts_enabled)
+
+    def product_sales():
+        store_db.get_product_sales(connection, rng.choice(vendibles), today.replace(day=1).isoformat())
+
+    def sales_history_filter():
+        inicio, fin = month_range()
+        store_db.get_sales_summary(connection, inicio, fin)
+        store_db.fetch_sales_page(connection, inicio, fin)
+
+    def sales_history_scroll():
+        # Diez páginas seguidas, como al bajar por el historial completo
+        after = None
+        for _ in range(10):
+            rows = store_db.fetch_sales_page(connection, "", "", after)
+            if not rows:
+                break
+            after = (rows[-1][6], rows[-1][0])
+
+    def sale_details():
+        sale_id = rng.randint(1, store_db.get_sales_summary(connection)[0] or 1)
+        store_db.get_sale(connection, sale_id)
+        store_db.get_sale_items(connection, sale_id)
+
+    def cortes_filter():
+        list(store_db.get_daily_totals(connection, primer_dia, today.isoformat()))
+
+    def cortes_report():
+        store_db.write_cortes_report(connection, io.StringIO(), primer_dia, today.isoformat())
+
+    def corte_detail():
+        inicio, _ = month_range()
+        store_db.sales_of_day(connection, inicio)
+
+    def providers_list():
+        store_db.list_providers_with_counts(connection)
+
+    def provider_products():
+        store_db.provider_products(connection, rng.choice(proveedor_ids))
+
+    def finalize_sale():
+        sale_items = []
+        for product_id in rng.sample(vendibles, min(len(vendibles), rng.randint(1, 5))):
+            _, nombre, precio, unidad = productos[product_id]
+            sale_items.append({"id": product_id, "nombre": nombre, "precio": precio,
+                               "cantidad": 1, "unidad": unidad})
+        store_db.save_sale(connection, sale_items)
+
+    def export(spec, name):
+        def run():
+            headers, query, params = spec()
+            store_db.export_query(connection, os.path.join(export_dir, name), headers, query, params)
+        return run
+
+    def export_full():
+        for table_name, (headers, query, params) in store_db.full_export().items():
+            store_db.export_query(connection, os.path.join(export_dir, f"todo_{table_name}.csv"),
+                                  headers, query, params)
+
+    workloads = {
+        "dashboard": dashboard,
+        "catalog_load": catalog_load,
+        "inventory_open": inventory_open,
+        "inventory_search": inventory_search,
+        "product_sales": product_sales,
+        "sales_history_filter": sales_history_filter,
+        "sales_history_scroll": sales_history_scroll,
+        "sale_details": sale_details,
+        "cortes_filter": cortes_filter,
+        "cortes_report": cortes_report,
+        "corte_detail": corte_detail,
+        "providers_list": providers_list,
+        "provider_products": provider_products,
+        "finalize_sale": finalize_sale,
+    }
+    exports = {
+        "export_inventory": export(store_db.inventory_export, "inventario.csv"),
+        "export_providers": export(store_db.providers_export, "proveedores.csv"),
+        "export_sales_month": export(lambda: store_db.sales_export(*month_range()), "ventas_mes.csv"),
+        "export_sales": export(store_db.sales_export, "ventas.csv"),
+        "export_full": export_full,
+    }
+    # Cálculo de la demanda que hace la aplicación al arrancar (en un lector)
+    exports["demand_compute"] = lambda: store_db.compute_demand(connection)
+    if store_analytics is not None:
+        # Ventana Análisis sobre el último año; se mide con las exportaciones por ser pesada
+        exports["sales_analysis_year"] = lambda: store_analytics.analyze(
+            connection, (today - datetime.timedelta(days=364)).isoformat(), today.isoformat())
+    if not vendibles:
+        del workloads["finalize_sale"], workloads["product_sales"]
+    return workloads, exports
+
+
+# ----------------------------------------------------------------------------
+# Medición
+# ----------------------------------------------------------------------------
+
+def percentile(samples, q):
+    # Percentil por rango más cercano sobre una lista ya ordenada
+    return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+
+def measure(fn, runs):
+    fn()  # Calentar caché de páginas y sentencias preparadas
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+
+    # Pico de memoria de Python en una ejecución aparte, para no alterar los tiempos
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "runs": runs,
+        "p50_ms": round(percentile(samples, 0.50), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "min_ms": round(samples[0], 3),
+        "max_ms": round(samples[-1], 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS reporta bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mediciones de rendimiento de Mr Store con datos sintéticos")
+    parser.add_argument("--db", default="bench_mr_store.db",
+                        help="ruta de la base de datos de prueba (puede ser :memory: o estar en tmpfs)")
+    parser.add_argument("--output", default="bench_results.json", help="archivo JSON de resultados")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--productos", type=int, default=50000)
+    parser.add_argument("--proveedores", type=int, default=2000)
+    parser.add_argument("--ventas", type=int, default=1000000)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--runs", type=int, default=30, help="repeticiones por pantalla")
+    parser.add_argument("--export-runs", type=int, default=3, help="repeticiones por exportación")
+    parser.add_argument("--only", nargs="*", help="medir solo estas cargas de trabajo")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="borrar y volver a generar la base aunque ya tenga datos")
+    args = parser.parse_args(argv)
+
+    if args.regenerate and args.db != ":memory:" and os.path.exists(args.db):
+        os.remove(args.db)
+
+    connection = store_db.connect(args.db)
+    fts_enabled = store_db.create_tables(connection)
+    rng = random.Random(args.seed)
+
+    generation_s = None
+    if not store_db.count_products(connection):
+        print(f"Generando datos en {args.db}...", flush=True)
+        start = time.perf_counter()
+        generate(connection, rng, args.productos, args.proveedores, args.ventas, args.years)
+        generation_s = round(time.perf_counter() - start, 2)
+        print(f"Datos generados en {generation_s} s", flush=True)
+    store_db.update_demand(connection)  # Como al arrancar la aplicación (panel Agotándose)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as export_dir:
+        workloads, exports = build_workloads(connection, fts_enabled, rng, export_dir)
+        plan = [(name, fn, args.runs) for name, fn in workloads.items()]
+        plan += [(name, fn, args.export_runs) for name, fn in exports.items()]
+
+        for name, fn, runs in plan:
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(fn, runs)
+            r = results[name]
+            print(f"{name:<22} p50 {r['p50_ms']:>10.2f} ms   p95 {r['p95_ms']:>10.2f} ms   "
+                  f"pico {r['peak_kb']:>10.1f} KB", flush=True)
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "db": args.db,
+        "seed": args.seed,
+        "fts_enabled": fts_enabled,
+        "sizes": {
+            "productos": store_db.count_products(connection),
+            "proveedores": store_db.count_providers(connection),
+            "ventas": connection.execute("SELECT COUNT(*) FROM ventas").fetchone()[0],
+            "venta_items": connection.execute("SELECT COUNT(*) FROM venta_items").fetchone()[0],
+        },
+        "generation_s": generation_s,
+        "max_rss_kb": max_rss_kb(),
+        "workloads": results,
+    }
+    connection.close()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Caché en disco de imágenes redimensionadas para Mr Store.
+# Cada versión redimensionada se guarda una sola vez, identificada por la ruta, fecha de
+# modificación y tamaño del archivo original más el tamaño pedido; si el original cambia,
+# la clave cambia y se vuelve a generar.
+import collections
+import hashlib
+import os
+import tkinter as tk
+from typing import Iterable, Optional
+
+# Carpeta de la caché; MRSTORE_CACHE permite moverla
+CACHE_DIR = os.environ.get("MRSTORE_CACHE", ".mrstore_cache")
+MAX_BACKGROUNDS = 6  # Versiones del fondo que se conservan (distintos tamaños de ventana)
+THUMBNAIL_SIZE = (36, 36)  # Miniaturas de las listas de productos
+
+
+def source_key(path: str, *parts) -> str:
+    # Clave de una imagen de origen: cambia si el archivo se modifica o se reemplaza
+    stat = os.stat(path)
+    raw = "|".join([os.path.abspath(path), str(stat.st_mtime_ns), str(stat.st_size), *map(str, parts)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def prune(folder: str, keep: int) -> None:
+    # Borrar los archivos menos usados recientemente de una carpeta de la caché
+    try:
+        entries = sorted(os.scandir(folder), key=lambda entry: entry.stat().st_mtime, reverse=True)
+    except FileNotFoundError:
+        return
+    for entry in entries[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def background_rendition(path: str, size: tuple) -> str:
+    # Ruta de la imagen de fondo redimensionada a size (ancho, alto) en PPM, formato que
+    # tk.PhotoImage lee directamente: con la caché caliente el arranque no decodifica con PIL
+    folder = os.path.join(CACHE_DIR, "fondos")
+    target = os.path.join(folder, f"{source_key(path, *size)}.ppm")
+    if os.path.exists(target):
+        os.utime(target)  # Marcar como usada recientemente para prune()
+        return target
+
+    from PIL import Image  # Solo se necesita cuando falta la versión en caché
+
+    with Image.open(path) as image:
+        image.draft("RGB", size)  # JPEG: decodificar directamente a una escala cercana
+        rendition = image.convert("RGB").resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    os.makedirs(folder, exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    rendition.save(temp_path, "PPM")
+    os.replace(temp_path, target)  # Otro proceso nunca ve un archivo a medio escribir
+    prune(folder, MAX_BACKGROUNDS)
+    return target
+
+
+def file_digest(path: str) -> str:
+    # SHA-256 del contenido: la misma imagen usada por varios productos se guarda una vez
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def thumbnail_path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, "miniaturas", digest[:2], f"{digest}.png")
+
+
+def make_thumbnail(path: str) -> str:
+    # Generar (si no existe) la miniatura PNG de una imagen y devolver su hash de contenido
+    digest = file_digest(path)
+    target = thumbnail_path(digest)
+    if os.path.exists(target):
+        return digest
+
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft("RGB", THUMBNAIL_SIZE)
+        thumbnail = image.convert("RGBA")
+        thumbnail.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    thumbnail.save(temp_path, "PNG")
+    os.replace(temp_path, target)
+    return digest
+
+
+def make_thumbnails(products: Iterable[tuple]) -> list:
+    # Miniaturas para pares (producto_id, ruta); devuelve (producto_id, hash), con hash vacío
+    # si la imagen no existe o no se puede leer, para no volver a intentarlo en cada arranque
+    thumbnails = []
+    for product_id, path in products:
+        try:
+            thumbnails.append((product_id, make_thumbnail(path)))
+        except Exception:
+            thumbnails.append((product_id, ""))
+    return thumbnails
+
+
+class ThumbnailCache:
+    # PhotoImages de las miniaturas usadas recientemente (LRU). Tk lee los PNG directamente.
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.images = collections.OrderedDict()  # hash -> PhotoImage
+
+    def get(self, digest: str) -> Optional[tk.PhotoImage]:
+        image = self.images.get(digest)
+        if image is not None:
+            self.images.move_to_end(digest)
+            return image
+
+        path = thumbnail_path(digest)
+        if not os.path.exists(path):
+            return None
+        image = tk.PhotoImage(file=path)
+        self.images[digest] = image
+        if len(self.images) > self.capacity:
+            self.images.popitem(last=False)
+        return image
@@ -0,0 +1,146 @@
+# Medición de la apertura de pantallas de Mr Store.
+# Cada apertura de una pantalla (show_*/view_*) se divide en tramos: construcción de la
+# ventana, consulta (en el hilo de DBWorker), conversión de filas a valores, inserción en
+# los widgets y primer pintado (hasta que Tk queda ocioso, con after_idle). Así se ve por
+# pantalla si conviene optimizar el SQL o el dibujado.
+import collections
+import contextlib
+import csv
+import threading
+import time
+from typing import Callable, Optional, TextIO
+
+SPANS = ("ventana", "consulta", "conversion", "insercion", "pintado")
+KEEP_OPENS = 500  # Aperturas que se conservan para el resumen
+
+
+def percentile(values: list, fraction: float) -> float:
+    # Percentil por rango más cercano; values ya ordenado
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class ScreenTrace:
+    # Una apertura de una pantalla. Todo se llama desde el hilo de Tk salvo la consulta
+    # envuelta con query(). Una vez pintada, los tramos siguientes (nuevos filtros,
+    # búsquedas o páginas) ya no cuentan para esta apertura.
+    def __init__(self, recorder: "ScreenRecorder", screen: str, loads: int = 1, started: Optional[float] = None):
+        self.recorder = recorder
+        self.screen = screen
+        self.loads = loads  # Cargas de datos que deben mostrarse antes del primer pintado
+        self.started = time.perf_counter() if started is None else started
+        self.last = self.started
+        self.lock = threading.Lock()
+        self.spans = dict.fromkeys(SPANS, 0.0)
+        self.total = None
+        self.done = False
+
+    def add(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def mark(self, name: str) -> None:
+        # Anotar en name el tiempo desde la última marca o tramo (p. ej. construir la ventana)
+        now = time.perf_counter()
+        if not self.done:
+            self.add(name, now - self.last)
+        self.last = now
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            if not self.done:
+                self.add(name, self.last - start)
+
+    def query(self, query):
+        # Envolver una consulta de DBWorker para medirla en su hilo
+        if self.done:
+            return query
+
+        def timed(connection):
+            start = time.perf_counter()
+            try:
+                return query(connection)
+            finally:
+                if not self.done:
+                    self.add("consulta", time.perf_counter() - start)
+        return timed
+
+    def shown(self, widget, then: Optional[Callable[[], None]] = None) -> None:
+        # Una carga de datos ya está en los widgets; con la última se espera a que Tk pinte.
+        # then() corre después del primer pintado (trabajo que puede esperar).
+        if self.done:
+            return
+        self.loads -= 1
+        if self.loads <= 0:
+            self.done = True
+            paint_start = time.perf_counter()
+            widget.after_idle(lambda: self.painted(paint_start, then))
+
+    def painted(self, paint_start: float, then: Optional[Callable[[], None]] = None) -> None:
+        now = time.perf_counter()
+        self.add("pintado", now - paint_start)
+        self.total = now - self.started
+        self.recorder.record(self)
+        if then:
+            then()
+
+    @property
+    def other(self) -> float:
+        # Tiempo no atribuido a los tramos de SPANS (espera en la cola de DBWorker, eventos de
+        # Tk, tramos propios como la importación de módulos al arrancar)
+        return max(0.0, (self.total or 0.0) - sum(self.spans[name] for name in SPANS))
+
+
+class ScreenRecorder:
+    def __init__(self, keep: int = KEEP_OPENS):
+        self.lock = threading.Lock()
+        self.opens = collections.deque(maxlen=keep)
+
+    def start(self, screen: str, loads: int = 1, started: Optional[float] = None) -> ScreenTrace:
+        return ScreenTrace(self, screen, loads, started)
+
+    def record(self, trace: ScreenTrace) -> None:
+        with self.lock:
+            self.opens.append(trace)
+
+    def summary(self) -> list:
+        # Una fila por pantalla: aperturas, p50/p95 del primer pintado y promedio de cada
+        # tramo en milisegundos, ordenadas por p95
+        with self.lock:
+            opens = list(self.opens)
+        by_screen = collections.defaultdict(list)
+        for trace in opens:
+            by_screen[trace.screen].append(trace)
+
+        rows = []
+        for screen, traces in by_screen.items():
+            totals = sorted(trace.total for trace in traces)
+            means = [sum(trace.spans[name] for trace in traces) / len(traces) * 1000 for name in SPANS]
+            other = sum(trace.other for trace in traces) / len(traces) * 1000
+            rows.append((screen, len(traces), percentile(totals, 0.5) * 1000,
+                         percentile(totals, 0.95) * 1000, *means, other))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
+
+    def write_summary(self, f: TextIO) -> int:
+        writer = csv.writer(f)
+        writer.writerow(["pantalla", "aperturas", "p50_ms", "p95_ms",
+                         *(f"{name}_ms" for name in SPANS), "otros_ms"])
+        rows = self.summary()
+        for row in rows:
+            writer.writerow([row[0], row[1], *(f"{value:.2f}" for value in row[2:])])
+        return len(rows)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.opens.clear()
+
+
+recorder = ScreenRecorder()
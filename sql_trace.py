@@ -0,0 +1,381 @@
+# Medición de las sentencias SQL de Mr Store.
+# TracedConnection (factory de sqlite3.connect) registra por cada sentencia el tiempo de
+# ejecución y lectura de filas, cuántas filas devolvió o modificó y desde dónde se ejecutó,
+# en un búfer circular en memoria. Las que tardan más de SLOW_MS se escriben además en el
+# registro de consultas lentas junto con su EXPLAIN QUERY PLAN.
+import collections
+import datetime
+import functools
+import os
+import pathlib
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional
+
+# MRSTORE_SQL_TRACE=0 desactiva la medición (conexiones sqlite3 normales)
+ENABLED = os.environ.get("MRSTORE_SQL_TRACE", "1") != "0"
+SLOW_MS = float(os.environ.get("MRSTORE_SLOW_MS", "200"))
+# Registro de consultas lentas: MRSTORE_SLOW_LOG, o <base>_lentas.log junto a la base de datos
+# (ver Tracer.log_beside); MRSTORE_SLOW_LOG vacío lo desactiva
+SLOW_LOG = os.environ.get("MRSTORE_SLOW_LOG")
+RING_SIZE = 2000  # Ejecuciones recientes que se conservan
+SLOW_KEEP = 100  # Consultas lentas recientes que se conservan en memoria
+
+# Módulos que no cuentan como origen de una sentencia, y módulos de acceso a datos: si la
+# sentencia sale de uno de estos se anota también quién llamó a la función
+SKIP_MODULES = {__name__, "contextlib"}
+DATA_MODULES = {"store_db"}
+
+# "SCAN productos", "SCAN main.ventas" o "SCAN p" (alias) recorren la tabla completa; no
+# cuentan "SCAN ... USING (COVERING) INDEX", tablas virtuales (FTS5), "SCAN CONSTANT ROW",
+# subconsultas ni CTE. Versiones anteriores de SQLite escriben "SCAN TABLE productos AS p".
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?("?[\w.]+"?)(?: AS \w+)?$')
+PLAN_TABLE = re.compile(r'^(?:SCAN|SEARCH) (?:TABLE )?("?[\w.]+"?)')
+# "FROM tabla alias" / "JOIN esquema.tabla AS alias", para nombrar la tabla y no el alias
+TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+("?[\w.]+"?)(?:\s+(?:AS\s+)?("?\w+"?))?', re.IGNORECASE)
+NOT_ALIAS = {"WHERE", "ON", "USING", "JOIN", "LEFT", "RIGHT", "FULL", "INNER", "OUTER", "CROSS", "NATURAL",
+             "GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW", "UNION", "EXCEPT", "INTERSECT", "INDEXED", "NOT"}
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize(sql: str) -> str:
+    # Texto con el que se agrupan las ejecuciones de una misma sentencia: espacios
+    # colapsados y listas IN (?, ?, ...) de cualquier largo como una sola
+    text = " ".join(sql.split())
+    return re.sub(r"\?(?:\s*,\s*\?)+", "?, …", text)
+
+
+def call_site() -> str:
+    # "función (archivo:línea)" de quien ejecutó la sentencia y, si fue una función de
+    # store_db, también de quien la llamó
+    frame = sys._getframe(2)
+    parts = []
+    first_module = None
+    while frame is not None and len(parts) < 2:
+        module = frame.f_globals.get("__name__")
+        if module not in SKIP_MODULES and (first_module is None or module not in DATA_MODULES):
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            if first_module is None:
+                first_module = module
+                if module not in DATA_MODULES:
+                    break
+        frame = frame.f_back
+    return " ← ".join(parts)
+
+
+def explain(connection: sqlite3.Connection, sql: str, parameters=()) -> Optional[list]:
+    # Líneas del EXPLAIN QUERY PLAN de una sentencia, o None si no se pudo obtener.
+    # Se usa un cursor sin medición para que no aparezca en las estadísticas.
+    try:
+        cursor = sqlite3.Cursor(connection)
+        try:
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        finally:
+            cursor.close()
+    except (sqlite3.Error, ValueError):
+        return None
+    return [row[3] for row in rows]
+
+
+def statement_text(connection: sqlite3.Connection, sql: str) -> str:
+    # Texto de la sentencia más la definición de las vistas que usa: el plan de una vista
+    # nombra los alias de su definición (p. ej. "SCAN i" en venta_items_historial)
+    try:
+        cursor = sqlite3.Cursor(connection)
+        try:
+            views = cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'view' "
+                "UNION ALL SELECT name, sql FROM sqlite_temp_master WHERE type = 'view'"
+            ).fetchall()
+        finally:
+            cursor.close()
+    except (sqlite3.Error, ValueError):
+        return sql
+    return " ".join([sql, *(definition for name, definition in views
+                            if re.search(rf"\b{re.escape(name)}\b", sql, re.IGNORECASE))])
+
+
+def table_aliases(sql: str) -> dict:
+    # alias -> tablas con ese alias en el texto de una sentencia, en orden (una vista con
+    # UNION ALL repite el alias en cada parte: main.venta_items, archivo_2024.venta_items...)
+    aliases = {}
+    for table, alias in TABLE_ALIAS.findall(sql or ""):
+        alias = alias.strip('"')
+        if alias and alias.upper() not in NOT_ALIAS:
+            aliases.setdefault(alias, []).append(table.strip('"'))
+    return aliases
+
+
+def full_scans(plan: Optional[list], sql: str = "") -> list:
+    # Tablas que el plan recorre completas; con el texto de la sentencia (statement_text) se
+    # nombran las tablas en lugar de sus alias
+    tables = []
+    aliases = table_aliases(sql)
+    seen = collections.Counter()  # Veces que el plan usó cada alias (SCAN o SEARCH)
+    subqueries = set()  # "SCAN x" de una CTE o subconsulta materializada no es una tabla
+    for detail in plan or []:
+        if detail.startswith(("CO-ROUTINE ", "MATERIALIZE ")):
+            subqueries.add(detail.split(" ", 1)[1])
+            continue
+        used = PLAN_TABLE.match(detail)
+        if not used:
+            continue
+        name = used.group(1).strip('"')
+        tables_named = aliases.get(name, [name])
+        table = tables_named[min(seen[name], len(tables_named) - 1)]
+        seen[name] += 1
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) not in subqueries and table not in tables:
+            tables.append(table)
+    return tables
+
+
+class Execution:
+    # Una ejecución de una sentencia: el tiempo y las filas se acumulan mientras se leen
+    __slots__ = ("sql", "parameters", "site", "started", "seconds", "rows", "failed")
+
+    def __init__(self, sql, parameters, site):
+        self.sql = sql
+        self.parameters = parameters
+        self.site = site
+        self.started = datetime.datetime.now()
+        self.seconds = 0.0
+        self.rows = 0
+        self.failed = False
+
+
+class StatementStats:
+    # Totales de todas las ejecuciones de una misma sentencia (texto normalizado)
+    __slots__ = ("sql", "calls", "seconds", "max_seconds", "rows", "failures", "site", "plan", "scans")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.failures = 0
+        self.site = ""
+        self.plan = None  # Líneas del EXPLAIN QUERY PLAN (None: todavía no se obtuvo)
+        self.scans = []  # Tablas recorridas completas según el plan
+
+    @property
+    def average_seconds(self) -> float:
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+class Tracer:
+    # Estadísticas compartidas por todas las conexiones del proceso (varios hilos)
+    def __init__(self, slow_ms: float = SLOW_MS, slow_log: Optional[str] = SLOW_LOG):
+        self.slow_seconds = slow_ms / 1000
+        self.slow_log = slow_log
+        self.lock = threading.Lock()
+        self.recent = collections.deque(maxlen=RING_SIZE)
+        self.slow = collections.deque(maxlen=SLOW_KEEP)
+        self.statements = {}  # texto normalizado -> StatementStats
+
+    def log_beside(self, db_path: str) -> None:
+        # Sin un registro elegido, escribir las consultas lentas junto a la primera base que se
+        # abre (mr_store.db -> mr_store_lentas.log) y no en el directorio actual
+        if self.slow_log is None and db_path and db_path != ":memory:":
+            path = pathlib.Path(db_path).absolute()
+            self.slow_log = str(path.with_name(path.stem + "_lentas.log"))
+
+    def needs_plan(self, key: str) -> bool:
+        stats = self.statements.get(key)
+        return stats is None or stats.plan is None
+
+    def set_plan(self, key: str, plan: Optional[list], text: str = "") -> None:
+        # text: la sentencia con sus vistas (statement_text), para nombrar las tablas recorridas
+        if plan is None:
+            return  # Se vuelve a intentar en la próxima ejecución
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(key)
+            stats.plan = plan
+            stats.scans = full_scans(plan, text or key)
+
+    def record(self, execution: Execution) -> None:
+        key = normalize(execution.sql)
+        with self.lock:
+            self.recent.append(execution)
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(key)
+            stats.calls += 1
+            stats.seconds += execution.seconds
+            stats.max_seconds = max(stats.max_seconds, execution.seconds)
+            stats.rows += execution.rows
+            stats.failures += execution.failed
+            stats.site = execution.site
+            if execution.seconds >= self.slow_seconds:
+                self.slow.append((execution, stats.plan))
+                self.write_slow(execution, stats.plan)
+
+    def write_slow(self, execution: Execution, plan: Optional[list]) -> None:
+        if not self.slow_log:
+            return
+        parameters = repr(execution.parameters)
+        if len(parameters) > 300:
+            parameters = parameters[:300] + "…"
+        lines = [
+            f"{execution.started:%Y-%m-%d %H:%M:%S}  {execution.seconds * 1000:.1f} ms  "
+            f"{execution.rows} filas{'  (falló)' if execution.failed else ''}  {execution.site}",
+            f"    {normalize(execution.sql)}",
+            f"    parámetros: {parameters}",
+        ]
+        lines.extend(f"    plan: {detail}" for detail in plan or ["(no disponible)"])
+        try:
+            with open(self.slow_log, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n\n")
+        except OSError:
+            pass  # El registro no debe interrumpir la consulta
+
+    def top(self, limit: int = 50) -> list:
+        # Sentencias con más tiempo total acumulado
+        with self.lock:
+            statements = list(self.statements.values())
+        statements.sort(key=lambda stats: stats.seconds, reverse=True)
+        return statements[:limit]
+
+    def slow_executions(self) -> list:
+        # (ejecución, plan) de las consultas lentas recientes, la más reciente primero
+        with self.lock:
+            return list(reversed(self.slow))
+
+    def reset(self) -> None:
+        with self.lock:
+            self.recent.clear()
+            self.slow.clear()
+            self.statements.clear()
+
+
+tracer = Tracer()
+
+
+class TracedCursor(sqlite3.Cursor):
+    # El tiempo de una consulta incluye la lectura de sus filas: SQLite avanza la consulta a
+    # medida que se piden. La ejecución se registra al agotar las filas, al ejecutar otra
+    # sentencia en el cursor o al cerrarlo.
+    execution = None
+
+    def execute(self, sql, parameters=()):
+        self.begin(sql, parameters, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except BaseException:
+            self.execution.failed = True
+            raise
+        finally:
+            self.settle(start)
+
+    def executemany(self, sql, seq_of_parameters):
+        if isinstance(seq_of_parameters, (list, tuple)):
+            sample = seq_of_parameters[0] if seq_of_parameters else None
+        else:
+            sample = None  # Un iterador solo puede recorrerse una vez
+        self.begin(sql, f"{len(seq_of_parameters)} filas" if sample is not None else "(varias filas)", sample)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except BaseException:
+            self.execution.failed = True
+            raise
+        finally:
+            self.settle(start)
+
+    def begin(self, sql, parameters, sample):
+        self.finish()
+        key = normalize(sql)
+        if sample is not None and tracer.needs_plan(key):
+            tracer.set_plan(key, explain(self.connection, sql, sample), statement_text(self.connection, sql))
+        self.execution = Execution(sql, parameters, call_site())
+
+    def settle(self, start):
+        execution = self.execution
+        execution.seconds += time.perf_counter() - start
+        if self.description is None:
+            # Sin filas que leer (INSERT, UPDATE, DDL) o la sentencia falló
+            execution.rows = max(self.rowcount, 0)
+            self.finish()
+
+    def count(self, start, rows, exhausted):
+        execution = self.execution
+        if execution is None:
+            return
+        execution.seconds += time.perf_counter() - start
+        execution.rows += rows
+        if exhausted:
+            self.finish()
+
+    def finish(self):
+        execution = self.execution
+        if execution is not None:
+            self.execution = None
+            tracer.record(execution)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.count(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self.count(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.count(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.count(start, 0, True)
+            raise
+        except sqlite3.Error:
+            if self.execution is not None:
+                self.execution.failed = True
+            self.count(start, 0, True)
+            raise
+        self.count(start, 1, False)
+        return row
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        # Consultas de las que solo se leyó la primera fila (fetchone)
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    # Connection.execute de sqlite3 no pasa por Cursor.execute, por eso se redefine aquí
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+CONNECTION_FACTORY = TracedConnection if ENABLED else sqlite3.Connection
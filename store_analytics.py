@@ -0,0 +1,189 @@
+# Análisis de ventas de Mr Store: productos más vendidos, ventas por día de la semana y hora,
+# ticket promedio e ingresos por marca y por proveedor en un rango de fechas.
+# Requiere NumPy. Las columnas de un rango se leen de una vez y se agregan con operaciones
+# vectorizadas (bincount, unique, argsort) en lugar de recorrer las filas en Python.
+# Sin interfaz gráfica: lo usan la ventana Análisis y store_cli.
+import time
+from typing import Optional, TextIO
+
+import numpy as np
+
+import store_db
+
+TOP_PRODUCTS = 20
+WEEKDAYS = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+NO_PRODUCT = "(producto eliminado)"
+NO_BRAND = "(sin marca)"
+NO_PROVIDER = "(sin proveedor)"
+
+
+class SalesAnalysis:
+    # Resultado de analyze(). Los rankings son listas de (nombre, cantidad, ingresos); los mapas
+    # de calor son arreglos 7x24 (lunes a domingo, de 0 a 23 h).
+    def __init__(self, start_date: str, end_date: str):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.sales = 0
+        self.revenue = 0.0
+        self.items = 0.0  # Unidades vendidas (suma de cantidades)
+        self.average_ticket = 0.0
+        self.top_by_revenue = []
+        self.top_by_quantity = []
+        self.by_brand = []
+        self.by_provider = []
+        self.heatmap_sales = np.zeros((7, 24), dtype=np.int64)
+        self.heatmap_revenue = np.zeros((7, 24))
+        self.seconds = 0.0
+
+
+def int_column(text: Optional[str]) -> np.ndarray:
+    # Columna de enteros recibida como un solo texto separado por comas (NULL sin filas)
+    if not text:
+        return np.zeros(0, dtype=np.int64)
+    return np.fromstring(text, dtype=np.int64, sep=",")
+
+
+# Cada columna llega como un solo texto (group_concat) que NumPy convierte de una vez; así no
+# se crea un objeto de Python por cada valor. Importes en centavos y cantidades en milésimas
+# para que sean enteros. group_concat omite los NULL, por eso todas las columnas llevan COALESCE.
+# La base y cada año archivado se leen por separado: un agregado sobre ventas_historial copiaría
+# todas las columnas de la vista.
+
+def load_sales(connection, schemas: list, start_date: str, end_date: str) -> tuple[np.ndarray, np.ndarray]:
+    # (hora de cada venta como datetime64[h], total de cada venta)
+    where, params = store_db.date_range_filter(start_date, end_date)
+    where = store_db.and_where(where, "fecha IS NOT NULL")
+    hours, totals = [], []
+    for schema in schemas:
+        text, column = connection.execute(
+            "SELECT group_concat(SUBSTR(fecha,1,13)), "
+            "group_concat(CAST(ROUND(COALESCE(total, 0) * 100) AS INTEGER)) "
+            f"FROM {schema}.ventas" + where,
+            params
+        ).fetchone()
+        hours.append(np.array(text.split(",") if text else [], dtype="datetime64[h]"))
+        totals.append(int_column(column))
+    return np.concatenate(hours), np.concatenate(totals) / 100
+
+
+def load_items(connection, schemas: list, start_date: str, end_date: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (producto_id, cantidad, subtotal) de cada línea vendida; producto_id 0 si no tiene
+    where, params = store_db.date_range_filter(start_date, end_date, "v.fecha")
+    where = store_db.and_where(where, "v.fecha IS NOT NULL")
+    columns = []
+    for schema in schemas:
+        columns.append([int_column(text) for text in connection.execute(
+            "SELECT group_concat(COALESCE(i.producto_id, 0)), "
+            "group_concat(CAST(ROUND(COALESCE(i.cantidad, 0) * 1000) AS INTEGER)), "
+            "group_concat(CAST(ROUND(COALESCE(i.subtotal, 0) * 100) AS INTEGER)) "
+            f"FROM {schema}.venta_items i JOIN {schema}.ventas v ON v.id = i.venta_id" + where,
+            params
+        ).fetchone()])
+    product_ids, quantities, subtotals = (np.concatenate(column) for column in zip(*columns))
+    return product_ids, quantities / 1000, subtotals / 100
+
+
+def load_catalog(connection) -> tuple[np.ndarray, list, np.ndarray, np.ndarray]:
+    # (ids ordenados, nombres, marcas, proveedor_id) de los productos
+    rows = connection.execute(
+        "SELECT id, nombre, COALESCE(marca, ''), COALESCE(proveedor_id, 0) FROM productos ORDER BY id"
+    ).fetchall()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), [], np.zeros(0, dtype=str), np.zeros(0, dtype=np.int64)
+    ids, names, brands, providers = zip(*rows)
+    return (np.array(ids, dtype=np.int64), list(names), np.array(brands, dtype=str),
+            np.array(providers, dtype=np.int64))
+
+
+def ranking(names, quantities: np.ndarray, revenue: np.ndarray, order: np.ndarray, limit: Optional[int] = None) -> list:
+    # (nombre, cantidad, ingresos) en el orden dado, sin los grupos sin ventas
+    order = order[(quantities[order] != 0) | (revenue[order] != 0)][:limit]
+    return [(names[i], float(quantities[i]), float(revenue[i])) for i in order]
+
+
+def group_totals(keys: np.ndarray, quantities: np.ndarray, revenue: np.ndarray) -> tuple:
+    # Sumar por clave (marca, proveedor): (claves únicas, cantidades, ingresos)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return (unique, np.bincount(inverse, weights=quantities, minlength=len(unique)),
+            np.bincount(inverse, weights=revenue, minlength=len(unique)))
+
+
+def analyze(connection, start_date: str = "", end_date: str = "", top: int = TOP_PRODUCTS) -> SalesAnalysis:
+    # Lanza ValueError si alguna fecha no tiene el formato YYYY-MM-DD
+    started = time.perf_counter()
+    store_db.date_range_filter(start_date, end_date)  # Validar las fechas
+    schemas = store_db.history_schemas(connection, start_date, end_date)
+    analysis = SalesAnalysis(start_date, end_date)
+
+    # Ventas: ticket promedio y mapa de calor por día de la semana y hora
+    hours, totals = load_sales(connection, schemas, start_date, end_date)
+    analysis.sales = len(totals)
+    analysis.revenue = float(totals.sum())
+    analysis.average_ticket = float(totals.mean()) if len(totals) else 0.0
+    days = hours.astype("datetime64[D]")
+    weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 fue jueves; 0 = lunes
+    cells = weekdays * 24 + (hours - days).astype(np.int64)
+    analysis.heatmap_sales = np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+    analysis.heatmap_revenue = np.bincount(cells, weights=totals, minlength=7 * 24).reshape(7, 24)
+
+    # Líneas vendidas: totales por producto (la última posición junta los productos que ya
+    # no están en el catálogo)
+    product_ids, quantities, subtotals = load_items(connection, schemas, start_date, end_date)
+    ids, names, brands, providers = load_catalog(connection)
+    analysis.items = float(quantities.sum())
+    # Tabla id -> posición en el catálogo (los ids son enteros chicos y casi consecutivos)
+    lookup = np.full((ids[-1] if len(ids) else 0) + 2, len(ids), dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    positions = lookup[np.clip(product_ids, 0, len(lookup) - 1)]
+    product_quantities = np.bincount(positions, weights=quantities, minlength=len(ids) + 1)
+    product_revenue = np.bincount(positions, weights=subtotals, minlength=len(ids) + 1)
+
+    names = names + [NO_PRODUCT]
+    analysis.top_by_revenue = ranking(names, product_quantities, product_revenue,
+                                      np.argsort(-product_revenue, kind="stable"), top)
+    analysis.top_by_quantity = ranking(names, product_quantities, product_revenue,
+                                       np.argsort(-product_quantities, kind="stable"), top)
+
+    # Marcas y proveedores a partir de los totales por producto
+    brand_keys, brand_quantities, brand_revenue = group_totals(
+        np.append(brands, ""), product_quantities, product_revenue)
+    brand_names = [brand or NO_BRAND for brand in brand_keys.tolist()]
+    analysis.by_brand = ranking(brand_names, brand_quantities, brand_revenue,
+                                np.argsort(-brand_revenue, kind="stable"))
+
+    provider_keys, provider_quantities, provider_revenue = group_totals(
+        np.append(providers, 0), product_quantities, product_revenue)
+    provider_names = dict(connection.execute("SELECT id, nombre FROM proveedores").fetchall())
+    provider_names = [provider_names.get(key) or NO_PROVIDER for key in provider_keys.tolist()]
+    analysis.by_provider = ranking(provider_names, provider_quantities, provider_revenue,
+                                   np.argsort(-provider_revenue, kind="stable"))
+
+    analysis.seconds = time.perf_counter() - started
+    return analysis
+
+
+def write_report(analysis: SalesAnalysis, f: TextIO) -> None:
+    # Reporte de texto del análisis, con el mismo formato que el reporte de cortes
+    f.write("Análisis de Ventas - Mr Store\n")
+    f.write("="*50 + "\n\n")
+    if analysis.start_date or analysis.end_date:
+        f.write(f"Periodo: {analysis.start_date or 'Inicio'} - {analysis.end_date or 'Hoy'}\n\n")
+
+    f.write(f"Ventas: {analysis.sales}\n"
+            f"Ingresos: ${analysis.revenue:.2f}\n"
+            f"Ticket promedio: ${analysis.average_ticket:.2f}\n"
+            f"Unidades vendidas: {analysis.items:.10g}\n")
+
+    for title, rows in (("PRODUCTOS POR INGRESOS", analysis.top_by_revenue),
+                        ("PRODUCTOS POR CANTIDAD", analysis.top_by_quantity),
+                        ("MARCAS", analysis.by_brand),
+                        ("PROVEEDORES", analysis.by_provider)):
+        f.write(f"\n{title}\n" + "-"*50 + "\n")
+        for nombre, cantidad, ingresos in rows:
+            f.write(f"{nombre}: {cantidad:.10g} - ${ingresos:.2f}\n")
+
+    f.write("\nVENTAS POR DÍA Y HORA\n" + "-"*50 + "\n")
+    hours = [hour for hour in range(24) if analysis.heatmap_sales[:, hour].any()]
+    f.write(" " * 10 + "".join(f"{hour:>6}" for hour in hours) + "\n")
+    for weekday, name in enumerate(WEEKDAYS):
+        f.write(f"{name:<10}" + "".join(f"{analysis.heatmap_sales[weekday, hour]:>6}" for hour in hours) + "\n")
@@ -0,0 +1,261 @@
+# Tareas de Mr Store sin interfaz gráfica, para programarlas (cron, Programador de tareas)
+# fuera del horario de la tienda o en una computadora de oficina, sin cargar la caja.
+#
+#   python store_cli.py corte --db mr_store.db                     # corte de caja de hoy
+#   python store_cli.py corte --desde 2024-03-01 --hasta 2024-03-31
+#   python store_cli.py reporte --desde 2024-03-01 --hasta 2024-03-31 > cortes.txt
+#   python store_cli.py analisis --desde 2024-01-01 --hasta 2024-12-31 --top 50  # requiere NumPy
+#   python store_cli.py exportar ventas --desde 2024-03-01 --output ventas.csv.gz
+#   python store_cli.py exportar todo --output respaldo/mr_store.csv
+#   python store_cli.py archivar --hasta 2023-12 --compactar       # mover 2023 y antes a mr_store_archivo/
+#   python store_cli.py demanda                                     # puntos de reorden (panel Agotándose)
+#
+# El reporte y las exportaciones se escriben conforme se leen las filas, dentro de una sola
+# instantánea de lectura; con --output - (o sin --output en el reporte) van a la salida estándar.
+import argparse
+import contextlib
+import datetime
+import itertools
+import math
+import os
+import sqlite3
+import sys
+from typing import Iterator, Optional
+
+import store_db
+
+EXPORTS = ("inventario", "proveedores", "ventas", "todo")
+
+
+def fecha(value: str) -> str:
+    # Tipo de argparse: fecha AAAA-MM-DD
+    try:
+        datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida: {value} (use AAAA-MM-DD)")
+    return value
+
+
+def mes(value: str) -> str:
+    # Tipo de argparse: mes AAAA-MM
+    try:
+        datetime.datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"mes inválido: {value} (use AAAA-MM)")
+    return value
+
+
+def prepare(db_path: Optional[str]) -> None:
+    # Aplicar las migraciones pendientes, como al abrir la aplicación. Con el esquema al día
+    # no se abre la base para escritura (puede ser una copia de solo lectura). Si la base
+    # todavía no existe, connect la crea con el esquema completo.
+    try:
+        connection = store_db.connect_readonly(db_path)
+    except sqlite3.OperationalError:
+        current = False
+    else:
+        try:
+            current = store_db.schema_version(connection) >= store_db.SCHEMA_VERSION
+        finally:
+            connection.close()
+    if current:
+        return
+
+    connection = store_db.connect(db_path)
+    try:
+        store_db.create_tables(connection)
+    finally:
+        connection.close()
+
+
+@contextlib.contextmanager
+def snapshot(db_path: Optional[str]) -> Iterator[sqlite3.Connection]:
+    # Conexión de solo lectura dentro de una transacción: todo lo que se lee es de la misma instantánea
+    connection = store_db.connect_readonly(db_path)
+    try:
+        connection.execute("BEGIN")
+        yield connection
+    finally:
+        connection.close()
+
+
+def days_between(start_date: str, end_date: str) -> Iterator[str]:
+    dia = start_date
+    while dia <= end_date:
+        yield dia
+        dia = store_db.next_day(dia)
+
+
+def run_corte(db_path: Optional[str], dia: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> int:
+    # Registrar (o actualizar) el corte de un día o de cada día de un rango
+    today = datetime.date.today().strftime("%Y-%m-%d")
+    if start_date or end_date:
+        dias = days_between(start_date or end_date, end_date or today)
+    else:
+        dias = [dia or today]
+
+    connection = store_db.connect(db_path)
+    try:
+        for dia in dias:
+            num_ventas, total_ingresos = store_db.save_corte(connection, dia)
+            print(f"{dia}  {num_ventas} ventas  ${total_ingresos:.2f}", flush=True)
+    finally:
+        connection.close()
+    return 0
+
+
+def run_reporte(db_path: Optional[str], start_date: str, end_date: str, output: str) -> int:
+    with snapshot(db_path) as connection:
+        if output == "-":
+            store_db.write_cortes_report(connection, sys.stdout, start_date, end_date)
+        else:
+            with open(output, "w", encoding="utf-8") as f:
+                num_ventas = store_db.write_cortes_report(connection, f, start_date, end_date)
+            print(f"Reporte de {num_ventas} ventas guardado en {output}", file=sys.stderr)
+    return 0
+
+
+def run_analisis(db_path: Optional[str], start_date: str, end_date: str, top: int, output: str) -> int:
+    try:
+        import store_analytics  # Requiere NumPy; las demás tareas funcionan sin él
+    except ImportError:
+        print("El análisis de ventas necesita NumPy (pip install numpy)", file=sys.stderr)
+        return 1
+
+    with snapshot(db_path) as connection:
+        analysis = store_analytics.analyze(connection, start_date, end_date, top)
+    if output == "-":
+        store_analytics.write_report(analysis, sys.stdout)
+    else:
+        with open(output, "w", encoding="utf-8") as f:
+            store_analytics.write_report(analysis, f)
+        print(f"Análisis de {analysis.sales} ventas guardado en {output}", file=sys.stderr)
+    return 0
+
+
+def export_jobs(what: str, output: str, start_date: str, end_date: str) -> list:
+    # (ruta, encabezados, consulta, parámetros) de cada archivo, con los mismos nombres que
+    # la exportación de la aplicación
+    if what == "inventario":
+        return [(output, *store_db.inventory_export())]
+    if what == "proveedores":
+        return [(output, *store_db.providers_export())]
+    if what == "ventas":
+        return [(output, *store_db.sales_export(start_date, end_date))]
+
+    base_path, suffix = store_db.full_export_base(output)
+    return [(f"{base_path}_{table_name}{suffix}", *spec) for table_name, spec in store_db.full_export().items()]
+
+
+def run_exportar(db_path: Optional[str], what: str, start_date: str, end_date: str, output: str) -> int:
+    if what == "todo" and output == "-":
+        print("exportar todo escribe un archivo por tabla: indique --output", file=sys.stderr)
+        return 2
+
+    with snapshot(db_path) as connection:
+        for path, headers, query, params in export_jobs(what, output, start_date, end_date):
+            if path == "-":
+                store_db.export_rows(connection, sys.stdout, headers, query, params)
+            else:
+                rows = store_db.export_query(connection, path, headers, query, params)
+                print(f"{rows} filas exportadas a {path}", file=sys.stderr, flush=True)
+    return 0
+
+
+def run_archivar(db_path: Optional[str], through_month: str, compact: bool) -> int:
+    # Mover a los archivos anuales las ventas de los meses cerrados hasta through_month
+    connection = store_db.connect(db_path)
+    try:
+        moved = store_db.archive_sales(
+            connection, through_month,
+            lambda mes, ventas: print(f"{mes}  {ventas} ventas archivadas", flush=True)
+        )
+        print(f"{moved} ventas movidas a {store_db.archive_dir(connection)}", file=sys.stderr)
+        if compact and moved:
+            # El espacio liberado se reutiliza para ventas nuevas; VACUUM además achica el archivo
+            connection.execute("VACUUM")
+    finally:
+        connection.close()
+    return 0
+
+
+def run_demanda(db_path: Optional[str]) -> int:
+    # Recalcular la venta diaria y el punto de reorden de cada producto y listar los que
+    # están en su punto de reorden, por proveedor
+    connection = store_db.connect(db_path)
+    try:
+        with_sales = store_db.update_demand(connection)
+        low = store_db.low_stock(connection)
+    finally:
+        connection.close()
+
+    # Agrupar por (proveedor_id, nombre): dos proveedores pueden llamarse igual
+    for (proveedor_id, proveedor), rows in itertools.groupby(low, key=lambda row: row[:2]):
+        print(proveedor or "Sin proveedor")
+        for _, _, product_id, nombre, stock, punto, dias, pedido in rows:
+            print(f"  {nombre}: stock {stock}, reorden {punto:.1f}, {dias:.1f} días, pedir {math.ceil(pedido)}")
+    print(f"{with_sales} productos con ventas, {len(low)} en su punto de reorden", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cortes de caja, reportes y exportaciones de Mr Store sin interfaz")
+    parser.add_argument("--db", default=None, help="base de datos (por defecto MRSTORE_DB o mr_store.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    corte_parser = commands.add_parser("corte", help="registrar el corte de caja de un día o de un rango de días")
+    corte_parser.add_argument("--fecha", type=fecha, help="día del corte (por defecto hoy)")
+    corte_parser.add_argument("--desde", type=fecha, help="primer día del rango")
+    corte_parser.add_argument("--hasta", type=fecha, help="último día del rango (por defecto hoy)")
+
+    report_parser = commands.add_parser("reporte", help="reporte de cortes de caja en texto")
+    report_parser.add_argument("--desde", type=fecha)
+    report_parser.add_argument("--hasta", type=fecha)
+    report_parser.add_argument("--output", default="-", help="archivo de salida (- para la salida estándar)")
+
+    analysis_parser = commands.add_parser("analisis", help="productos más vendidos, ventas por día y hora, marcas y proveedores")
+    analysis_parser.add_argument("--desde", type=fecha)
+    analysis_parser.add_argument("--hasta", type=fecha)
+    analysis_parser.add_argument("--top", type=int, default=20, help="productos en cada ranking (por defecto 20)")
+    analysis_parser.add_argument("--output", default="-", help="archivo de salida (- para la salida estándar)")
+
+    export_parser = commands.add_parser("exportar", help="exportar a CSV (o CSV.gz si la ruta termina en .gz)")
+    export_parser.add_argument("que", choices=EXPORTS)
+    export_parser.add_argument("--desde", type=fecha, help="solo ventas desde este día")
+    export_parser.add_argument("--hasta", type=fecha, help="solo ventas hasta este día")
+    export_parser.add_argument("--output", default="-", help="archivo de salida (- para la salida estándar)")
+
+    archive_parser = commands.add_parser("archivar", help="mover las ventas de meses cerrados a archivos por año")
+    archive_parser.add_argument("--hasta", type=mes, required=True, help="último mes que se archiva (AAAA-MM)")
+    archive_parser.add_argument("--compactar", action="store_true", help="compactar la base después (VACUUM)")
+
+    commands.add_parser("demanda", help="recalcular los puntos de reorden y listar los productos agotándose")
+
+    args = parser.parse_args(argv)
+    if args.command == "corte" and args.fecha and (args.desde or args.hasta):
+        parser.error("use --fecha o --desde/--hasta, no ambos")
+
+    try:
+        prepare(args.db)
+        if args.command == "corte":
+            return run_corte(args.db, args.fecha, args.desde, args.hasta)
+        if args.command == "reporte":
+            return run_reporte(args.db, args.desde or "", args.hasta or "", args.output)
+        if args.command == "analisis":
+            return run_analisis(args.db, args.desde or "", args.hasta or "", args.top, args.output)
+        if args.command == "archivar":
+            return run_archivar(args.db, args.hasta, args.compactar)
+        if args.command == "demanda":
+            return run_demanda(args.db)
+        return run_exportar(args.db, args.que, args.desde or "", args.hasta or "", args.output)
+    except BrokenPipeError:
+        # Se cerró la salida antes de terminar (por ejemplo "| head"); evitar otro error al salir
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,1492 @@
+# Capa de acceso a datos de Mr Store.
+# Funciones sin interfaz gráfica (no importa tkinter ni PIL): reciben una conexión sqlite3
+# y devuelven filas o iteradores, para poder usarlas desde StoreApp, reportes o mediciones.
+import contextlib
+import csv
+import datetime
+import gzip
+import math
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+from typing import Callable, Iterable, Iterator, Optional, Sequence, TextIO
+
+import sql_trace
+
+# Ruta de la base de datos; MRSTORE_DB permite usar otra (tmpfs, ":memory:", mediciones)
+DB_PATH = os.environ.get("MRSTORE_DB", "mr_store.db")
+
+# Ajustes por conexión: ~16 MB de caché de páginas, lectura por mmap de hasta 256 MB y espera
+# (en lugar de "database is locked") mientras otra conexión escribe
+CACHE_SIZE_KB = 16 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+BUSY_TIMEOUT_MS = 5000
+
+ProgressCallback = Callable[[int], None]
+
+
+class StockInsuficienteError(ValueError):
+    # La venta pide más de lo que hay en existencia; no se modificó la base de datos
+    pass
+
+
+# ----------------------------------------------------------------------------
+# Conexión y esquema
+# ----------------------------------------------------------------------------
+
+def configure(connection: sqlite3.Connection) -> None:
+    connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    connection.execute("PRAGMA temp_store = MEMORY")
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    # Conexión de escritura. Con WAL los lectores no bloquean las ventas ni al revés;
+    # synchronous=NORMAL es seguro en WAL y evita un fsync por cada venta.
+    connection = sqlite3.connect(path or DB_PATH, factory=sql_trace.CONNECTION_FACTORY)
+    sql_trace.tracer.log_beside(path or DB_PATH)
+    configure(connection)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    attach_archives(connection)
+    return connection
+
+
+def connect_readonly(path: Optional[str] = None) -> sqlite3.Connection:
+    # Conexión de solo lectura que puede usarse desde otro hilo (una vez a la vez).
+    # isolation_level=None: las transacciones se abren explícitamente con BEGIN.
+    uri = pathlib.Path(path or DB_PATH).absolute().as_uri() + "?mode=ro"
+    connection = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False,
+                                 factory=sql_trace.CONNECTION_FACTORY)
+    sql_trace.tracer.log_beside(path or DB_PATH)
+    configure(connection)
+    attach_archives(connection, readonly=True)
+    return connection
+
+
+class ConnectionPool:
+    # Una conexión de escritura (ventas, stock, catálogo) y hasta max_readers conexiones de
+    # solo lectura para reportes, historial y exportaciones, reutilizadas entre hilos.
+    # Con readonly también la principal es de solo lectura: una terminal cuya base es del
+    # servidor de la tienda (store_server) no escribe en ella ni la migra.
+    def __init__(self, path: Optional[str] = None, max_readers: int = 4, readonly: bool = False):
+        self.path = path or DB_PATH
+        self.in_memory = self.path == ":memory:"
+        self.readonly = readonly
+        self.writer = connect_readonly(self.path) if readonly else connect(self.path)
+        self.idle_readers = []
+        self.lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(max_readers)
+
+    @contextlib.contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        # Conexión de lectura dentro de una transacción: todas las consultas del bloque ven la
+        # misma instantánea de la base aunque se registren ventas mientras tanto
+        if self.in_memory:
+            # Una base en memoria solo existe en su conexión
+            yield self.writer
+            return
+
+        with self.available:
+            with self.lock:
+                connection = self.idle_readers.pop() if self.idle_readers else None
+            if connection is None:
+                connection = connect_readonly(self.path)
+            else:
+                refresh_archives(connection, readonly=True)
+            connection.execute("BEGIN")
+            try:
+                yield connection
+            finally:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                with self.lock:
+                    self.idle_readers.append(connection)
+
+    def close(self) -> None:
+        with self.lock:
+            for connection in self.idle_readers:
+                connection.close()
+            self.idle_readers = []
+        self.writer.close()
+
+
+def table_exists(connection: sqlite3.Connection, name: str) -> bool:
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def column_exists(connection: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in connection.execute(f"PRAGMA table_info({table})"))
+
+
+def add_column(connection: sqlite3.Connection, table: str, column: str, definition: str) -> None:
+    if not column_exists(connection, table, column):
+        connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# Migraciones del esquema, en orden. PRAGMA user_version guarda cuántas se aplicaron; cada una
+# tolera una base creada por versiones anteriores sin número (tablas o columnas ya existentes).
+
+def migrate_base_tables(connection: sqlite3.Connection) -> None:
+    cursor = connection.cursor()
+    cursor.execute("""CREATE TABLE IF NOT EXISTS productos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT,
+        marca TEXT,
+        precio REAL,
+        unidad TEXT,
+        stock INTEGER,
+        imagen TEXT,
+        proveedor_id INTEGER,
+        FOREIGN KEY (proveedor_id) REFERENCES proveedores (id))""")
+    cursor.execute("""CREATE TABLE IF NOT EXISTS proveedores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT,
+        contacto TEXT)""")
+    cursor.execute("""CREATE TABLE IF NOT EXISTS ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto TEXT,
+        cantidad REAL,
+        total REAL,
+        fecha TEXT)""")
+    cursor.execute("""CREATE TABLE IF NOT EXISTS cortes_de_caja (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TEXT,
+        num_ventas INTEGER,
+        total_ingresos REAL)""")
+
+    # Índice para las búsquedas por fecha (día, rango, últimas ventas)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas (fecha)")
+
+    # Bases anteriores a los proveedores no tienen la columna proveedor_id
+    add_column(connection, "productos", "proveedor_id", "INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_proveedor ON productos (proveedor_id)")
+
+
+def migrate_venta_items(connection: sqlite3.Connection) -> None:
+    # Detalle normalizado de cada venta (una fila por producto)
+    items_nuevos = not table_exists(connection, "venta_items")
+    cursor = connection.cursor()
+    cursor.execute("""CREATE TABLE IF NOT EXISTS venta_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        venta_id INTEGER NOT NULL,
+        producto_id INTEGER,
+        nombre TEXT,
+        unidad TEXT,
+        cantidad REAL,
+        precio_unitario REAL,
+        subtotal REAL,
+        FOREIGN KEY (venta_id) REFERENCES ventas (id),
+        FOREIGN KEY (producto_id) REFERENCES productos (id))""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_venta_items_venta ON venta_items (venta_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_venta_items_producto ON venta_items (producto_id)")
+    connection.commit()
+
+    # Migrar el detalle de texto de las ventas existentes
+    if items_nuevos:
+        backfill_venta_items(connection)
+
+
+def migrate_rollups(connection: sqlite3.Connection) -> None:
+    # Resúmenes de ventas por día y por mes, actualizados con cada venta
+    resumen_nuevo = not table_exists(connection, "ventas_diarias")
+    cursor = connection.cursor()
+    cursor.execute("""CREATE TABLE IF NOT EXISTS ventas_diarias (
+        dia TEXT PRIMARY KEY,
+        num_ventas INTEGER NOT NULL DEFAULT 0,
+        ingresos REAL NOT NULL DEFAULT 0,
+        num_articulos INTEGER NOT NULL DEFAULT 0)""")
+    cursor.execute("""CREATE TABLE IF NOT EXISTS ventas_mensuales (
+        mes TEXT PRIMARY KEY,
+        num_ventas INTEGER NOT NULL DEFAULT 0,
+        ingresos REAL NOT NULL DEFAULT 0,
+        num_articulos INTEGER NOT NULL DEFAULT 0)""")
+    connection.commit()
+
+    if resumen_nuevo:
+        rebuild_rollups(connection)
+
+
+def migrate_product_images_and_codes(connection: sqlite3.Connection) -> None:
+    # Hash del contenido de la imagen (miniatura en image_cache); NULL = pendiente, '' = sin imagen
+    add_column(connection, "productos", "miniatura", "TEXT")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS productos_imagen_update AFTER UPDATE OF imagen ON productos
+        WHEN old.imagen IS NOT new.imagen BEGIN
+            UPDATE productos SET miniatura = NULL WHERE id = new.id;
+        END""")
+
+    # Código de barras / SKU: único, NULL si el producto no tiene
+    add_column(connection, "productos", "codigo", "TEXT")
+    connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_codigo ON productos (codigo)")
+
+
+def create_search_index(connection: sqlite3.Connection) -> bool:
+    # Índice FTS5 (trigramas) sobre nombre, marca y proveedor, sincronizado con triggers.
+    # Devuelve False si SQLite no tiene FTS5 o el tokenizador trigram; la búsqueda usa LIKE.
+    fts_nuevo = not table_exists(connection, "productos_fts")
+    try:
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(nombre, marca, proveedor, tokenize = 'trigram')"
+        )
+    except sqlite3.OperationalError:
+        return False
+
+    connection.executescript("""
+        CREATE TRIGGER IF NOT EXISTS productos_fts_insert AFTER INSERT ON productos BEGIN
+            INSERT INTO productos_fts (rowid, nombre, marca, proveedor)
+            VALUES (new.id, new.nombre, new.marca, (SELECT nombre FROM proveedores WHERE id = new.proveedor_id));
+        END;
+        CREATE TRIGGER IF NOT EXISTS productos_fts_delete AFTER DELETE ON productos BEGIN
+            DELETE FROM productos_fts WHERE rowid = old.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS productos_fts_update AFTER UPDATE OF id, nombre, marca, proveedor_id ON productos BEGIN
+            DELETE FROM productos_fts WHERE rowid = old.id;
+            INSERT INTO productos_fts (rowid, nombre, marca, proveedor)
+            VALUES (new.id, new.nombre, new.marca, (SELECT nombre FROM proveedores WHERE id = new.proveedor_id));
+        END;
+        CREATE TRIGGER IF NOT EXISTS proveedores_fts_insert AFTER INSERT ON proveedores BEGIN
+            UPDATE productos_fts SET proveedor = new.nombre
+            WHERE rowid IN (SELECT id FROM productos WHERE proveedor_id = new.id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS proveedores_fts_update AFTER UPDATE OF id, nombre ON proveedores BEGIN
+            UPDATE productos_fts SET proveedor = NULL
+            WHERE rowid IN (SELECT id FROM productos WHERE proveedor_id = old.id);
+            UPDATE productos_fts SET proveedor = new.nombre
+            WHERE rowid IN (SELECT id FROM productos WHERE proveedor_id = new.id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS proveedores_fts_delete AFTER DELETE ON proveedores BEGIN
+            UPDATE productos_fts SET proveedor = NULL
+            WHERE rowid IN (SELECT id FROM productos WHERE proveedor_id = old.id);
+        END;
+    """)
+
+    if fts_nuevo:
+        connection.execute("""
+            INSERT INTO productos_fts (rowid, nombre, marca, proveedor)
+            SELECT p.id, p.nombre, p.marca, pr.nombre
+            FROM productos p
+            LEFT JOIN proveedores pr ON p.proveedor_id = pr.id
+        """)
+    return True
+
+
+def migrate_archive_catalog(connection: sqlite3.Connection) -> None:
+    # Años con ventas movidas a un archivo (ver archive_sales): primer y último mes archivados
+    connection.execute("""CREATE TABLE IF NOT EXISTS archivos (
+        anio TEXT PRIMARY KEY,
+        desde TEXT NOT NULL,
+        hasta TEXT NOT NULL,
+        num_ventas INTEGER NOT NULL DEFAULT 0)""")
+
+
+def migrate_demand(connection: sqlite3.Connection) -> None:
+    # Demanda de cada producto, calculada por lotes (ver compute_demand): unidades vendidas por
+    # día y punto de reorden; 0 si no se ha vendido en DEMAND_DAYS
+    add_column(connection, "productos", "venta_diaria", "REAL NOT NULL DEFAULT 0")
+    add_column(connection, "productos", "punto_reorden", "REAL NOT NULL DEFAULT 0")
+    # Índice parcial sobre stock - punto_reorden: el panel Agotándose lee solo los productos en
+    # su punto de reorden o por debajo, sin recorrer el inventario
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_productos_agotandose ON productos (stock - punto_reorden) "
+                       "WHERE punto_reorden > 0")
+
+
+MIGRATIONS = [
+    migrate_base_tables,
+    migrate_venta_items,
+    migrate_rollups,
+    migrate_product_images_and_codes,
+    create_search_index,
+    migrate_archive_catalog,
+    migrate_demand,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def create_tables(connection: sqlite3.Connection) -> bool:
+    # Aplicar las migraciones pendientes; con el esquema al día solo se lee user_version.
+    # Devuelve True si la búsqueda FTS5 está disponible.
+    version = schema_version(connection)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(connection)
+        connection.execute(f"PRAGMA user_version = {number}")
+        connection.commit()
+    if version < SCHEMA_VERSION:
+        attach_archives(connection)  # connect() no crea las vistas sobre un esquema atrasado
+    if table_exists(connection, "productos_fts"):
+        return True
+    # La migración del índice no lo creó porque SQLite no tenía FTS5, pero user_version ya pasó
+    # de ella para no detener las demás: se reintenta al abrir, por si ahora sí está disponible
+    fts_enabled = create_search_index(connection)
+    connection.commit()
+    return fts_enabled
+
+
+# ----------------------------------------------------------------------------
+# Fechas
+# ----------------------------------------------------------------------------
+
+def next_day(fecha: str) -> str:
+    # Día siguiente a una fecha YYYY-MM-DD, límite superior de un rango [día, día+1)
+    dia = datetime.datetime.strptime(fecha, "%Y-%m-%d").date()
+    return (dia + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def date_range_filter(start_date: str, end_date: str, column: str = "fecha") -> tuple[str, list]:
+    # Construye un filtro semiabierto sobre una columna de fecha que aprovecha su índice.
+    # Lanza ValueError si alguna fecha no tiene el formato YYYY-MM-DD.
+    conditions = []
+    params = []
+
+    if start_date:
+        datetime.datetime.strptime(start_date, "%Y-%m-%d")  # Validar formato
+        conditions.append(f"{column} >= ?")
+        params.append(start_date)
+
+    if end_date:
+        conditions.append(f"{column} < ?")
+        params.append(next_day(end_date))
+
+    if not conditions:
+        return "", []
+    return " WHERE " + " AND ".join(conditions), params
+
+
+def and_where(where: str, condition: str) -> str:
+    # Agregar una condición a un WHERE que puede estar vacío
+    return (where + " AND " if where else " WHERE ") + condition
+
+
+# ----------------------------------------------------------------------------
+# Catálogo de productos y proveedores
+# ----------------------------------------------------------------------------
+
+class ProductCatalog:
+    # Copia en memoria de productos y proveedores compartida por todas las ventanas.
+    # Se carga una sola vez; las rutas de escritura la actualizan en lugar de volver a consultar.
+    PRODUCT_COLUMNS = "id, nombre, marca, precio, stock, unidad, proveedor_id, miniatura"
+
+    def __init__(self, db_connection: sqlite3.Connection):
+        self.db_connection = db_connection
+        self.products = None  # id -> (id, nombre, marca, precio, stock, unidad, proveedor_id, miniatura)
+        self.providers = None  # id -> nombre
+        self.by_name = {}  # nombre -> id
+        self.sorted_rows = None
+
+    def load(self) -> None:
+        if self.products is not None:
+            return
+        rows = self.db_connection.execute(f"SELECT {self.PRODUCT_COLUMNS} FROM productos").fetchall()
+        self.products = {row[0]: row for row in rows}
+        self.by_name = {}
+        for row in sorted(rows, reverse=True):
+            self.by_name[row[1]] = row[0]  # Con nombres repetidos gana el id más bajo
+        self.providers = dict(self.db_connection.execute("SELECT id, nombre FROM proveedores").fetchall())
+        self.sorted_rows = None
+
+    def invalidate(self) -> None:
+        self.products = None
+        self.providers = None
+        self.by_name = {}
+        self.sorted_rows = None
+
+    def product_rows(self) -> list:
+        # Productos ordenados por nombre: (id, nombre, marca, precio, stock, unidad)
+        self.load()
+        if self.sorted_rows is None:
+            self.sorted_rows = sorted((row[:6] for row in self.products.values()),
+                                      key=lambda row: (row[1] or "", row[0]))
+        return self.sorted_rows
+
+    def get_product(self, product_id: int) -> Optional[tuple]:
+        self.load()
+        return self.products.get(product_id)
+
+    def find_by_name(self, nombre: str) -> Optional[int]:
+        self.load()
+        return self.by_name.get(nombre)
+
+    def provider_options(self) -> list[str]:
+        # Opciones "Nombre (ID: n)" para los combobox de proveedor
+        self.load()
+        return [f"{nombre} (ID: {provider_id})" for provider_id, nombre in self.providers.items()]
+
+    def refresh_product(self, product_id: int) -> None:
+        # Releer un producto después de insertarlo o editarlo
+        if self.products is None:
+            return
+        row = self.db_connection.execute(
+            f"SELECT {self.PRODUCT_COLUMNS} FROM productos WHERE id = ?", (product_id,)
+        ).fetchone()
+        self.remove_product(product_id)
+        if row:
+            self.products[product_id] = row
+            self.by_name.setdefault(row[1], product_id)
+
+    def remove_product(self, product_id: int) -> None:
+        if self.products is None:
+            return
+        row = self.products.pop(product_id, None)
+        if row and self.by_name.get(row[1]) == product_id:
+            del self.by_name[row[1]]
+            for other in sorted(self.products.values()):
+                if other[1] == row[1]:
+                    self.by_name[row[1]] = other[0]
+                    break
+        self.sorted_rows = None
+
+    def apply_rows(self, rows: Iterable[Sequence]) -> None:
+        # Reemplazar productos con filas (PRODUCT_COLUMNS) recibidas de otra fuente, p. ej. el servidor
+        if self.products is None:
+            return
+        for row in rows:
+            row = tuple(row)
+            self.remove_product(row[0])
+            self.products[row[0]] = row
+            self.by_name.setdefault(row[1], row[0])
+        self.sorted_rows = None
+
+    def set_stock(self, product_id: int, stock: float) -> None:
+        if self.products is None or product_id not in self.products:
+            return
+        row = self.products[product_id]
+        self.products[product_id] = row[:4] + (stock,) + row[5:]
+        self.sorted_rows = None
+
+    def adjust_stock(self, quantities: dict) -> None:
+        # Descontar lo vendido: quantities es {product_id: cantidad}
+        if self.products is None:
+            return
+        for product_id, cantidad in quantities.items():
+            row = self.products.get(product_id)
+            if row:
+                stock = row[4] - cantidad
+                # Igual que la afinidad INTEGER de la columna: 3 - 2.0 se guarda como 1
+                self.set_stock(product_id, int(stock) if float(stock).is_integer() else stock)
+
+    def refresh_provider(self, provider_id: int) -> None:
+        if self.providers is None:
+            return
+        row = self.db_connection.execute("SELECT nombre FROM proveedores WHERE id = ?", (provider_id,)).fetchone()
+        if row:
+            self.providers[provider_id] = row[0]
+        else:
+            self.providers.pop(provider_id, None)
+
+    def remove_provider(self, provider_id: int) -> None:
+        if self.providers is not None:
+            self.providers.pop(provider_id, None)
+
+
+def count_products(connection: sqlite3.Connection) -> int:
+    return connection.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+
+
+def count_providers(connection: sqlite3.Connection) -> int:
+    return connection.execute("SELECT COUNT(*) FROM proveedores").fetchone()[0]
+
+
+def search_products(connection: sqlite3.Connection, search_term: str, fts_enabled: bool = True) -> list:
+    # Productos del inventario (con nombre del proveedor) que coinciden con el texto buscado:
+    # (id, nombre, marca, precio, unidad, stock, proveedor, punto de reorden)
+    palabras = search_term.split()
+    select = "SELECT p.id, p.nombre, p.marca, p.precio, p.unidad, p.stock, pr.nombre, p.punto_reorden "
+
+    if not palabras:
+        return connection.execute(select + """
+            FROM productos p
+            LEFT JOIN proveedores pr ON p.proveedor_id = pr.id
+            ORDER BY p.nombre
+        """).fetchall()
+
+    if fts_enabled and all(len(palabra) >= 3 for palabra in palabras):
+        # Cada palabra como frase entre comillas; el trigram encuentra subcadenas en cualquier columna
+        match = " ".join('"' + palabra.replace('"', '""') + '"' for palabra in palabras)
+        return connection.execute(select + """
+            FROM productos_fts f
+            JOIN productos p ON p.id = f.rowid
+            LEFT JOIN proveedores pr ON p.proveedor_id = pr.id
+            WHERE productos_fts MATCH ?
+            ORDER BY p.nombre
+        """, (match,)).fetchall()
+
+    # Textos de menos de 3 letras no se pueden buscar por trigramas
+    return connection.execute(select + """
+        FROM productos p
+        LEFT JOIN proveedores pr ON p.proveedor_id = pr.id
+        WHERE p.nombre LIKE ? OR p.marca LIKE ? OR pr.nombre LIKE ?
+        ORDER BY p.nombre
+    """, (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%")).fetchall()
+
+
+def list_products(connection: sqlite3.Connection) -> list:
+    # (id, nombre, marca, precio, unidad, stock, proveedor_id)
+    return connection.execute(
+        "SELECT id, nombre, marca, precio, unidad, stock, proveedor_id FROM productos"
+    ).fetchall()
+
+
+def list_providers(connection: sqlite3.Connection) -> list:
+    # (id, nombre, contacto)
+    return connection.execute("SELECT id, nombre, contacto FROM proveedores").fetchall()
+
+
+def list_providers_with_counts(connection: sqlite3.Connection) -> list:
+    # (id, nombre, contacto, número de productos), ordenados por nombre
+    return connection.execute("""
+        SELECT pr.id, pr.nombre, pr.contacto, COUNT(p.id)
+        FROM proveedores pr
+        LEFT JOIN productos p ON p.proveedor_id = pr.id
+        GROUP BY pr.id
+        ORDER BY pr.nombre
+    """).fetchall()
+
+
+def provider_products(connection: sqlite3.Connection, provider_id: int) -> list:
+    # (id, nombre, marca, precio, stock) de un proveedor
+    return connection.execute(
+        "SELECT id, nombre, marca, precio, stock FROM productos WHERE proveedor_id = ? ORDER BY nombre",
+        (provider_id,)
+    ).fetchall()
+
+
+def insert_product(connection: sqlite3.Connection, nombre: str, marca: str, precio: float, unidad: str,
+                   stock: int, imagen: str, proveedor_id: Optional[int], codigo: Optional[str] = None) -> int:
+    # Lanza sqlite3.IntegrityError si el código ya pertenece a otro producto
+    cursor = connection.execute(
+        "INSERT INTO productos (nombre, marca, precio, unidad, stock, imagen, proveedor_id, codigo) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (nombre, marca, precio, unidad, stock, imagen, proveedor_id, normalize_code(codigo))
+    )
+    connection.commit()
+    return cursor.lastrowid
+
+
+def normalize_code(codigo: Optional[str]) -> Optional[str]:
+    # Un código vacío se guarda como NULL para no chocar con el índice único
+    codigo = (codigo or "").strip()
+    return codigo or None
+
+
+def find_product_by_code(connection: sqlite3.Connection, codigo: str) -> Optional[int]:
+    # Id del producto con ese código de barras (búsqueda por el índice único)
+    row = connection.execute("SELECT id FROM productos WHERE codigo = ?", (normalize_code(codigo),)).fetchone()
+    return row[0] if row else None
+
+
+def insert_provider(connection: sqlite3.Connection, nombre: str, contacto: str) -> int:
+    cursor = connection.execute(
+        "INSERT INTO proveedores (nombre, contacto) VALUES (?, ?)",
+        (nombre, contacto)
+    )
+    connection.commit()
+    return cursor.lastrowid
+
+
+def update_stock(connection: sqlite3.Connection, product_id: int, stock: int, commit: bool = True) -> None:
+    connection.execute("UPDATE productos SET stock = ? WHERE id = ?", (stock, product_id))
+    if commit:
+        connection.commit()
+
+
+# Columnas que mantiene el programa (miniatura, demanda); no se muestran al editar
+PROGRAM_COLUMNS = ("miniatura", "venta_diaria", "punto_reorden")
+
+
+def table_columns(connection: sqlite3.Connection, table: str) -> list[str]:
+    # Columnas editables de una tabla (sin las que mantiene el programa)
+    return [col[1] for col in connection.execute(f"PRAGMA table_info({table})") if col[1] not in PROGRAM_COLUMNS]
+
+
+def get_record(connection: sqlite3.Connection, table: str, record_id: int) -> Optional[dict]:
+    # Valores actuales de las columnas editables de un registro
+    columns = table_columns(connection, table)
+    row = connection.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE id = ?", (record_id,)).fetchone()
+    return dict(zip(columns, row)) if row else None
+
+
+def pending_thumbnails(connection: sqlite3.Connection) -> list:
+    # (id, imagen) de los productos con imagen cuya miniatura no se ha generado
+    return connection.execute(
+        "SELECT id, imagen FROM productos WHERE miniatura IS NULL AND imagen IS NOT NULL AND imagen <> ''"
+    ).fetchall()
+
+
+def set_thumbnails(connection: sqlite3.Connection, thumbnails: Iterable[tuple]) -> None:
+    # Guardar pares (producto_id, hash de la miniatura); '' marca una imagen que no se pudo leer
+    connection.executemany("UPDATE productos SET miniatura = ? WHERE id = ?",
+                           [(digest, product_id) for product_id, digest in thumbnails])
+    connection.commit()
+
+
+def update_record(connection: sqlite3.Connection, table: str, record_id: int, values: dict) -> None:
+    # Actualizar las columnas de un registro; en ventas también se mueven los resúmenes
+    if table == "productos" and "codigo" in values:
+        values = dict(values, codigo=normalize_code(values["codigo"]))
+    set_clause = ", ".join([f"{campo} = ?" for campo in values.keys()])
+    schema = None
+    try:
+        if table == "ventas":
+            # La venta puede estar en un año archivado; los resúmenes están en la base.
+            # Restar los valores anteriores de los resúmenes y sumar los nuevos.
+            schema = sale_schema(connection, record_id)
+            if schema is None:
+                raise ValueError(f"La venta #{record_id} no existe")
+            table = f"{schema}.ventas"
+            anterior = sale_rollup_values(connection, record_id, schema)
+            update_rollups(connection, anterior[0], -1, -anterior[1], -anterior[2])
+
+        connection.execute(
+            f"UPDATE {table} SET {set_clause} WHERE id = ?",
+            (*values.values(), record_id)
+        )
+
+        if schema is not None:
+            nuevo = sale_rollup_values(connection, record_id, schema)
+            update_rollups(connection, nuevo[0], 1, nuevo[1], nuevo[2])
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def delete_record(connection: sqlite3.Connection, table: str, record_id: int) -> None:
+    try:
+        if table == "ventas":
+            delete_sale(connection, record_id)
+        else:
+            connection.execute(f"DELETE FROM {table} WHERE id = ?", (record_id,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+# ----------------------------------------------------------------------------
+# Ventas
+# ----------------------------------------------------------------------------
+
+def parse_detalle(detalle: str) -> list[tuple]:
+    # Convierte "Nombre: 2.0 Piezas - $30.00; ..." en (nombre, cantidad, unidad, subtotal)
+    items = []
+    for parte in (detalle or "").split("; "):
+        match = re.match(r"^(.*): (-?[\d.]+) (\S+) - \$(-?[\d.]+)$", parte.strip())
+        if match:
+            items.append((match.group(1), float(match.group(2)), match.group(3), float(match.group(4))))
+    return items
+
+
+def backfill_venta_items(connection: sqlite3.Connection, batch_size: int = 1000) -> None:
+    # Llenar venta_items a partir de ventas.producto, por lotes para no bloquear la base
+    rows = connection.execute("SELECT nombre, id FROM productos ORDER BY id DESC").fetchall()
+    product_ids = dict(rows)  # Con nombres repetidos gana el id más bajo
+
+    last_id = 0
+    while True:
+        ventas = connection.execute(
+            "SELECT id, producto FROM ventas v WHERE id > ? AND NOT EXISTS "
+            "(SELECT 1 FROM venta_items i WHERE i.venta_id = v.id) ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not ventas:
+            break
+
+        items = []
+        for venta_id, detalle in ventas:
+            for nombre, cantidad, unidad, subtotal in parse_detalle(detalle):
+                precio = subtotal / cantidad if cantidad else 0.0
+                items.append((venta_id, product_ids.get(nombre), nombre, unidad, cantidad, precio, subtotal))
+
+        connection.executemany(
+            "INSERT INTO venta_items (venta_id, producto_id, nombre, unidad, cantidad, precio_unitario, subtotal) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            items
+        )
+        connection.commit()
+        last_id = ventas[-1][0]
+
+
+class SaleCart:
+    # Carrito de una venta con una línea por producto, indexado por id: agregar, quitar y
+    # consultar cantidades cuesta lo mismo con 3 o con 300 líneas, y el total se lleva al día.
+    # Al iterarlo produce los dicts (id, nombre, precio, cantidad, unidad) que espera save_sale.
+    def __init__(self):
+        self.items = {}  # producto_id -> línea, en el orden en que se agregaron
+        self.total = 0.0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.items.values())
+
+    def get(self, product_id: int) -> Optional[dict]:
+        return self.items.get(product_id)
+
+    def quantity(self, product_id: int) -> float:
+        item = self.items.get(product_id)
+        return item["cantidad"] if item else 0
+
+    def add(self, product_id: int, nombre: str, precio: float, unidad: str, cantidad: float) -> dict:
+        # Sumar cantidad a la línea del producto (creándola si no existe) y devolver la línea
+        item = self.items.get(product_id)
+        if item is None:
+            item = {"id": product_id, "nombre": nombre, "precio": float(precio), "cantidad": 0, "unidad": unidad}
+            self.items[product_id] = item
+        item["cantidad"] += cantidad
+        self.total += item["precio"] * cantidad
+        return item
+
+    def remove(self, product_id: int) -> Optional[dict]:
+        item = self.items.pop(product_id, None)
+        if item is not None:
+            # Con el carrito vacío se reinicia para no arrastrar errores de redondeo
+            self.total = self.total - item["precio"] * item["cantidad"] if self.items else 0.0
+        return item
+
+    def clear(self) -> None:
+        self.items = {}
+        self.total = 0.0
+
+
+def sale_quantity(value) -> float:
+    # Cantidad de una línea de venta: número finito mayor que 0 (fracciones para productos por
+    # peso). Lanza ValueError con cualquier otro valor, p. ej. desde el JSON de una terminal.
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        cantidad = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Cantidad inválida: {value!r}")
+    if not math.isfinite(cantidad) or cantidad <= 0:
+        raise ValueError(f"La cantidad debe ser mayor que cero: {value!r}")
+    return cantidad
+
+
+def save_sale(connection: sqlite3.Connection, sale_items: Iterable[dict],
+              commit: bool = True) -> tuple[float, dict]:
+    # Registrar una venta en una sola transacción. Cada elemento de sale_items tiene
+    # id, nombre, precio, cantidad y unidad. Devuelve (total, {producto_id: cantidad}).
+    # Lanza StockInsuficienteError, sin modificar nada, si algún producto no alcanza, y
+    # ValueError si la venta no tiene artículos o alguna cantidad no es un número mayor que 0.
+    # Con commit=False la venta se escribe en un savepoint dentro de la transacción que ya
+    # abrió quien llama (el servidor confirma varias ventas juntas).
+    detalle = []
+    items = []
+    por_producto = {}
+    total_cantidad = 0
+    total_venta = 0.0
+
+    for item in sale_items:
+        precio = float(item["precio"])
+        cantidad = sale_quantity(item["cantidad"])
+
+        subtotal = precio * cantidad
+        detalle.append(f"{item['nombre']}: {cantidad} {item['unidad']} - ${subtotal:.2f}")
+        items.append((item["id"], item["nombre"], item["unidad"], cantidad, precio, subtotal))
+        por_producto[item["id"]] = por_producto.get(item["id"], 0.0) + cantidad
+        total_cantidad += cantidad
+        total_venta += subtotal
+
+    if not items:
+        raise ValueError("La venta no tiene artículos")
+
+    detalle_str = "; ".join(detalle)
+    fecha = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    cursor = connection.cursor()
+    if commit:
+        if connection.in_transaction:
+            connection.commit()
+        # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer el stock
+        cursor.execute("BEGIN IMMEDIATE")
+    else:
+        cursor.execute("SAVEPOINT venta")
+
+    def undo():
+        if not commit:
+            connection.execute("ROLLBACK TO venta")
+            connection.execute("RELEASE venta")
+        elif connection.in_transaction:
+            connection.rollback()
+
+    try:
+        # Descontar stock solo si alcanza; cada fila no actualizada es un producto sin stock
+        cursor.executemany(
+            "UPDATE productos SET stock = stock - ? WHERE id = ? AND stock >= ?",
+            [(cantidad, product_id, cantidad) for product_id, cantidad in por_producto.items()]
+        )
+        sin_stock = cursor.rowcount != len(por_producto)
+        if not sin_stock:
+            cursor.execute(
+                "INSERT INTO ventas (producto, cantidad, total, fecha) VALUES (?, ?, ?, ?)",
+                (detalle_str, total_cantidad, total_venta, fecha)
+            )
+            venta_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO venta_items (venta_id, producto_id, nombre, unidad, cantidad, precio_unitario, subtotal) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(venta_id, *item) for item in items]
+            )
+            update_rollups(connection, fecha, 1, total_venta, len(items))
+            if commit:
+                connection.commit()
+            else:
+                connection.execute("RELEASE venta")
+    except Exception:
+        undo()
+        raise
+
+    if sin_stock:
+        undo()  # El stock vuelve a como estaba antes de listar lo que falta
+        raise StockInsuficienteError("\n".join(stock_shortfalls(connection, por_producto)))
+    return total_venta, por_producto
+
+
+def stock_shortfalls(connection: sqlite3.Connection, quantities: dict) -> list[str]:
+    # Describir los productos de {producto_id: cantidad} que no tienen stock suficiente
+    marcadores = ", ".join("?" * len(quantities))
+    rows = connection.execute(
+        f"SELECT id, nombre, stock FROM productos WHERE id IN ({marcadores})",
+        tuple(quantities)
+    ).fetchall()
+    disponibles = {row[0]: row for row in rows}
+
+    faltantes = []
+    for product_id, cantidad in quantities.items():
+        row = disponibles.get(product_id)
+        if row is None:
+            faltantes.append(f"Producto #{product_id} ya no existe")
+        elif row[2] < cantidad:
+            faltantes.append(f"{row[1]}: disponible {row[2]}, solicitado {cantidad:g}")
+    return faltantes
+
+
+def sale_schema(connection: sqlite3.Connection, sale_id: int) -> Optional[str]:
+    # Esquema que tiene la venta: "main" o el año archivado (archivo_2023); None si no existe
+    refresh_archives(connection)
+    for schema in ["main", *attached_archives(connection)]:
+        if connection.execute(f"SELECT 1 FROM {schema}.ventas WHERE id = ?", (sale_id,)).fetchone():
+            return schema
+    return None
+
+
+def delete_sale(connection: sqlite3.Connection, sale_id: int) -> None:
+    # Eliminar una venta (de la base o de su año archivado) junto con su detalle y restarla de
+    # los resúmenes (sin confirmar). Lanza ValueError si la venta no existe.
+    schema = sale_schema(connection, sale_id)
+    if schema is None:
+        raise ValueError(f"La venta #{sale_id} no existe")
+    sale = sale_rollup_values(connection, sale_id, schema)
+    update_rollups(connection, sale[0], -1, -sale[1], -sale[2])
+    connection.execute(f"DELETE FROM {schema}.venta_items WHERE venta_id = ?", (sale_id,))
+    connection.execute(f"DELETE FROM {schema}.ventas WHERE id = ?", (sale_id,))
+    if schema != "main":
+        connection.execute("UPDATE archivos SET num_ventas = num_ventas - 1 WHERE anio = ?",
+                           (schema[len(ARCHIVE_PREFIX):],))
+
+
+def latest_sales(connection: sqlite3.Connection, limit: int = 10) -> list:
+    # (producto, cantidad, total, hora) de las últimas ventas
+    return connection.execute(
+        "SELECT producto, cantidad, total, SUBSTR(fecha,12,8) as hora FROM ventas ORDER BY fecha DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+
+
+def sales_of_day(connection: sqlite3.Connection, dia: str) -> list:
+    # (id, hora, producto, cantidad, total) de las ventas de un día, en orden cronológico
+    return connection.execute(
+        "SELECT id, SUBSTR(fecha,12,8) as hora, producto, cantidad, total "
+        "FROM ventas_historial WHERE fecha >= ? AND fecha < ? ORDER BY fecha",
+        (dia, next_day(dia))
+    ).fetchall()
+
+
+def get_sale(connection: sqlite3.Connection, sale_id: int) -> Optional[tuple]:
+    # (producto, total, fecha) de una venta
+    return connection.execute(
+        "SELECT producto, total, fecha FROM ventas_historial WHERE id = ?",
+        (sale_id,)
+    ).fetchone()
+
+
+def get_sale_items(connection: sqlite3.Connection, sale_id: int) -> list:
+    # (nombre, cantidad, unidad, precio_unitario, subtotal) de cada línea de una venta
+    return connection.execute(
+        "SELECT nombre, cantidad, unidad, precio_unitario, subtotal FROM venta_items_historial "
+        "WHERE venta_id = ? ORDER BY id",
+        (sale_id,)
+    ).fetchall()
+
+
+def fetch_sales_page(connection: sqlite3.Connection, start_date: str = "", end_date: str = "",
+                     after: Optional[Sequence] = None, limit: int = 200) -> list:
+    # Página de ventas (más recientes primero) que continúa después de la última (fecha, id) mostrada:
+    # (id, día, hora, detalle recortado, cantidad, total, fecha)
+    where, params = date_range_filter(start_date, end_date)
+    if after:
+        where = and_where(where, "(fecha, id) < (?, ?)")
+        params = [*params, *after]
+    return connection.execute(
+        "SELECT id, SUBSTR(fecha,1,10), SUBSTR(fecha,12,8), SUBSTR(producto,1,120), cantidad, total, fecha "
+        "FROM ventas_historial" + where + " ORDER BY fecha DESC, id DESC LIMIT ?",
+        (*params, limit)
+    ).fetchall()
+
+
+def get_product_sales(connection: sqlite3.Connection, product_id: int,
+                      start_date: str = "", end_date: str = "") -> tuple[float, float]:
+    # Cantidad vendida e ingresos de un producto en un rango de fechas
+    where, params = date_range_filter(start_date, end_date)
+    return connection.execute(
+        "SELECT COALESCE(SUM(cantidad), 0), COALESCE(SUM(subtotal), 0) "
+        "FROM venta_items_historial" + and_where(where, "producto_id = ?"),
+        (*params, product_id)
+    ).fetchone()
+
+
+# ----------------------------------------------------------------------------
+# Resúmenes diarios/mensuales y cortes de caja
+# ----------------------------------------------------------------------------
+
+def update_rollups(connection: sqlite3.Connection, fecha: str, num_ventas: int,
+                   ingresos: float, num_articulos: int) -> None:
+    # Sumar (o restar, con valores negativos) una venta a los resúmenes de su día y su mes
+    for table, key, value in (("ventas_diarias", "dia", fecha[:10]), ("ventas_mensuales", "mes", fecha[:7])):
+        connection.execute(
+            f"INSERT INTO {table} ({key}, num_ventas, ingresos, num_articulos) VALUES (?, ?, ROUND(?, 2), ?) "
+            f"ON CONFLICT ({key}) DO UPDATE SET "
+            "num_ventas = num_ventas + excluded.num_ventas, "
+            "ingresos = ROUND(ingresos + excluded.ingresos, 2), "
+            "num_articulos = num_articulos + excluded.num_articulos",
+            (value, num_ventas, ingresos, num_articulos)
+        )
+
+
+def sale_rollup_values(connection: sqlite3.Connection, sale_id: int, schema: str = "main") -> Optional[tuple]:
+    # (fecha, total, número de artículos) de una venta del esquema dado, o None si no existe
+    return connection.execute(
+        f"SELECT fecha, total, (SELECT COUNT(*) FROM {schema}.venta_items WHERE venta_id = ventas.id) "
+        f"FROM {schema}.ventas WHERE id = ?",
+        (sale_id,)
+    ).fetchone()
+
+
+def rebuild_rollups(connection: sqlite3.Connection) -> None:
+    # Recalcular ventas_diarias y ventas_mensuales desde cero a partir de ventas y de los
+    # archivos adjuntos (cada día está en un solo archivo)
+    try:
+        connection.execute("DELETE FROM ventas_diarias")
+        connection.execute("DELETE FROM ventas_mensuales")
+        for schema in ["main", *attached_archives(connection)]:
+            connection.execute(f"""
+                INSERT INTO ventas_diarias (dia, num_ventas, ingresos, num_articulos)
+                SELECT SUBSTR(v.fecha,1,10), COUNT(*), ROUND(COALESCE(SUM(v.total), 0), 2), COALESCE(SUM(i.n), 0)
+                FROM {schema}.ventas v
+                LEFT JOIN (SELECT venta_id, COUNT(*) as n FROM {schema}.venta_items GROUP BY venta_id) i
+                ON i.venta_id = v.id
+                GROUP BY SUBSTR(v.fecha,1,10)
+            """)
+        connection.execute("""
+            INSERT INTO ventas_mensuales (mes, num_ventas, ingresos, num_articulos)
+            SELECT SUBSTR(dia,1,7), SUM(num_ventas), ROUND(SUM(ingresos), 2), SUM(num_articulos)
+            FROM ventas_diarias
+            GROUP BY SUBSTR(dia,1,7)
+        """)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def get_day_totals(connection: sqlite3.Connection, dia: str) -> tuple[int, float]:
+    # (num_ventas, ingresos) de un día, leído del resumen diario
+    row = connection.execute("SELECT num_ventas, ingresos FROM ventas_diarias WHERE dia = ?", (dia,)).fetchone()
+    return row or (0, 0.0)
+
+
+def get_daily_totals(connection: sqlite3.Connection, start_date: str = "", end_date: str = "") -> Iterator[tuple]:
+    # (día, num_ventas, ingresos) por día desde ventas_diarias, más recientes primero.
+    # Devuelve el cursor para iterar sin cargar todo en memoria.
+    where, params = date_range_filter(start_date, end_date, "dia")
+    return connection.execute(
+        "SELECT dia, num_ventas, ingresos FROM ventas_diarias" + and_where(where, "num_ventas > 0") +
+        " ORDER BY dia DESC",
+        tuple(params)
+    )
+
+
+def get_sales_summary(connection: sqlite3.Connection, start_date: str = "", end_date: str = "") -> tuple[int, float]:
+    # Número de ventas e ingresos de un rango, sumando los resúmenes diarios
+    where, params = date_range_filter(start_date, end_date, "dia")
+    return connection.execute(
+        "SELECT COALESCE(SUM(num_ventas), 0), COALESCE(SUM(ingresos), 0) FROM ventas_diarias" + where,
+        tuple(params)
+    ).fetchone()
+
+
+def get_corte(connection: sqlite3.Connection, fecha: str) -> Optional[tuple]:
+    return connection.execute("SELECT * FROM cortes_de_caja WHERE fecha = ?", (fecha,)).fetchone()
+
+
+def save_corte(connection: sqlite3.Connection, fecha: str, commit: bool = True) -> tuple[int, float]:
+    # Registrar (o actualizar) el corte de caja de un día con los totales del resumen diario
+    num_ventas, total_ingresos = get_day_totals(connection, fecha)
+    if get_corte(connection, fecha):
+        connection.execute(
+            "UPDATE cortes_de_caja SET num_ventas = ?, total_ingresos = ? WHERE fecha = ?",
+            (num_ventas, total_ingresos, fecha)
+        )
+    else:
+        connection.execute(
+            "INSERT INTO cortes_de_caja (fecha, num_ventas, total_ingresos) VALUES (?, ?, ?)",
+            (fecha, num_ventas, total_ingresos)
+        )
+    if commit:
+        connection.commit()
+    return num_ventas, total_ingresos
+
+
+def write_cortes_report(connection: sqlite3.Connection, f: TextIO, start_date: str = "", end_date: str = "") -> int:
+    # Escribir el reporte de cortes de caja conforme se leen los días; devuelve el número de ventas
+    dias = get_daily_totals(connection, start_date, end_date)
+
+    f.write("Reporte de Cortes de Caja - Mr Store\n")
+    f.write("="*50 + "\n\n")
+
+    if start_date or end_date:
+        f.write(f"Periodo: {start_date if start_date else 'Inicio'} - {end_date if end_date else 'Hoy'}\n\n")
+
+    total_general = 0
+    ventas_general = 0
+
+    for dia, num_ventas, total_ventas in dias:
+        total_ventas = total_ventas or 0.0
+        f.write(f"Fecha: {dia}\n"
+                f"Ventas: {num_ventas}\n"
+                f"Total: ${total_ventas:.2f}\n" +
+                "-"*50 + "\n")
+
+        total_general += total_ventas
+        ventas_general += num_ventas
+
+    if not ventas_general:
+        f.write("No se encontraron resultados para el periodo seleccionado.\n")
+    else:
+        f.write("\nRESUMEN GENERAL\n")
+        f.write("-"*50 + "\n")
+        f.write(f"Total de ventas: {ventas_general}\n")
+        f.write(f"Ingresos totales: ${total_general:.2f}\n")
+
+    return ventas_general
+
+
+# ----------------------------------------------------------------------------
+# Demanda y puntos de reorden
+# ----------------------------------------------------------------------------
+#
+# La demanda de cada producto sale de sus ventas por día en las últimas DEMAND_DAYS (días sin
+# ventas cuentan como 0). Con el promedio d y la desviación estándar s de la venta diaria:
+#
+#   punto de reorden = d * LEAD_TIME_DAYS + SERVICE_Z * s * raíz(LEAD_TIME_DAYS)
+#
+# es decir, lo que se vende mientras llega el pedido más un colchón por la variación de las
+# ventas. Un producto está "agotándose" con stock <= punto de reorden; sus días de cobertura
+# son stock / d. Se calcula por lotes (al arrancar la aplicación fuera del modo terminal, y con
+# store_cli demanda) y se guarda en productos para que el panel use un índice.
+
+DEMAND_DAYS = 56  # Ocho semanas completas: todos los días de la semana pesan igual
+LEAD_TIME_DAYS = 7  # Días desde que se pide hasta que llega la mercancía
+SERVICE_Z = 1.65  # Colchón para no quedarse sin stock en ~95 % de los pedidos
+ORDER_DAYS = 14  # El pedido sugerido cubre el punto de reorden más estos días de venta
+
+
+def compute_demand(connection: sqlite3.Connection, today: Optional[str] = None,
+                   days: int = DEMAND_DAYS) -> list[tuple]:
+    # (venta_diaria, punto_reorden, producto_id) de los productos vendidos en los días
+    # completos anteriores a today, listos para set_demand. Solo lee (sirve en un lector).
+    today = today or datetime.date.today().strftime("%Y-%m-%d")
+    start_date = (datetime.datetime.strptime(today, "%Y-%m-%d") - datetime.timedelta(days=days)).strftime("%Y-%m-%d")
+    # Una tienda con menos historia que la ventana divide entre los días que lleva vendiendo
+    first_day = connection.execute("SELECT MIN(dia) FROM ventas_diarias WHERE num_ventas > 0").fetchone()[0]
+    if not first_day or first_day >= today:
+        return []
+    days = min(days, (datetime.date.fromisoformat(today) - datetime.date.fromisoformat(max(first_day, start_date))).days)
+
+    # Suma y suma de cuadrados de la venta diaria de cada producto; cada día está en un solo esquema
+    sums = {}
+    for schema in history_schemas(connection, start_date, today):
+        for product_id, total, squares in connection.execute(f"""
+            SELECT producto_id, SUM(cantidad), SUM(cantidad * cantidad) FROM (
+                SELECT i.producto_id, SUM(i.cantidad) as cantidad
+                FROM {schema}.venta_items i
+                JOIN {schema}.ventas v ON v.id = i.venta_id
+                WHERE v.fecha >= ? AND v.fecha < ? AND i.producto_id IS NOT NULL
+                GROUP BY i.producto_id, SUBSTR(v.fecha,1,10)
+            )
+            GROUP BY producto_id
+        """, (start_date, today)):
+            previous = sums.get(product_id, (0.0, 0.0))
+            sums[product_id] = (previous[0] + total, previous[1] + squares)
+
+    demand = []
+    for product_id, (total, squares) in sums.items():
+        mean = total / days
+        deviation = math.sqrt(max(0.0, squares / days - mean * mean))
+        reorder_point = mean * LEAD_TIME_DAYS + SERVICE_Z * deviation * math.sqrt(LEAD_TIME_DAYS)
+        if mean > 0:
+            demand.append((round(mean, 4), round(reorder_point, 2), product_id))
+    return demand
+
+
+def set_demand(connection: sqlite3.Connection, demand: Iterable[tuple]) -> None:
+    # Guardar el resultado de compute_demand; los productos que no aparecen quedan sin demanda
+    try:
+        connection.execute(
+            "UPDATE productos SET venta_diaria = 0, punto_reorden = 0 WHERE punto_reorden <> 0 OR venta_diaria <> 0"
+        )
+        connection.executemany("UPDATE productos SET venta_diaria = ?, punto_reorden = ? WHERE id = ?", demand)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def update_demand(connection: sqlite3.Connection, today: Optional[str] = None) -> int:
+    # Recalcular y guardar la demanda de todos los productos; devuelve cuántos tienen ventas
+    demand = compute_demand(connection, today)
+    set_demand(connection, demand)
+    return len(demand)
+
+
+def low_stock(connection: sqlite3.Connection) -> list:
+    # Productos en su punto de reorden o por debajo, agrupados por proveedor (sin proveedor al
+    # final) y de menos a más días de cobertura. Se agrupa por (proveedor_id, proveedor):
+    # (proveedor_id, proveedor, id, nombre, stock, punto de reorden, días de cobertura, pedido sugerido)
+    return connection.execute("""
+        SELECT pr.id, pr.nombre, p.id, p.nombre, p.stock, p.punto_reorden, p.stock / p.venta_diaria as dias_cobertura,
+               p.punto_reorden + p.venta_diaria * ? - p.stock
+        FROM productos p
+        LEFT JOIN proveedores pr ON p.proveedor_id = pr.id
+        WHERE p.punto_reorden > 0 AND p.stock - p.punto_reorden <= 0
+        ORDER BY pr.id IS NULL, pr.nombre, pr.id, dias_cobertura
+    """, (ORDER_DAYS,)).fetchall()
+
+
+# ----------------------------------------------------------------------------
+# Archivo de meses cerrados
+# ----------------------------------------------------------------------------
+#
+# Las ventas de meses cerrados pueden moverse (con su detalle) a un archivo SQLite por año,
+# en la carpeta <base>_archivo junto a la base: mr_store_archivo/ventas_2023.db. Cada
+# conexión adjunta esos archivos (ATTACH) y crea dos vistas temporales que los unen con
+# UNION ALL a las tablas de la base:
+#
+#   ventas_historial        id, producto, cantidad, total, fecha
+#   venta_items_historial   columnas de venta_items más la fecha de su venta
+#
+# SQLite pasa las condiciones de fecha o id a cada parte de la unión y las resuelve con sus
+# índices, así que un año sin ventas en el rango solo cuesta una búsqueda en su índice, y un
+# ORDER BY fecha con LIMIT mezcla las partes ya ordenadas sin leerlas completas. Los
+# resúmenes diarios y mensuales y los cortes de caja se quedan en la base, completos.
+
+ARCHIVE_PREFIX = "archivo_"  # Esquema de cada año adjunto: archivo_2023
+
+
+def archive_dir(connection: sqlite3.Connection) -> Optional[pathlib.Path]:
+    # Carpeta de archivos de la base de la conexión, o None para una base en memoria
+    main = next(row[2] for row in connection.execute("PRAGMA database_list") if row[1] == "main")
+    if not main:
+        return None
+    main = pathlib.Path(main)
+    return main.with_name(main.stem + "_archivo")
+
+
+def attached_archives(connection: sqlite3.Connection) -> list[str]:
+    # Esquemas de los archivos adjuntos a la conexión, del año más reciente al más antiguo
+    schemas = [row[1] for row in connection.execute("PRAGMA database_list") if row[1].startswith(ARCHIVE_PREFIX)]
+    return sorted(schemas, reverse=True)
+
+
+def history_schemas(connection: sqlite3.Connection, start_date: str = "", end_date: str = "") -> list[str]:
+    # La base y los años adjuntos que pueden tener ventas del rango, para consultas que
+    # recorren cada esquema por separado (agregados sobre las vistas no se aplanan)
+    schemas = attached_archives(connection)
+    if not schemas:
+        return ["main"]
+    months = {ARCHIVE_PREFIX + anio: (desde, hasta)
+              for anio, desde, hasta in connection.execute("SELECT anio, desde, hasta FROM archivos")}
+    return ["main"] + [
+        schema for schema in schemas
+        if schema in months
+        and (not start_date or months[schema][1] >= start_date[:7])
+        and (not end_date or months[schema][0] <= end_date[:7])
+    ]
+
+
+def attach_archives(connection: sqlite3.Connection, readonly: bool = False) -> list[str]:
+    # Adjuntar los años registrados en archivos y (re)crear las vistas de historial; con
+    # readonly, como la conexión de connect_readonly (URI mode=ro). Con un esquema atrasado
+    # no hace nada: create_tables la vuelve a llamar al migrar.
+    if schema_version(connection) < SCHEMA_VERSION:
+        return []
+
+    schemas = attached_archives(connection)
+    folder = archive_dir(connection)
+    if folder is not None:
+        # SQLite admite pocos ATTACH por conexión (10 por defecto); se deja uno libre para
+        # archivar y, si no alcanzan, quedan fuera los años más antiguos
+        limit = connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - 1
+        for (anio,) in connection.execute("SELECT anio FROM archivos ORDER BY anio DESC").fetchall():
+            path = folder / f"ventas_{anio}.db"
+            schema = ARCHIVE_PREFIX + anio
+            if schema in schemas or not path.exists():
+                continue  # Ya adjunto, o la carpeta de archivos no se copió con la base
+            if len(schemas) >= limit:
+                break
+            target = path.absolute().as_uri() + "?mode=ro" if readonly else str(path)
+            connection.execute(f"ATTACH DATABASE ? AS {schema}", (target,))
+            schemas.append(schema)
+
+    create_history_views(connection, sorted(schemas, reverse=True))
+    return schemas
+
+
+def refresh_archives(connection: sqlite3.Connection, readonly: bool = False) -> bool:
+    # Adjuntar los años que otra conexión archivó después de abrir esta (store_cli archivar
+    # con la aplicación abierta). ATTACH no se permite dentro de una transacción: se llama
+    # antes de empezar a leer y no hace nada dentro de una. Devuelve True si adjuntó alguno.
+    if connection.in_transaction or schema_version(connection) < SCHEMA_VERSION:
+        return False
+    folder = archive_dir(connection)
+    schemas = attached_archives(connection)
+    if folder is None or len(schemas) >= connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - 1:
+        return False
+    if not any(ARCHIVE_PREFIX + anio not in schemas and (folder / f"ventas_{anio}.db").exists()
+               for (anio,) in connection.execute("SELECT anio FROM archivos")):
+        return False
+    return attach_archives(connection, readonly) != schemas
+
+
+def create_history_views(connection: sqlite3.Connection, schemas: Sequence[str]) -> None:
+    ventas = " UNION ALL ".join(
+        f"SELECT id, producto, cantidad, total, fecha FROM {schema}.ventas"
+        for schema in ["main", *schemas]
+    )
+    items = " UNION ALL ".join(
+        "SELECT i.id, i.venta_id, i.producto_id, i.nombre, i.unidad, i.cantidad, i.precio_unitario, "
+        f"i.subtotal, v.fecha FROM {schema}.venta_items i JOIN {schema}.ventas v ON v.id = i.venta_id"
+        for schema in ["main", *schemas]
+    )
+    connection.execute("DROP VIEW IF EXISTS temp.ventas_historial")
+    connection.execute("DROP VIEW IF EXISTS temp.venta_items_historial")
+    connection.execute(f"CREATE TEMP VIEW ventas_historial AS {ventas}")
+    connection.execute(f"CREATE TEMP VIEW venta_items_historial AS {items}")
+
+
+def create_archive_tables(connection: sqlite3.Connection, schema: str) -> None:
+    # Mismas columnas e ids que en la base; sin AUTOINCREMENT porque los ids vienen de ella
+    connection.execute(f"""CREATE TABLE IF NOT EXISTS {schema}.ventas (
+        id INTEGER PRIMARY KEY,
+        producto TEXT,
+        cantidad REAL,
+        total REAL,
+        fecha TEXT)""")
+    connection.execute(f"""CREATE TABLE IF NOT EXISTS {schema}.venta_items (
+        id INTEGER PRIMARY KEY,
+        venta_id INTEGER NOT NULL,
+        producto_id INTEGER,
+        nombre TEXT,
+        unidad TEXT,
+        cantidad REAL,
+        precio_unitario REAL,
+        subtotal REAL)""")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_ventas_fecha ON ventas (fecha)")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_venta_items_venta ON venta_items (venta_id)")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_venta_items_producto ON venta_items (producto_id)")
+    connection.commit()
+
+
+def next_month(mes: str) -> str:
+    # Mes siguiente a un mes YYYY-MM
+    year, month = int(mes[:4]), int(mes[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def archive_sales(connection: sqlite3.Connection, through_month: str,
+                  on_progress: Optional[Callable[[str, int], None]] = None) -> int:
+    # Mover a los archivos anuales las ventas (y su detalle) de los meses hasta through_month
+    # (YYYY-MM, inclusive), que debe estar cerrado. Mes por mes: primero se copia y se
+    # confirma el archivo, después se borra de la base; si algo falla a la mitad, volver a
+    # correrlo termina el trabajo sin duplicar. on_progress(mes, ventas) después de cada mes.
+    # Devuelve el número de ventas movidas.
+    datetime.datetime.strptime(through_month, "%Y-%m")  # Validar formato
+    if through_month >= datetime.date.today().strftime("%Y-%m"):
+        raise ValueError(f"El mes {through_month} no está cerrado")
+    folder = archive_dir(connection)
+    if folder is None:
+        raise ValueError("Una base de datos en memoria no puede archivarse")
+
+    first = connection.execute("SELECT MIN(fecha) FROM main.ventas").fetchone()[0]
+    if not first or first[:7] > through_month:
+        return 0
+
+    folder.mkdir(exist_ok=True)
+    moved = 0
+    mes = first[:7]
+    while mes <= through_month:
+        desde, hasta = f"{mes}-01", f"{next_month(mes)}-01"
+        anio = mes[:4]
+        if not connection.execute("SELECT 1 FROM main.ventas WHERE fecha >= ? AND fecha < ? LIMIT 1",
+                                  (desde, hasta)).fetchone():
+            mes = next_month(mes)
+            continue
+        schema = ARCHIVE_PREFIX + anio
+        if schema not in attached_archives(connection):
+            connection.commit()  # ATTACH no se permite dentro de una transacción
+            connection.execute(f"ATTACH DATABASE ? AS {schema}", (str(folder / f"ventas_{anio}.db"),))
+            create_archive_tables(connection, schema)
+
+        try:
+            connection.execute(
+                f"INSERT OR IGNORE INTO {schema}.ventas (id, producto, cantidad, total, fecha) "
+                "SELECT id, producto, cantidad, total, fecha FROM main.ventas WHERE fecha >= ? AND fecha < ?",
+                (desde, hasta)
+            )
+            connection.execute(
+                f"INSERT OR IGNORE INTO {schema}.venta_items "
+                "(id, venta_id, producto_id, nombre, unidad, cantidad, precio_unitario, subtotal) "
+                "SELECT i.id, i.venta_id, i.producto_id, i.nombre, i.unidad, i.cantidad, i.precio_unitario, i.subtotal "
+                "FROM main.venta_items i JOIN main.ventas v ON v.id = i.venta_id WHERE v.fecha >= ? AND v.fecha < ?",
+                (desde, hasta)
+            )
+            archivadas = connection.execute(f"SELECT COUNT(*) FROM {schema}.ventas").fetchone()[0]
+            connection.execute(
+                "INSERT INTO archivos (anio, desde, hasta, num_ventas) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (anio) DO UPDATE SET desde = MIN(desde, excluded.desde), "
+                "hasta = MAX(hasta, excluded.hasta), num_ventas = excluded.num_ventas",
+                (anio, mes, mes, archivadas)
+            )
+            connection.commit()
+
+            connection.execute(
+                "DELETE FROM main.venta_items WHERE venta_id IN "
+                "(SELECT id FROM main.ventas WHERE fecha >= ? AND fecha < ?)",
+                (desde, hasta)
+            )
+            count = connection.execute(
+                "DELETE FROM main.ventas WHERE fecha >= ? AND fecha < ?", (desde, hasta)
+            ).rowcount
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+        moved += count
+        if on_progress:
+            on_progress(mes, count)
+        mes = next_month(mes)
+
+    attach_archives(connection)
+    return moved
+
+
+# ----------------------------------------------------------------------------
+# Exportaciones
+# ----------------------------------------------------------------------------
+
+def inventory_export() -> tuple[list, str, tuple]:
+    # (encabezados, consulta, parámetros) del inventario con nombre de proveedor
+    query = """
+        SELECT p.id, p.nombre, p.marca, p.precio, p.unidad, p.stock, pr.nombre as proveedor
+        FROM productos p
+        LEFT JOIN proveedores pr ON p.proveedor_id = pr.id
+        ORDER BY p.nombre
+    """
+    return ["ID", "Nombre", "Marca", "Precio", "Unidad", "Stock", "Proveedor"], query, ()
+
+
+def providers_export() -> tuple[list, str, tuple]:
+    query = """
+        SELECT id, nombre, contacto,
+        (SELECT COUNT(*) FROM productos WHERE proveedor_id = proveedores.id) as num_productos
+        FROM proveedores
+        ORDER BY nombre
+    """
+    return ["ID", "Nombre", "Contacto", "Núm. Productos"], query, ()
+
+
+def sales_export(start_date: str = "", end_date: str = "") -> tuple[list, str, tuple]:
+    where, params = date_range_filter(start_date, end_date)
+    query = "SELECT id, producto, cantidad, total, fecha FROM ventas_historial" + where + " ORDER BY fecha DESC"
+    return ["ID", "Productos", "Cantidad", "Total", "Fecha"], query, tuple(params)
+
+
+def export_size(connection: sqlite3.Connection, table: str, start_date: str = "", end_date: str = "") -> int:
+    # Filas de la exportación de una tabla sin recorrer la consulta, para la barra de progreso:
+    # productos y proveedores se cuentan completos, las ventas salen de los resúmenes diarios
+    if table == "ventas":
+        return get_sales_summary(connection, start_date, end_date)[0]
+    return count_products(connection) if table == "productos" else count_providers(connection)
+
+
+def full_export() -> dict:
+    # Una exportación por tabla: nombre -> (encabezados, consulta, parámetros)
+    return {
+        "productos": (["ID", "Nombre", "Marca", "Precio", "Unidad", "Stock", "Imagen", "Proveedor ID"],
+                      "SELECT id, nombre, marca, precio, unidad, stock, imagen, proveedor_id FROM productos", ()),
+        "proveedores": (["ID", "Nombre", "Contacto"], "SELECT * FROM proveedores", ()),
+        "ventas": (["ID", "Producto", "Cantidad", "Total", "Fecha"],
+                   "SELECT * FROM ventas_historial ORDER BY fecha DESC", ())
+    }
+
+
+def full_export_base(path: str) -> tuple[str, str]:
+    # (ruta base, extensión) de los archivos de full_export, que se llaman <base>_<tabla><extensión>:
+    # respaldo.csv.gz y respaldo.gz -> ("respaldo", ".csv.gz"); respaldo.csv -> ("respaldo", ".csv")
+    base, extension = os.path.splitext(path)
+    compressed = extension == ".gz"
+    if compressed:
+        base, extension = os.path.splitext(base)
+    if extension != ".csv":
+        base += extension  # Otra extensión es parte del nombre
+    return base, ".csv.gz" if compressed else ".csv"
+
+
+def export_query(connection: sqlite3.Connection, path: str, headers: Sequence[str], query: str,
+                 params: Sequence = (), on_progress: Optional[ProgressCallback] = None,
+                 is_cancelled: Optional[Callable[[], bool]] = None, chunk_size: int = 5000) -> int:
+    # Escribir el resultado de una consulta en CSV (o CSV.gz si path termina en .gz) leyendo
+    # por bloques. on_progress(filas) recibe las filas de cada bloque escrito; devuelve las
+    # filas escritas. No cuenta el resultado antes: sería recorrer la consulta dos veces.
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", newline="", encoding="utf-8") as f:
+        return export_rows(connection, f, headers, query, params, on_progress, is_cancelled, chunk_size)
+
+
+def export_rows(connection: sqlite3.Connection, f: TextIO, headers: Sequence[str], query: str,
+                params: Sequence = (), on_progress: Optional[ProgressCallback] = None,
+                is_cancelled: Optional[Callable[[], bool]] = None, chunk_size: int = 5000) -> int:
+    # Igual que export_query sobre un archivo ya abierto (por ejemplo la salida estándar)
+    written = 0
+    cursor = connection.execute(query, params)
+    writer = csv.writer(f)
+    writer.writerow(headers)
+    while not (is_cancelled and is_cancelled()):
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        writer.writerows(rows)
+        written += len(rows)
+        if on_progress:
+            on_progress(len(rows))
+    return written
@@ -0,0 +1,508 @@
+# Servidor local de Mr Store para varias cajas en la misma tienda.
+# Un solo proceso es dueño de la base de datos: las ventas, cambios de stock y cortes de todas
+# las terminales pasan por un único hilo con la conexión de escritura, así que las cajas nunca
+# compiten por el bloqueo de SQLite ("database is locked"). Las operaciones que llegan juntas
+# se confirman en una sola transacción (un commit por lote en vez de uno por venta).
+# Las terminales hablan con él por HTTP en localhost mediante StoreClient.
+#
+#   python store_server.py serve --db mr_store.db --port 8765
+#   MRSTORE_SERVER=http://127.0.0.1:8765 python MrStore2.0.py
+#   python store_server.py loadtest --db copia.db --terminals 24 --sales 50
+import argparse
+import collections
+import datetime
+import http.client
+import json
+import multiprocessing
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import store_db
+
+DEFAULT_PORT = 8765
+RECENT_SALES = 1000  # Ventas recordadas para no registrar dos veces un reintento
+MAX_BATCH = 64  # Operaciones confirmadas en una misma transacción como máximo
+
+
+class StoreServerError(Exception):
+    # El servidor rechazó la petición o respondió con un error
+    pass
+
+
+# ----------------------------------------------------------------------------
+# Servidor
+# ----------------------------------------------------------------------------
+
+class StoreServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, db_path: Optional[str] = None):
+        self.db_path = db_path or store_db.DB_PATH
+        self.verbose = False
+        self.writes = queue.Queue()
+
+        # Versión del catálogo: cada venta o cambio de stock la incrementa y marca sus productos.
+        # Las terminales piden los cambios desde la última versión que vieron.
+        self.version = 1
+        self.reset_version = 1  # Terminales con una versión anterior deben recargar todo
+        self.changes = {}  # producto_id -> versión del último cambio
+        self.recent_sales = collections.OrderedDict()  # request_id -> respuesta
+        self.batch_sales = []  # request_id de las ventas del lote sin confirmar
+
+        ready = threading.Event()
+        self.startup_error = None
+        self.writer_thread = threading.Thread(target=self.write_loop, args=(ready,), daemon=True)
+        self.writer_thread.start()
+        ready.wait()
+        if self.startup_error:
+            raise self.startup_error
+
+        super().__init__(address, StoreRequestHandler)
+
+    def write_loop(self, ready: threading.Event) -> None:
+        # Hilo dueño de la conexión de escritura: ejecuta las operaciones en orden de llegada
+        try:
+            connection = store_db.connect(self.db_path)
+            store_db.create_tables(connection)
+            self.data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        except Exception as e:
+            self.startup_error = e
+            ready.set()
+            return
+        ready.set()
+
+        stopping = False
+        while not stopping:
+            job = self.writes.get()
+            if job is None:
+                break
+            # Juntar las operaciones que esperan en la cola (las de las demás cajas mientras
+            # se confirmaba el lote anterior)
+            batch = [job]
+            while len(batch) < MAX_BATCH:
+                try:
+                    job = self.writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self.run_batch(connection, batch)
+
+        try:
+            connection.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass
+        connection.close()
+
+    def run_batch(self, connection: sqlite3.Connection, batch: list) -> None:
+        # Ejecutar un lote de operaciones en una sola transacción. Cada una va en su savepoint:
+        # la que falla se deshace sin afectar a las demás. Nadie recibe respuesta hasta que el
+        # lote está confirmado; si el commit falla, todas reciben el error.
+        jobs = [(fn, future) for fn, future in batch if future.set_running_or_notify_cancel()]
+        if not jobs:
+            return
+        try:
+            self.check_external_changes(connection)
+            if connection.in_transaction:
+                connection.commit()
+            connection.execute("BEGIN IMMEDIATE")
+        except BaseException as e:
+            for _, future in jobs:
+                future.set_exception(e)
+            return
+
+        results = []
+        batch_error = None
+        for fn, future in jobs:
+            if batch_error is not None:
+                results.append((future, None, batch_error))
+                continue
+            try:
+                connection.execute("SAVEPOINT operacion")
+                value = fn(connection)
+                connection.execute("RELEASE operacion")
+                results.append((future, value, None))
+            except BaseException as e:
+                results.append((future, None, e))
+                try:
+                    connection.execute("ROLLBACK TO operacion")
+                    connection.execute("RELEASE operacion")
+                except sqlite3.Error as rollback_error:
+                    batch_error = rollback_error  # SQLite deshizo toda la transacción
+                if not connection.in_transaction:
+                    batch_error = batch_error or e
+
+        try:
+            if batch_error is not None:
+                raise batch_error
+            connection.commit()
+        except BaseException as e:
+            if connection.in_transaction:
+                connection.rollback()
+            self.discard_batch()
+            results = [(future, None, error or e) for future, _, error in results]
+        self.batch_sales.clear()
+
+        for future, value, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    def discard_batch(self) -> None:
+        # El lote no se confirmó: olvidar sus ventas (un reintento debe registrarlas) y que las
+        # terminales recarguen el catálogo, porque las versiones marcadas no llegaron a la base
+        for request_id in self.batch_sales:
+            self.recent_sales.pop(request_id, None)
+        self.version += 1
+        self.reset_version = self.version
+        self.changes.clear()
+
+    def write(self, fn: Callable[[sqlite3.Connection], object]) -> object:
+        # Ejecutar fn(conexión) en el hilo de escritura, dentro de la transacción de un lote
+        # (fn no debe confirmar), y esperar su resultado
+        future = Future()
+        self.writes.put((fn, future))
+        return future.result()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.writes.put(None)
+        self.writer_thread.join()
+
+    def check_external_changes(self, connection: sqlite3.Connection) -> None:
+        # data_version cambia cuando otra conexión (la administración en MrStore, otro programa)
+        # confirma cambios; como no sabemos qué cambió, todas las terminales recargan su catálogo
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            self.data_version = data_version
+            self.version += 1
+            self.reset_version = self.version
+            self.changes.clear()
+
+    def mark_changed(self, product_ids: Iterable[int]) -> None:
+        self.version += 1
+        for product_id in product_ids:
+            self.changes[product_id] = self.version
+
+    def catalog_delta(self, connection: sqlite3.Connection, since: int) -> dict:
+        # Productos modificados después de la versión since (solo desde el hilo de escritura)
+        if since < self.reset_version:
+            return {"version": self.version, "full": True}
+
+        ids = [product_id for product_id, version in self.changes.items() if version > since]
+        rows = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows += connection.execute(
+                f"SELECT {store_db.ProductCatalog.PRODUCT_COLUMNS} FROM productos "
+                f"WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+        found = {row[0] for row in rows}
+        return {
+            "version": self.version,
+            "full": False,
+            "products": rows,
+            "removed": [product_id for product_id in ids if product_id not in found],
+        }
+
+    # Operaciones expuestas a las terminales
+
+    def get_catalog(self, since: int) -> dict:
+        return self.write(lambda connection: self.catalog_delta(connection, since))
+
+    def register_sale(self, request_id: str, items: list, since: int) -> dict:
+        def job(connection):
+            if request_id in self.recent_sales:
+                return self.recent_sales[request_id]  # Reintento de una venta ya registrada
+
+            total, vendidos = store_db.save_sale(connection, items, commit=False)
+            self.mark_changed(vendidos)
+            response = {"total": total, "vendidos": list(vendidos.items())}
+            self.recent_sales[request_id] = response
+            self.batch_sales.append(request_id)
+            while len(self.recent_sales) > RECENT_SALES:
+                self.recent_sales.popitem(last=False)
+            return response
+
+        response = self.write(job)
+        # La respuesta trae también los cambios del catálogo: una sola ida y vuelta por venta
+        return dict(response, catalog=self.get_catalog(since))
+
+    def update_stock(self, product_id: int, stock: int, since: int) -> dict:
+        def job(connection):
+            store_db.update_stock(connection, product_id, stock, commit=False)
+            self.mark_changed([product_id])
+            return self.catalog_delta(connection, since)
+
+        return {"catalog": self.write(job)}
+
+    def save_corte(self, fecha: str) -> dict:
+        datetime.datetime.strptime(fecha, "%Y-%m-%d")  # Validar formato
+        num_ventas, total_ingresos = self.write(
+            lambda connection: store_db.save_corte(connection, fecha, commit=False))
+        return {"num_ventas": num_ventas, "total_ingresos": total_ingresos}
+
+
+class StoreRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Conexiones persistentes: una por terminal
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/health":
+            self.reply(200, {"ok": True})
+        elif url.path == "/catalog":
+            self.respond(lambda: self.server.get_catalog(int(query.get("since", ["0"])[0])))
+        else:
+            self.reply(404, {"error": "not_found", "message": f"Ruta desconocida: {url.path}"})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.reply(400, {"error": "bad_request", "message": "JSON inválido"})
+            return
+
+        if path == "/sale":
+            self.respond(lambda: self.server.register_sale(
+                str(data["request_id"]), data["items"], int(data.get("since", 0))))
+        elif path == "/stock":
+            self.respond(lambda: self.server.update_stock(
+                int(data["id"]), int(data["stock"]), int(data.get("since", 0))))
+        elif path == "/corte":
+            self.respond(lambda: self.server.save_corte(str(data["fecha"])))
+        else:
+            self.reply(404, {"error": "not_found", "message": f"Ruta desconocida: {path}"})
+
+    def respond(self, operation):
+        try:
+            self.reply(200, operation())
+        except store_db.StockInsuficienteError as e:
+            self.reply(409, {"error": "stock", "message": str(e)})
+        except (KeyError, TypeError, ValueError) as e:
+            self.reply(400, {"error": "bad_request", "message": f"Petición inválida: {str(e)}"})
+        except sqlite3.Error as e:
+            self.reply(500, {"error": "database", "message": str(e)})
+
+    def reply(self, status, data):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+# ----------------------------------------------------------------------------
+# Cliente (terminal de venta)
+# ----------------------------------------------------------------------------
+
+class StoreClient:
+    # Terminal que registra ventas y cambios de stock por medio del servidor y mantiene
+    # su ProductCatalog al día con los cambios de las demás cajas. No es seguro entre hilos.
+    def __init__(self, url: str, timeout: float = 10):
+        parts = urlsplit(url if "//" in url else f"http://{url}")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self.connection = None
+        self.version = 0  # Última versión del catálogo aplicada
+
+    def request(self, method: str, path: str, data: Optional[dict] = None) -> dict:
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+
+        # Reintentar una vez si el servidor cerró la conexión persistente; las ventas llevan
+        # request_id, así que un reintento nunca registra la misma venta dos veces
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                payload = json.loads(response.read() or b"{}")
+                break
+            except (ConnectionError, http.client.HTTPException):
+                self.close()
+                if attempt:
+                    raise
+
+        if response.status == 409:
+            raise store_db.StockInsuficienteError(payload.get("message", ""))
+        if response.status >= 400:
+            raise StoreServerError(payload.get("message", f"HTTP {response.status}"))
+        return payload
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def health(self) -> bool:
+        return bool(self.request("GET", "/health").get("ok"))
+
+    def sync_catalog(self, catalog: store_db.ProductCatalog, changes: Optional[dict] = None) -> None:
+        # Aplicar al catálogo local los cambios desde la última sincronización
+        if changes is None:
+            changes = self.request("GET", f"/catalog?since={self.version}")
+        if changes["full"]:
+            catalog.invalidate()  # Se recarga desde la base la próxima vez que se use
+        else:
+            catalog.apply_rows(changes["products"])
+            for product_id in changes["removed"]:
+                catalog.remove_product(product_id)
+        self.version = changes["version"]
+
+    def save_sale(self, sale_items: Iterable[dict],
+                  catalog: Optional[store_db.ProductCatalog] = None) -> tuple[float, dict]:
+        # Igual que store_db.save_sale: devuelve (total, {producto_id: cantidad}) o lanza
+        # StockInsuficienteError. Si se pasa el catálogo, se actualiza con la misma respuesta.
+        items = [{key: item[key] for key in ("id", "nombre", "precio", "cantidad", "unidad")}
+                 for item in sale_items]
+        response = self.request("POST", "/sale", {
+            "request_id": uuid.uuid4().hex,
+            "items": items,
+            "since": self.version,
+        })
+        if catalog is not None:
+            self.sync_catalog(catalog, response["catalog"])
+        return response["total"], dict(response["vendidos"])
+
+    def update_stock(self, product_id: int, stock: int,
+                     catalog: Optional[store_db.ProductCatalog] = None) -> None:
+        response = self.request("POST", "/stock", {"id": product_id, "stock": stock, "since": self.version})
+        if catalog is not None:
+            self.sync_catalog(catalog, response["catalog"])
+
+    def save_corte(self, fecha: str) -> tuple[int, float]:
+        # Igual que store_db.save_corte: (número de ventas, ingresos) del día
+        response = self.request("POST", "/corte", {"fecha": fecha})
+        return response["num_ventas"], response["total_ingresos"]
+
+
+# ----------------------------------------------------------------------------
+# Línea de comandos: servidor y prueba de carga con varios procesos
+# ----------------------------------------------------------------------------
+
+def serve(db_path: Optional[str], host: str, port: int, verbose: bool = False) -> None:
+    server = StoreServer((host, port), db_path)
+    server.verbose = verbose
+    print(f"Servidor de Mr Store en http://{host}:{server.server_address[1]} ({server.db_path})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _terminal(args):
+    # Una caja simulada en su propio proceso: registra ventas de un artículo y mide cada una
+    url, product_rows, num_sales, seed = args
+    rng = random.Random(seed)
+    client = StoreClient(url)
+    latencies = []
+    stock_errors = 0
+    other_errors = []
+    for _ in range(num_sales):
+        product_id, nombre, precio, unidad = rng.choice(product_rows)
+        start = time.perf_counter()
+        try:
+            client.save_sale([{"id": product_id, "nombre": nombre, "precio": precio,
+                               "cantidad": 1, "unidad": unidad}])
+        except store_db.StockInsuficienteError:
+            stock_errors += 1
+        except Exception as e:
+            other_errors.append(repr(e))
+        latencies.append((time.perf_counter() - start) * 1000)
+    client.close()
+    return latencies, stock_errors, other_errors
+
+
+def loadtest(db_path: str, url: Optional[str], terminals: int, sales: int) -> int:
+    connection = store_db.connect_readonly(db_path)
+    product_rows = connection.execute(
+        "SELECT id, nombre, precio, unidad FROM productos WHERE stock > 0 ORDER BY RANDOM() LIMIT 200"
+    ).fetchall()
+    ventas_antes = connection.execute("SELECT COUNT(*) FROM ventas").fetchone()[0]
+    connection.close()
+    if not product_rows:
+        print("La base de datos no tiene productos con existencia.")
+        return 1
+
+    server = None
+    if not url:
+        server = StoreServer(("127.0.0.1", 0), db_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(terminals) as pool:
+        results = pool.map(_terminal, [(url, product_rows, sales, seed) for seed in range(terminals)])
+    elapsed = time.perf_counter() - start
+
+    if server:
+        server.shutdown()
+        server.server_close()
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    stock_errors = sum(result[1] for result in results)
+    other_errors = [error for result in results for error in result[2]]
+
+    connection = store_db.connect_readonly(db_path)
+    ventas_nuevas = connection.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] - ventas_antes
+    connection.close()
+
+    print(f"{terminals} terminales x {sales} ventas en {elapsed:.2f} s "
+          f"({len(latencies) / elapsed:.0f} ventas/s)")
+    print(f"Latencia p50 {latencies[len(latencies) // 2]:.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms")
+    print(f"Ventas registradas: {ventas_nuevas}, sin stock: {stock_errors}, errores: {len(other_errors)}")
+    for error in other_errors[:10]:
+        print(f"  {error}")
+    return 1 if other_errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local de Mr Store para varias cajas")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="atender a las terminales")
+    serve_parser.add_argument("--db", default=None, help="base de datos (por defecto MRSTORE_DB o mr_store.db)")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--verbose", action="store_true", help="mostrar cada petición")
+
+    load_parser = commands.add_parser("loadtest", help="simular varias cajas en procesos separados")
+    load_parser.add_argument("--db", required=True, help="base de datos (usar una copia: se registran ventas)")
+    load_parser.add_argument("--url", help="servidor ya en marcha; si se omite se inicia uno propio")
+    load_parser.add_argument("--terminals", type=int, default=24)
+    load_parser.add_argument("--sales", type=int, default=50, help="ventas por terminal")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.db, args.host, args.port, args.verbose)
+        return 0
+    return loadtest(args.db, args.url, args.terminals, args.sales)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,63 @@
+# Pruebas de la capa de datos sin interfaz (store_db, store_cli, sql_trace) contra bases
+# temporales. Se corren desde la raíz del repositorio: python -m pytest -q
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MRSTORE_SLOW_LOG", "")  # Sin registro de consultas lentas
+
+import store_db  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "tienda.db")
+
+
+@pytest.fixture
+def connection(db_path):
+    connection = store_db.connect(db_path)
+    store_db.create_tables(connection)
+    yield connection
+    connection.close()
+
+
+def add_product(connection, nombre, stock=100, precio=10.0, proveedor_id=None, unidad="pieza"):
+    return store_db.insert_product(connection, nombre, "Marca", precio, unidad, stock, "", proveedor_id)
+
+
+def insert_sale(connection, fecha, items):
+    # Registrar una venta con fecha fija; items: [(producto_id, cantidad)] al precio del producto
+    lineas = []
+    for product_id, cantidad in items:
+        nombre, precio, unidad = connection.execute(
+            "SELECT nombre, precio, unidad FROM productos WHERE id = ?", (product_id,)
+        ).fetchone()
+        lineas.append((product_id, nombre, unidad, cantidad, precio, precio * cantidad))
+    total = sum(linea[5] for linea in lineas)
+    detalle = "; ".join(f"{nombre}: {cantidad} {unidad} - ${subtotal:.2f}"
+                        for _, nombre, unidad, cantidad, _, subtotal in lineas)
+    venta_id = connection.execute(
+        "INSERT INTO ventas (producto, cantidad, total, fecha) VALUES (?, ?, ?, ?)",
+        (detalle, sum(linea[3] for linea in lineas), total, fecha)
+    ).lastrowid
+    connection.executemany(
+        "INSERT INTO venta_items (venta_id, producto_id, nombre, unidad, cantidad, precio_unitario, subtotal) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(venta_id, *linea) for linea in lineas]
+    )
+    store_db.update_rollups(connection, fecha, 1, total, len(lineas))
+    connection.commit()
+    return venta_id
+
+
+def rollups(connection):
+    # Resúmenes diarios y mensuales con ventas, con los ingresos redondeados a centavos
+    return [
+        [(key, num_ventas, round(ingresos, 2), num_articulos)
+         for key, num_ventas, ingresos, num_articulos in connection.execute(
+             f"SELECT * FROM {table} WHERE num_ventas <> 0 ORDER BY 1")]
+        for table in ("ventas_diarias", "ventas_mensuales")
+    ]
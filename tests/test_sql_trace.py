@@ -0,0 +1,38 @@
+import sql_trace
+import store_db
+from conftest import add_product, insert_sale
+
+
+def test_full_scans_names_tables_not_aliases():
+    assert sql_trace.full_scans(["SCAN productos"]) == ["productos"]
+    assert sql_trace.full_scans(["SCAN p", "USE TEMP B-TREE FOR ORDER BY"], "SELECT * FROM productos p") == ["productos"]
+    assert sql_trace.full_scans(["SCAN TABLE productos AS p"]) == ["productos"]
+    assert sql_trace.full_scans(["SCAN main.ventas"]) == ["main.ventas"]
+
+
+def test_full_scans_ignores_index_and_virtual_scans():
+    assert sql_trace.full_scans([
+        "SEARCH v USING INDEX idx_ventas_fecha (fecha>?)",
+        "SCAN venta_items USING COVERING INDEX idx_venta_items_producto",
+        "SCAN productos_fts VIRTUAL TABLE INDEX 0:M3",
+        "SCAN CONSTANT ROW",
+        "CO-ROUTINE (subquery-1)",
+        "SCAN (subquery-1)",
+        "MATERIALIZE t",
+        "SCAN t",
+    ]) == []
+
+
+def test_full_scans_of_history_views(connection):
+    product_id = add_product(connection, "Leche")
+    insert_sale(connection, "2024-01-10 10:00:00", [(product_id, 1)])
+    insert_sale(connection, "2024-03-10 10:00:00", [(product_id, 1)])
+    store_db.archive_sales(connection, "2024-02")
+
+    for sql, expected in (
+        ("SELECT * FROM ventas_historial WHERE total > 5", ["main.ventas", "archivo_2024.ventas"]),
+        ("SELECT COUNT(*) FROM venta_items_historial WHERE cantidad > 1",
+         ["main.venta_items", "archivo_2024.venta_items"]),
+    ):
+        plan = sql_trace.explain(connection, sql)
+        assert sql_trace.full_scans(plan, sql_trace.statement_text(connection, sql)) == expected
@@ -0,0 +1,42 @@
+import os
+
+import store_cli
+import store_db
+from conftest import add_product, insert_sale
+
+
+def test_exportar_todo_gz_names_one_file_per_table(connection, db_path, tmp_path):
+    insert_sale(connection, "2024-01-10 10:00:00", [(add_product(connection, "Leche"), 1)])
+
+    assert store_cli.main(["--db", db_path, "exportar", "todo", "--output", str(tmp_path / "respaldo.gz")]) == 0
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("respaldo")) == [
+        "respaldo_productos.csv.gz", "respaldo_proveedores.csv.gz", "respaldo_ventas.csv.gz"]
+
+
+def test_commands_create_a_missing_database(tmp_path, capsys):
+    db_path = str(tmp_path / "nueva.db")
+
+    assert store_cli.main(["--db", db_path, "corte"]) == 0
+    assert "0 ventas" in capsys.readouterr().out
+    connection = store_db.connect_readonly(db_path)
+    try:
+        assert store_db.schema_version(connection) == store_db.SCHEMA_VERSION
+    finally:
+        connection.close()
+
+
+def test_demanda_groups_providers_with_the_same_name(connection, db_path, capsys):
+    uno = store_db.insert_provider(connection, "Lácteos", "1")
+    dos = store_db.insert_provider(connection, "Lácteos", "2")
+    leche = add_product(connection, "Leche", stock=1, proveedor_id=uno)
+    yogur = add_product(connection, "Yogur", stock=1, proveedor_id=dos)
+    today = store_db.datetime.date.today()
+    for days_ago in range(1, 8):
+        fecha = (today - store_db.datetime.timedelta(days=days_ago)).strftime("%Y-%m-%d 10:00:00")
+        insert_sale(connection, fecha, [(leche, 3), (yogur, 3)])
+    connection.close()
+
+    assert store_cli.main(["--db", db_path, "demanda"]) == 0
+    output = capsys.readouterr().out.splitlines()
+    assert output.count("Lácteos") == 2
+    assert [line.split(":")[0].strip() for line in output if line.startswith("  ")] == ["Leche", "Yogur"]
@@ -0,0 +1,402 @@
+import io
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import store_db
+from conftest import add_product, insert_sale, rollups
+
+
+# ----------------------------------------------------------------------------
+# Capa de datos sin interfaz
+# ----------------------------------------------------------------------------
+
+def test_store_db_imports_without_tkinter_or_pil():
+    code = "import sys, store_db; print('tkinter' in sys.modules or 'PIL' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=store_db.os.path.dirname(store_db.__file__))
+    assert result.stdout.strip() == "False"
+
+
+def test_products_and_providers(connection):
+    lacteos = store_db.insert_provider(connection, "Lácteos del Norte", "555-0101")
+    leche = add_product(connection, "Leche Entera", stock=20, precio=15.0, proveedor_id=lacteos)
+    add_product(connection, "Pan Blanco", stock=5)
+
+    assert store_db.count_products(connection) == 2
+    assert store_db.list_providers_with_counts(connection) == [(lacteos, "Lácteos del Norte", "555-0101", 1)]
+    assert [row[1] for row in store_db.search_products(connection, "entera")] == ["Leche Entera"]
+    assert [row[1] for row in store_db.search_products(connection, "norte")] == ["Leche Entera"]
+    assert [row[1] for row in store_db.search_products(connection, "")] == ["Leche Entera", "Pan Blanco"]
+
+    store_db.update_record(connection, "productos", leche, {"precio": 16.5, "stock": 18})
+    record = store_db.get_record(connection, "productos", leche)
+    assert (record["precio"], record["stock"]) == (16.5, 18)
+    assert "miniatura" not in record
+
+    store_db.delete_record(connection, "productos", leche)
+    assert store_db.get_record(connection, "productos", leche) is None
+    assert [row[1] for row in store_db.search_products(connection, "leche")] == []
+
+
+def test_cortes_use_day_totals(connection):
+    product_id = add_product(connection, "Leche", precio=12.5)
+    insert_sale(connection, "2024-05-01 09:00:00", [(product_id, 2)])
+    insert_sale(connection, "2024-05-01 23:59:59", [(product_id, 1)])
+    insert_sale(connection, "2024-05-02 00:00:00", [(product_id, 4)])
+
+    assert store_db.save_corte(connection, "2024-05-01") == (2, 37.5)
+    assert store_db.get_corte(connection, "2024-05-01")[1:] == ("2024-05-01", 2, 37.5)
+    assert list(store_db.get_daily_totals(connection, "2024-05-01", "2024-05-02")) == [
+        ("2024-05-02", 1, 50.0), ("2024-05-01", 2, 37.5)]
+
+    report = io.StringIO()
+    assert store_db.write_cortes_report(connection, report, "2024-05-02", "2024-05-02") == 1
+    assert "Fecha: 2024-05-02" in report.getvalue()
+    assert "Fecha: 2024-05-01" not in report.getvalue()
+
+
+# ----------------------------------------------------------------------------
+# Ventas
+# ----------------------------------------------------------------------------
+
+def sale_item(product_id, cantidad, nombre="Producto", precio=10.0):
+    return {"id": product_id, "nombre": nombre, "precio": precio, "cantidad": cantidad, "unidad": "pieza"}
+
+
+def test_save_sale_discounts_stock_and_updates_rollups(connection):
+    product_id = add_product(connection, "Leche", stock=5)
+    total, vendidos = store_db.save_sale(connection, [sale_item(product_id, 2, "Leche", 12.5)])
+
+    assert total == 25.0
+    assert vendidos == {product_id: 2.0}
+    assert connection.execute("SELECT stock FROM productos WHERE id = ?", (product_id,)).fetchone()[0] == 3
+    assert store_db.get_sales_summary(connection) == (1, 25.0)
+
+
+def test_save_sale_oversell_rolls_back_everything(connection):
+    leche = add_product(connection, "Leche", stock=5)
+    pan = add_product(connection, "Pan", stock=1)
+
+    with pytest.raises(store_db.StockInsuficienteError, match="Pan"):
+        store_db.save_sale(connection, [sale_item(leche, 2), sale_item(pan, 3)])
+
+    assert connection.execute("SELECT stock FROM productos ORDER BY id").fetchall() == [(5,), (1,)]
+    assert connection.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 0
+    assert connection.execute("SELECT COUNT(*) FROM venta_items").fetchone()[0] == 0
+    assert store_db.get_sales_summary(connection) == (0, 0)
+
+
+@pytest.mark.parametrize("cantidad", [0, -5, -0.5, float("nan"), float("inf"), "abc", None, True])
+def test_save_sale_rejects_invalid_quantities(connection, cantidad):
+    product_id = add_product(connection, "Leche", stock=0)
+
+    with pytest.raises(ValueError):
+        store_db.save_sale(connection, [sale_item(product_id, cantidad)])
+
+    assert connection.execute("SELECT stock FROM productos").fetchone()[0] == 0
+    assert connection.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 0
+
+
+def test_save_sale_rejects_empty_sale(connection):
+    with pytest.raises(ValueError):
+        store_db.save_sale(connection, [])
+
+    assert not connection.in_transaction
+    assert connection.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 0
+    assert store_db.get_sales_summary(connection) == (0, 0)
+
+
+def test_save_sale_accepts_fractional_quantities(connection):
+    product_id = add_product(connection, "Queso", stock=10, unidad="kg")
+    total, _ = store_db.save_sale(connection, [sale_item(product_id, 0.25, "Queso", 200.0)])
+    assert total == 50.0
+
+
+# ----------------------------------------------------------------------------
+# Resúmenes al borrar y editar ventas
+# ----------------------------------------------------------------------------
+
+def sales_with_archive(connection):
+    # Ventas en dos años archivables y en el mes actual; dos ventas comparten fecha
+    leche = add_product(connection, "Leche")
+    pan = add_product(connection, "Pan")
+    fechas = ["2023-11-05 09:00:00", "2023-12-24 18:30:00", "2024-01-10 10:00:00",
+              "2024-01-10 10:00:00", "2024-02-01 12:00:00", "2024-03-15 08:45:00"]
+    for i, fecha in enumerate(fechas):
+        insert_sale(connection, fecha, [(leche, i + 1), (pan, 1)])
+    recientes = [insert_sale(connection, store_db.datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                             [(pan, 2)]) for _ in range(2)]
+    return leche, pan, recientes
+
+
+def history_report(connection):
+    # Reporte de cortes y exportación de ventas, que no deben cambiar al archivar
+    report = io.StringIO()
+    store_db.write_cortes_report(connection, report)
+    export = io.StringIO()
+    store_db.export_rows(connection, export, *store_db.sales_export())
+    return report.getvalue(), export.getvalue()
+
+
+def test_delete_and_update_keep_rollups_consistent(connection):
+    leche, pan, recientes = sales_with_archive(connection)
+    store_db.delete_record(connection, "ventas", recientes[0])
+    store_db.update_record(connection, "ventas", recientes[1], {"total": 99.5, "fecha": "2024-03-16 10:00:00"})
+
+    after_changes = rollups(connection)
+    store_db.rebuild_rollups(connection)
+    assert after_changes == rollups(connection)
+
+
+def test_delete_and_update_archived_sale(connection):
+    sales_with_archive(connection)
+    store_db.archive_sales(connection, "2024-02")
+    archived_id = connection.execute("SELECT id FROM archivo_2024.ventas ORDER BY id LIMIT 1").fetchone()[0]
+
+    assert store_db.sale_schema(connection, archived_id) == "archivo_2024"
+    store_db.update_record(connection, "ventas", archived_id, {"total": 1.25})
+    assert store_db.get_sale(connection, archived_id)[1] == 1.25
+
+    store_db.delete_record(connection, "ventas", archived_id)
+    assert store_db.get_sale(connection, archived_id) is None
+    assert store_db.get_sale_items(connection, archived_id) == []
+    assert connection.execute("SELECT num_ventas FROM archivos WHERE anio = '2024'").fetchone()[0] == \
+        connection.execute("SELECT COUNT(*) FROM archivo_2024.ventas").fetchone()[0]
+
+    after_changes = rollups(connection)
+    store_db.rebuild_rollups(connection)
+    assert after_changes == rollups(connection)
+
+
+def test_delete_or_update_missing_sale_raises(connection):
+    with pytest.raises(ValueError):
+        store_db.delete_record(connection, "ventas", 12345)
+    with pytest.raises(ValueError):
+        store_db.update_record(connection, "ventas", 12345, {"total": 1.0})
+
+
+# ----------------------------------------------------------------------------
+# Historial y archivo de meses cerrados
+# ----------------------------------------------------------------------------
+
+def all_pages(connection, limit):
+    rows, after = [], None
+    while True:
+        page = store_db.fetch_sales_page(connection, after=after, limit=limit)
+        rows.extend(page)
+        if len(page) < limit:
+            return rows
+        after = (page[-1][6], page[-1][0])
+
+
+def test_fetch_sales_page_pages_across_archives(connection):
+    sales_with_archive(connection)
+    expected = connection.execute("SELECT id, fecha FROM ventas ORDER BY fecha DESC, id DESC").fetchall()
+
+    store_db.archive_sales(connection, "2024-02")
+    assert store_db.attached_archives(connection) == ["archivo_2024", "archivo_2023"]
+
+    for limit in (1, 2, 3, 100):
+        rows = all_pages(connection, limit)
+        assert [(row[0], row[6]) for row in rows] == expected
+
+
+def test_fetch_sales_page_filters_by_date_across_archives(connection):
+    sales_with_archive(connection)
+    store_db.archive_sales(connection, "2024-02")
+
+    rows = store_db.fetch_sales_page(connection, "2023-12-01", "2024-01-31")
+    assert [row[1] for row in rows] == ["2024-01-10", "2024-01-10", "2023-12-24"]
+
+
+def test_archive_sales_preserves_counts_and_reports(connection, db_path):
+    sales_with_archive(connection)
+    ventas = connection.execute("SELECT COUNT(*) FROM ventas").fetchone()[0]
+    items = connection.execute("SELECT COUNT(*) FROM venta_items").fetchone()[0]
+    before = history_report(connection)
+    rollups_before = rollups(connection)
+
+    moved = store_db.archive_sales(connection, "2024-02")
+
+    assert moved == 5
+    assert connection.execute("SELECT COUNT(*) FROM main.ventas").fetchone()[0] == ventas - moved
+    assert connection.execute("SELECT COUNT(*) FROM ventas_historial").fetchone()[0] == ventas
+    assert connection.execute("SELECT COUNT(*) FROM venta_items_historial").fetchone()[0] == items
+    assert connection.execute("SELECT anio, desde, hasta, num_ventas FROM archivos ORDER BY anio").fetchall() == [
+        ("2023", "2023-11", "2023-12", 2), ("2024", "2024-01", "2024-02", 3)]
+    assert history_report(connection) == before
+    assert rollups(connection) == rollups_before
+
+    # Archivar otra vez no duplica, y una conexión nueva (de solo lectura) ve lo mismo
+    assert store_db.archive_sales(connection, "2024-02") == 0
+    reader = store_db.connect_readonly(db_path)
+    try:
+        assert history_report(reader) == before
+    finally:
+        reader.close()
+
+
+def test_archive_sales_rejects_open_month(connection):
+    with pytest.raises(ValueError):
+        store_db.archive_sales(connection, store_db.datetime.date.today().strftime("%Y-%m"))
+
+
+def test_open_connections_see_sales_archived_by_another(connection, db_path):
+    # La aplicación tiene abiertas su conexión de escritura y sus lectores mientras store_cli archiva
+    sales_with_archive(connection)
+    before = history_report(connection)
+    pool = store_db.ConnectionPool(db_path)
+    with pool.reader() as reader:
+        assert history_report(reader) == before
+
+    other = store_db.connect(db_path)
+    try:
+        assert store_db.archive_sales(other, "2024-02") == 5
+        archived_id = other.execute("SELECT id FROM archivo_2023.ventas ORDER BY id LIMIT 1").fetchone()[0]
+    finally:
+        other.close()
+
+    try:
+        with pool.reader() as reader:
+            assert store_db.attached_archives(reader) == ["archivo_2024", "archivo_2023"]
+            assert history_report(reader) == before
+        assert store_db.sale_schema(connection, archived_id) == "archivo_2023"
+        assert store_db.get_sale(connection, archived_id) is not None
+    finally:
+        pool.close()
+
+
+# ----------------------------------------------------------------------------
+# Migraciones
+# ----------------------------------------------------------------------------
+
+def test_baseline_database_migrates_to_current_schema(db_path):
+    # Esquema de la primera versión: sin proveedor_id, venta_items, resúmenes ni user_version
+    baseline = sqlite3.connect(db_path)
+    baseline.executescript("""
+        CREATE TABLE productos (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT, marca TEXT,
+            precio REAL, unidad TEXT, stock INTEGER, imagen TEXT);
+        CREATE TABLE proveedores (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT, contacto TEXT);
+        CREATE TABLE ventas (id INTEGER PRIMARY KEY AUTOINCREMENT, producto TEXT, cantidad REAL,
+            total REAL, fecha TEXT);
+        CREATE TABLE cortes_de_caja (id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TEXT,
+            num_ventas INTEGER, total_ingresos REAL);
+        INSERT INTO productos (nombre, marca, precio, unidad, stock, imagen)
+            VALUES ('Leche Entera', 'Lala', 15.0, 'Piezas', 20, '');
+        INSERT INTO ventas (producto, cantidad, total, fecha)
+            VALUES ('Leche Entera: 2.0 Piezas - $30.00', 2.0, 30.0, '2024-05-01 10:00:00');
+    """)
+    baseline.close()
+
+    connection = store_db.connect(db_path)
+    try:
+        store_db.create_tables(connection)
+        assert store_db.schema_version(connection) == store_db.SCHEMA_VERSION
+        for column in ("proveedor_id", "miniatura", "codigo", "venta_diaria", "punto_reorden"):
+            assert store_db.column_exists(connection, "productos", column)
+        assert store_db.get_sale_items(connection, 1) == [("Leche Entera", 2.0, "Piezas", 15.0, 30.0)]
+        assert store_db.get_day_totals(connection, "2024-05-01") == (1, 30.0)
+        assert [row[1] for row in store_db.search_products(connection, "lech")] == ["Leche Entera"]
+
+        # Con el esquema al día no se vuelve a migrar
+        assert store_db.create_tables(connection) == store_db.table_exists(connection, "productos_fts")
+        assert connection.execute("SELECT COUNT(*) FROM venta_items").fetchone()[0] == 1
+    finally:
+        connection.close()
+
+
+def test_search_index_is_built_when_missing_at_current_version(connection):
+    # Base migrada con un SQLite sin FTS5: user_version al día pero sin productos_fts ni triggers
+    add_product(connection, "Leche Entera")
+    for (trigger,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%fts%'").fetchall():
+        connection.execute(f"DROP TRIGGER {trigger}")
+    connection.execute("DROP TABLE productos_fts")
+    connection.commit()
+
+    assert store_db.create_tables(connection)
+    assert store_db.schema_version(connection) == store_db.SCHEMA_VERSION
+    assert [row[1] for row in store_db.search_products(connection, "entera")] == ["Leche Entera"]
+    add_product(connection, "Pan Integral")
+    assert [row[1] for row in store_db.search_products(connection, "integral")] == ["Pan Integral"]
+
+
+
+# ----------------------------------------------------------------------------
+# Demanda y puntos de reorden
+# ----------------------------------------------------------------------------
+
+def test_update_demand_and_low_stock(connection):
+    lacteos = store_db.insert_provider(connection, "Lácteos", "1")
+    otro_lacteos = store_db.insert_provider(connection, "Lácteos", "2")  # Mismo nombre, otro proveedor
+    leche = add_product(connection, "Leche", stock=3, proveedor_id=lacteos)
+    yogur = add_product(connection, "Yogur", stock=0, proveedor_id=otro_lacteos)
+    pan = add_product(connection, "Pan", stock=500, proveedor_id=lacteos)
+    sin_ventas = add_product(connection, "Sal", stock=0)
+
+    today = "2024-06-29"
+    for day in range(1, 29):  # Cuatro semanas con la misma venta diaria
+        insert_sale(connection, f"2024-06-{day:02d} 10:00:00", [(leche, 2), (yogur, 1), (pan, 1)])
+    insert_sale(connection, f"{today} 09:00:00", [(leche, 50)])  # Hoy todavía no cuenta
+
+    assert store_db.update_demand(connection, today) == 3
+    demand = dict((row[0], row[1:]) for row in connection.execute(
+        "SELECT id, venta_diaria, punto_reorden FROM productos"))
+    assert demand[leche] == (2.0, 14.0)  # Venta constante: sin colchón por variación
+    assert demand[yogur] == (1.0, 7.0)
+    assert demand[sin_ventas] == (0.0, 0.0)
+
+    low = store_db.low_stock(connection)
+    assert [(row[0], row[2]) for row in low] == [(lacteos, leche), (otro_lacteos, yogur)]
+    proveedor_id, proveedor, _, nombre, stock, punto, dias, pedido = low[0]
+    assert (proveedor, nombre, stock, punto, dias) == ("Lácteos", "Leche", 3, 14.0, 1.5)
+    assert pedido == 14.0 + 2.0 * store_db.ORDER_DAYS - 3
+
+    # El panel lee los productos agotándose con el índice parcial
+    plan = " ".join(row[3] for row in connection.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM productos WHERE punto_reorden > 0 AND stock - punto_reorden <= 0"))
+    assert "idx_productos_agotandose" in plan
+
+    # Sin ventas en la ventana la demanda vuelve a 0
+    assert store_db.update_demand(connection, "2025-06-01") == 0
+    assert store_db.low_stock(connection) == []
+
+
+# ----------------------------------------------------------------------------
+# Exportaciones
+# ----------------------------------------------------------------------------
+
+def test_export_rows_reports_rows_written(connection):
+    product_id = add_product(connection, "Leche")
+    for day in range(1, 8):
+        insert_sale(connection, f"2024-05-{day:02d} 10:00:00", [(product_id, 1)])
+
+    progress = []
+    f = io.StringIO()
+    headers, query, params = store_db.sales_export("2024-05-02", "2024-05-06")
+    assert store_db.export_rows(connection, f, headers, query, params, progress.append, chunk_size=2) == 5
+    assert progress == [2, 2, 1]
+    assert f.getvalue().count("\n") == 6
+    assert store_db.export_size(connection, "ventas", "2024-05-02", "2024-05-06") == 5
+    assert store_db.export_size(connection, "productos") == 1
+
+
+def test_export_rows_stops_when_cancelled(connection):
+    for i in range(10):
+        add_product(connection, f"Producto {i}")
+
+    progress = []
+    f = io.StringIO()
+    written = store_db.export_rows(connection, f, *store_db.inventory_export(), progress.append,
+                                   lambda: sum(progress) >= 4, chunk_size=4)
+    assert written == 4
+
+
+def test_full_export_base():
+    assert store_db.full_export_base("respaldo.gz") == ("respaldo", ".csv.gz")
+    assert store_db.full_export_base("respaldo.csv.gz") == ("respaldo", ".csv.gz")
+    assert store_db.full_export_base("respaldo.csv") == ("respaldo", ".csv")
+    assert store_db.full_export_base("copias.v2/respaldo") == ("copias.v2/respaldo", ".csv")
@@ -0,0 +1,100 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import store_db
+import store_server
+from conftest import add_product
+
+
+@pytest.fixture
+def server(connection, db_path):
+    server = store_server.StoreServer(("127.0.0.1", 0), db_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = store_server.StoreClient(f"127.0.0.1:{server.server_address[1]}")
+    yield client
+    client.close()
+
+
+def sale_item(product_id, cantidad):
+    return {"id": product_id, "nombre": "Producto", "precio": 10.0, "cantidad": cantidad, "unidad": "pieza"}
+
+
+def test_queued_writes_share_a_transaction_and_fail_alone(connection, server):
+    leche = add_product(connection, "Leche", stock=5)
+    pan = add_product(connection, "Pan", stock=1)
+
+    # Mientras el hilo de escritura está ocupado, las ventas se acumulan en la cola y se
+    # confirman en un mismo lote; la que no tiene stock se deshace sin afectar a las demás
+    gate = threading.Event()
+    server.writes.put((lambda _: gate.wait(5), Future()))
+    futures = []
+    for items in ([sale_item(leche, 2)], [sale_item(leche, 1), sale_item(pan, 3)], [sale_item(pan, 1)]):
+        future = Future()
+        server.writes.put((lambda connection, items=items: store_db.save_sale(connection, items, commit=False),
+                           future))
+        futures.append(future)
+    gate.set()
+
+    assert futures[0].result(5) == (20.0, {leche: 2.0})
+    with pytest.raises(store_db.StockInsuficienteError, match="Pan"):
+        futures[1].result(5)
+    assert futures[2].result(5) == (10.0, {pan: 1.0})
+
+    assert connection.execute("SELECT stock FROM productos ORDER BY id").fetchall() == [(3,), (0,)]
+    assert store_db.get_sales_summary(connection) == (2, 30.0)
+
+
+def test_concurrent_terminals(connection, server):
+    product_id = add_product(connection, "Leche", stock=40)
+    url = f"127.0.0.1:{server.server_address[1]}"
+    errors = []
+
+    def terminal():
+        client = store_server.StoreClient(url)
+        for _ in range(5):
+            try:
+                client.save_sale([sale_item(product_id, 1)])
+            except store_db.StockInsuficienteError:
+                errors.append("stock")
+        client.close()
+
+    threads = [threading.Thread(target=terminal) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["stock"] * 10
+    assert connection.execute("SELECT stock FROM productos").fetchone()[0] == 0
+    assert store_db.get_sales_summary(connection) == (40, 400.0)
+
+
+def test_invalid_sales_and_cortes(connection, client):
+    with pytest.raises(store_server.StoreServerError, match="no tiene artículos"):
+        client.save_sale([])
+
+    product_id = add_product(connection, "Leche", stock=5)
+    client.save_sale([sale_item(product_id, 2)])
+    today = store_db.datetime.date.today().strftime("%Y-%m-%d")
+    assert client.save_corte(today) == (1, 20.0)
+    assert store_db.get_corte(connection, today)[2:] == (1, 20.0)
+    with pytest.raises(store_server.StoreServerError):
+        client.save_corte("hoy")
+
+
+def test_terminal_pool_does_not_write(connection, db_path):
+    pool = store_db.ConnectionPool(db_path, readonly=True)
+    try:
+        with pytest.raises(store_db.sqlite3.OperationalError, match="readonly"):
+            add_product(pool.writer, "Leche")
+    finally:
+        pool.close()